@@ -0,0 +1,318 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, Optional
+from myproject.app.core.config import (
+    ADMISSION_MAX_PER_CONNECTION,
+    ADMISSION_MAX_PER_USER,
+    ADMISSION_MAX_QUEUED,
+    ADMISSION_MAX_RUNNING,
+    ADMISSION_QUEUE_PER_USER,
+    ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    ADMISSION_USER_WEIGHTS,
+)
+from myproject.app.metrics import ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS, register_collector
+
+# How often a blocking waiter checks whether it should stop waiting
+_STOP_CHECK_SECONDS = 0.25
+
+
+class AdmissionRejected(Exception):
+    """Raised when a query can't be queued, or waited too long for a slot."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class Ticket:
+    """One admitted (or waiting) query; hand it back with `release` when done."""
+    __slots__ = ("owner", "connection", "enqueued_at", "future", "event", "granted", "released")
+
+    def __init__(self, owner: str, connection: Hashable):
+        self.owner = owner
+        self.connection = connection
+        self.enqueued_at = time.monotonic()
+        # What a queued waiter blocks on: a future on the event loop, or an event in a worker thread
+        self.future: Optional[asyncio.Future] = None
+        self.event: Optional[threading.Event] = None
+        self.granted = False
+        self.released = False
+
+
+class QueryScheduler:
+    """
+    Admission control in front of query execution.
+
+    A query runs once the process, its user and its connection are all
+    under their running limits. Otherwise it waits in its user's FIFO
+    queue. When a slot frees up, users with waiting queries are served
+    weighted round-robin: each user gets `weights[user]` (default 1)
+    dispatches per turn, so one user's backlog can't starve the others.
+    Within a user's queue, the first query whose connection has room runs.
+
+    Queries are rejected when the user's queue or the whole queue is
+    full, or after waiting `queue_timeout` seconds. `release` may be
+    called from any thread; a stream gives its slot back from the
+    executor thread that finishes it. Background work running on a
+    worker thread, like query jobs, uses `acquire_blocking`.
+    """
+
+    def __init__(
+        self,
+        max_running: int = ADMISSION_MAX_RUNNING,
+        max_per_user: int = ADMISSION_MAX_PER_USER,
+        max_per_connection: int = ADMISSION_MAX_PER_CONNECTION,
+        queue_per_user: int = ADMISSION_QUEUE_PER_USER,
+        max_queued: int = ADMISSION_MAX_QUEUED,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        weights: Optional[Dict[str, int]] = None
+    ):
+        self.max_running = max_running
+        self.max_per_user = max_per_user
+        self.max_per_connection = max_per_connection
+        self.queue_per_user = queue_per_user
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.weights = ADMISSION_USER_WEIGHTS if weights is None else weights
+        self._running = 0
+        self._running_by_user: Dict[str, int] = {}
+        self._running_by_connection: Dict[Hashable, int] = {}
+        self._queues: Dict[str, Deque[Ticket]] = {}
+        # Users with waiting queries, in dispatch order, and what is left of their turn
+        self._rotation: Deque[str] = deque()
+        self._credits: Dict[str, int] = {}
+        self._queued = 0
+        self._admitted = 0
+        self._lock = threading.Lock()
+
+    async def acquire(self, owner: str, connection: Hashable) -> Ticket:
+        """Wait for a slot for one query of `owner` on `connection` (a target key)."""
+        ticket = Ticket(owner, connection)
+        with self._lock:
+            if self._admit_now(ticket):
+                return ticket
+            self._check_queue_room(owner)
+            ticket.future = asyncio.get_running_loop().create_future()
+            self._enqueue(ticket)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if not ticket.granted:
+                    self._remove_waiter(ticket)
+                    ADMISSION_REJECTED.inc(1, "timeout")
+                    raise AdmissionRejected(
+                        f"Query waited more than {self.queue_timeout} seconds for a slot", "timeout"
+                    )
+        except asyncio.CancelledError:
+            with self._lock:
+                if not ticket.granted:
+                    self._remove_waiter(ticket)
+            if ticket.granted:
+                self.release(ticket)
+            raise
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - ticket.enqueued_at)
+        return ticket
+
+    def acquire_blocking(
+        self,
+        owner: str,
+        connection: Hashable,
+        timeout: Optional[float] = None,
+        stop: Optional[Callable[[], bool]] = None
+    ) -> Optional[Ticket]:
+        """
+        Like `acquire`, for a worker thread (blocking).
+
+        Waits up to `timeout` seconds, or as long as it takes when None.
+        Returns None, without a slot, once `stop()` is true while waiting.
+        """
+        ticket = Ticket(owner, connection)
+        with self._lock:
+            if self._admit_now(ticket):
+                return ticket
+            self._check_queue_room(owner)
+            ticket.event = threading.Event()
+            self._enqueue(ticket)
+
+        deadline = ticket.enqueued_at + timeout if timeout is not None else None
+        while not ticket.event.wait(_STOP_CHECK_SECONDS):
+            timed_out = deadline is not None and time.monotonic() >= deadline
+            if not timed_out and not (stop is not None and stop()):
+                continue
+            with self._lock:
+                if ticket.granted:
+                    break
+                self._remove_waiter(ticket)
+            if not timed_out:
+                return None
+            ADMISSION_REJECTED.inc(1, "timeout")
+            raise AdmissionRejected(f"Query waited more than {timeout} seconds for a slot", "timeout")
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - ticket.enqueued_at)
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        """Give a slot back and start the next waiting queries; safe from any thread, idempotent."""
+        with self._lock:
+            if ticket.released or not ticket.granted:
+                return
+            ticket.released = True
+            self._running -= 1
+            _decrement(self._running_by_user, ticket.owner)
+            _decrement(self._running_by_connection, ticket.connection)
+            self._dispatch()
+
+    def stats(self, owner: Optional[str] = None) -> dict:
+        """Totals, plus the running and queued queries of `owner` when given."""
+        now = time.monotonic()
+        with self._lock:
+            oldest = min(
+                (queue[0].enqueued_at for queue in self._queues.values() if queue), default=None
+            )
+            stats = {
+                "running": self._running,
+                "queued": self._queued,
+                "oldest_wait_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+                "admitted": self._admitted,
+                "max_running": self.max_running,
+                "max_per_user": self.max_per_user,
+                "max_per_connection": self.max_per_connection,
+                "queue_per_user": self.queue_per_user,
+            }
+            if owner is not None:
+                stats["user"] = {
+                    "running": self._running_by_user.get(owner, 0),
+                    "queued": len(self._queues.get(owner, ())),
+                    "weight": self._weight(owner),
+                }
+        return stats
+
+    def _weight(self, owner: str) -> int:
+        return max(1, int(self.weights.get(owner, 1)))
+
+    def _can_run(self, ticket: Ticket) -> bool:
+        return (
+            self._running < self.max_running
+            and self._running_by_user.get(ticket.owner, 0) < self.max_per_user
+            and self._running_by_connection.get(ticket.connection, 0) < self.max_per_connection
+        )
+
+    def _admit_now(self, ticket: Ticket) -> bool:
+        """Run the ticket at once when nobody is waiting and it is under its limits (lock held)."""
+        if self._queued or not self._can_run(ticket):
+            return False
+        self._grant(ticket)
+        ADMISSION_WAIT_SECONDS.observe(0.0)
+        return True
+
+    def _check_queue_room(self, owner: str) -> None:
+        """Raise AdmissionRejected when the user's queue or the whole queue is full (lock held)."""
+        queue = self._queues.get(owner)
+        if queue is not None and len(queue) >= self.queue_per_user:
+            ADMISSION_REJECTED.inc(1, "user_queue_full")
+            raise AdmissionRejected(
+                f"Too many queries waiting: at most {self.queue_per_user} can be queued per user", "user_queue_full"
+            )
+        if self._queued >= self.max_queued:
+            ADMISSION_REJECTED.inc(1, "queue_full")
+            raise AdmissionRejected("The query queue is full", "queue_full")
+
+    def _enqueue(self, ticket: Ticket) -> None:
+        """Add a waiter to its user's queue (lock held)."""
+        queue = self._queues.get(ticket.owner)
+        if queue is None:
+            queue = self._queues[ticket.owner] = deque()
+            self._rotation.append(ticket.owner)
+        queue.append(ticket)
+        self._queued += 1
+        # Other waiters may be held back by their own limits while this one can run
+        self._dispatch()
+
+    def _grant(self, ticket: Ticket) -> None:
+        """Count a ticket as running and wake its waiter (lock held)."""
+        ticket.granted = True
+        self._running += 1
+        self._admitted += 1
+        self._running_by_user[ticket.owner] = self._running_by_user.get(ticket.owner, 0) + 1
+        self._running_by_connection[ticket.connection] = self._running_by_connection.get(ticket.connection, 0) + 1
+        if ticket.future is not None:
+            # release() can run on an executor thread, so resolve on the waiter's loop
+            ticket.future.get_loop().call_soon_threadsafe(_resolve, ticket.future)
+        elif ticket.event is not None:
+            ticket.event.set()
+
+    def _dispatch(self) -> None:
+        """Start waiting queries in weighted round-robin order of users (lock held)."""
+        passed = 0
+        while self._rotation and passed < len(self._rotation) and self._running < self.max_running:
+            owner = self._rotation[0]
+            queue = self._queues[owner]
+            ticket = None
+            if self._running_by_user.get(owner, 0) < self.max_per_user:
+                ticket = next(
+                    (waiting for waiting in queue
+                     if self._running_by_connection.get(waiting.connection, 0) < self.max_per_connection),
+                    None
+                )
+            if ticket is None:
+                # Nothing of this user can run now; their turn passes
+                self._rotation.rotate(-1)
+                passed += 1
+                continue
+            passed = 0
+            queue.remove(ticket)
+            self._queued -= 1
+            self._grant(ticket)
+            credits = self._credits.get(owner, self._weight(owner)) - 1
+            if not queue:
+                del self._queues[owner]
+                self._rotation.popleft()
+                self._credits.pop(owner, None)
+            elif credits <= 0:
+                self._rotation.rotate(-1)
+                self._credits[owner] = self._weight(owner)
+            else:
+                self._credits[owner] = credits
+
+    def _remove_waiter(self, ticket: Ticket) -> None:
+        """Take a waiter that gave up out of its queue (lock held)."""
+        queue = self._queues.get(ticket.owner)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        self._queued -= 1
+        if not queue:
+            del self._queues[ticket.owner]
+            self._rotation.remove(ticket.owner)
+            self._credits.pop(ticket.owner, None)
+
+
+def _decrement(counts: Dict, key) -> None:
+    remaining = counts[key] - 1
+    if remaining:
+        counts[key] = remaining
+    else:
+        del counts[key]
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+query_scheduler = QueryScheduler()
+
+
+def _admission_metrics():
+    with query_scheduler._lock:
+        running, queued = query_scheduler._running, query_scheduler._queued
+        waiting_users = len(query_scheduler._queues)
+    yield "query_admission_running", "gauge", "Queries admitted and running.", [({}, running)]
+    yield "query_admission_queued", "gauge", "Queries waiting for admission.", [({}, queued)]
+    yield "query_admission_waiting_users", "gauge", "Users with queries waiting for admission.", [({}, waiting_users)]
+
+
+register_collector(_admission_metrics)
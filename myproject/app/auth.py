@@ -3,31 +3,91 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 import bcrypt
+import secrets
+import time
+from sqlalchemy import event, update
 from sqlalchemy.orm import Session
-from myproject.app.core.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from myproject.app.models import User, get_db, init_db
+from myproject.app.auth_cache import RevocationList, TokenCache, UserCache, token_key
+from myproject.app.core.config import (
+    SECRET_KEY,
+    ALGORITHM,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    BCRYPT_ROUNDS,
+    BCRYPT_WORKERS,
+    BCRYPT_MAX_QUEUE,
+)
+from myproject.app.executors import BoundedExecutor, ExecutorSaturated
+from myproject.app.metrics import BCRYPT_QUEUE_WAIT
+from myproject.app.models import MetadataVersion, RevokedToken, SessionLocal, User, get_db
 from myproject.app.schemas.user_schema import UserCreate, UserResponse
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# bcrypt releases the GIL, so a thread pool sized to the cores hashes in parallel
+password_executor = BoundedExecutor("bcrypt", max_workers=BCRYPT_WORKERS, max_queue=BCRYPT_MAX_QUEUE)
 
-init_db()
+
+# metadata_versions row bumped by every logout
+_REVOCATIONS_VERSION = "revoked_tokens"
+
+
+def _bump_revocations_version(db: Session) -> None:
+    updated = db.execute(
+        update(MetadataVersion)
+        .where(MetadataVersion.name == _REVOCATIONS_VERSION)
+        .values(version=MetadataVersion.version + 1)
+    ).rowcount
+    if not updated:
+        db.add(MetadataVersion(name=_REVOCATIONS_VERSION, version=1))
+        db.flush()
+
+
+def _read_revocations_version() -> int:
+    db = SessionLocal()
+    try:
+        version = db.query(MetadataVersion.version).filter(MetadataVersion.name == _REVOCATIONS_VERSION).scalar()
+        return version or 0
+    finally:
+        db.close()
+
+
+def _load_revoked_tokens():
+    db = SessionLocal()
+    try:
+        rows = db.query(RevokedToken).filter(RevokedToken.expires_at > datetime.utcnow()).all()
+        return [
+            (bytes.fromhex(row.token_hash), (row.expires_at - datetime(1970, 1, 1)).total_seconds())
+            for row in rows
+        ]
+    finally:
+        db.close()
+
+
+token_cache = TokenCache()
+revoked_tokens = RevocationList(loader=_load_revoked_tokens, version_reader=_read_revocations_version)
+user_cache = UserCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.username)
 
 
 def hash_password(password: str) -> str:
-    """Hash a password using bcrypt."""
+    """Hash a password using bcrypt (blocking; ~100-300 ms of CPU)."""
     password_bytes = password.encode("utf-8")
     if len(password_bytes) > 72:
         raise ValueError("Password too long. Maximum is 72 bytes for bcrypt.")
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode("utf-8")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against a hash."""
+    """Verify a password against a hash (blocking)."""
     try:
         password_bytes = plain_password.encode("utf-8")
         hashed_bytes = hashed_password.encode("utf-8")
@@ -36,6 +96,32 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a hash was made with a different work factor than BCRYPT_ROUNDS."""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+async def run_password_work(fn, *args, force: bool = False):
+    """Run bcrypt work on the password pool; a full queue becomes a 503."""
+    submitted = time.perf_counter()
+
+    def timed():
+        BCRYPT_QUEUE_WAIT.observe(time.perf_counter() - submitted)
+        return fn(*args)
+
+    try:
+        return await password_executor.run(timed, force=force)
+    except ExecutorSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, please retry",
+            headers={"Retry-After": "1"}
+        )
+
+
 def get_user_by_username(db: Session, username: str):
     """Get a user by username from the database."""
     return db.query(User).filter(User.username == username).first()
@@ -49,30 +135,87 @@ def authenticate_user(db: Session, username: str, password: str) -> bool:
     return verify_password(password, user.hashed_password)
 
 
+async def authenticate_user_async(db: Session, username: str, password: str) -> bool:
+    """
+    Authenticate a user without blocking the event loop.
+    
+    Hashes made with an outdated work factor are replaced after a
+    successful check, so changing BCRYPT_ROUNDS takes effect on next login.
+    """
+    user = get_user_by_username(db, username)
+    if not user:
+        return False
+    hashed_password = user.hashed_password
+    # Return the pooled connection while bcrypt runs; holding it through the
+    # wait starves the pool under a login storm and blocks the event loop
+    db.rollback()
+    if not await run_password_work(verify_password, password, hashed_password):
+        return False
+    if needs_rehash(hashed_password):
+        # Already admitted for this login, so don't reject the rehash
+        user.hashed_password = await run_password_work(hash_password, password, force=True)
+        db.commit()
+    return True
+
+
 def create_access_token(data: dict):
     """Create a JWT access token."""
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    data.update({"exp": expire})
+    # jti keeps tokens issued in the same second distinct, so logout revokes only one
+    data.update({"exp": expire, "jti": secrets.token_hex(8)})
     return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
-    """Dependency to get the current authenticated user from JWT token."""
+    """
+    Dependency to get the current authenticated user from JWT token.
+    
+    Verified tokens are cached until their `exp`, so repeat requests skip
+    `jwt.decode`; revoked tokens are rejected with one set lookup.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    key = token_key(token)
+    if revoked_tokens.is_revoked(key):
+        raise credentials_exception
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached[0]
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
+        exp = payload.get("exp")
+        if exp is not None:
+            token_cache.put(key, username, float(exp))
         return username
     except JWTError:
         raise credentials_exception
 
 
+async def get_current_user_obj(
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> UserResponse:
+    """Dependency returning the current user's record, cached between requests."""
+    user = user_cache.get(current_user)
+    if user is None:
+        row = get_user_by_username(db, current_user)
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        user = UserResponse.model_validate(row)
+        user_cache.put(current_user, user)
+    return user
+
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """Register a new user."""
@@ -85,7 +228,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await run_password_work(hash_password, user_data.password)
     new_user = User(
         username=user_data.username,
         hashed_password=hashed_password
@@ -103,7 +246,7 @@ async def login(
     db: Session = Depends(get_db)
 ):
     """Login endpoint to authenticate and get JWT token."""
-    if not authenticate_user(db, form_data.username, form_data.password):
+    if not await authenticate_user_async(db, form_data.username, form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -120,7 +263,26 @@ async def verify_token(current_user: str = Depends(get_current_user)):
     return {"message": "Token is valid", "username": current_user}
 
 
+@router.post("/logout")
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Revoke the current access token until it expires."""
+    key = token_key(token)
+    cached = token_cache.get(key)
+    exp = cached[1] if cached is not None else jwt.get_unverified_claims(token)["exp"]
+    db.merge(RevokedToken(token_hash=key.hex(), expires_at=datetime.utcfromtimestamp(exp)))
+    db.query(RevokedToken).filter(RevokedToken.expires_at <= datetime.utcnow()).delete()
+    _bump_revocations_version(db)
+    db.commit()
+    revoked_tokens.revoke(key, exp)
+    token_cache.discard(key)
+    return {"message": "Logged out", "username": current_user}
+
+
 @router.get("/me")
-async def read_users_me(current_user: str = Depends(get_current_user)):
+async def read_users_me(current_user: UserResponse = Depends(get_current_user_obj)):
     """Get current authenticated user information."""
-    return {"username": current_user}
+    return {"username": current_user.username, "id": current_user.id, "created_at": current_user.created_at}
@@ -0,0 +1,169 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from myproject.app.core.config import (
+    REVOCATION_CHECK_SECONDS,
+    TOKEN_CACHE_MAX_ENTRIES,
+    USER_CACHE_MAX_ENTRIES,
+    USER_CACHE_TTL_SECONDS,
+)
+
+
+def token_key(token: str) -> bytes:
+    """Cache key for a bearer token; the raw token is never kept in memory longer than needed."""
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+class TokenCache:
+    """
+    Bounded LRU of already-verified tokens.
+
+    Entries map a token hash to its subject and `exp` claim (unix time) and
+    are dropped once `exp` passes, so an expired token always falls through
+    to a full `jwt.decode` and is rejected there.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> Optional[Tuple[str, float]]:
+        """Return `(username, exp)` for a verified, unexpired token, else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key: bytes, username: str, exp: float) -> None:
+        with self._lock:
+            self._entries[key] = (username, exp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: bytes) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+class RevocationList:
+    """
+    Set of revoked token hashes, each kept only until the token would expire.
+
+    Lookups are a single dict probe. Persisted revocations are loaded through
+    `loader`. Logouts bump a shared version counter; it is read through
+    `version_reader` at most every `check_interval` seconds and a change
+    reloads the list, so tokens revoked by other workers are rejected here
+    too.
+    """
+
+    def __init__(
+        self,
+        loader: Optional[Callable[[], Iterable[Tuple[bytes, float]]]] = None,
+        version_reader: Optional[Callable[[], int]] = None,
+        check_interval: float = REVOCATION_CHECK_SECONDS
+    ):
+        self._revoked: Dict[bytes, float] = {}
+        self._loader = loader
+        self._version_reader = version_reader
+        self.check_interval = check_interval
+        self._version: Optional[int] = None
+        self._loaded = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_revoked(self, key: bytes) -> bool:
+        if self._loader is not None:
+            self._ensure_fresh()
+        exp = self._revoked.get(key)
+        return exp is not None and exp > time.time()
+
+    def revoke(self, key: bytes, exp: float) -> None:
+        with self._lock:
+            now = time.time()
+            # Expired tokens are rejected by jwt.decode anyway; forget them
+            for stale in [k for k, e in self._revoked.items() if e <= now]:
+                del self._revoked[stale]
+            self._revoked[key] = exp
+
+    def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded and now - self._checked_at < self.check_interval:
+                return
+            # Other callers keep using the current set while this one checks
+            self._checked_at = now
+        version = self._version_reader() if self._version_reader is not None else None
+        if self._loaded and version == self._version:
+            return
+        wall = time.time()
+        entries = {key: exp for key, exp in self._loader() if exp > wall}
+        with self._lock:
+            for key, exp in self._revoked.items():
+                if exp > wall:
+                    entries.setdefault(key, exp)
+            self._revoked = entries
+            self._version = version
+            self._loaded = True
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+class UserCache:
+    """
+    Small LRU of user records for `get_current_user_obj`.
+
+    Entries are invalidated when a user row changes in this process and
+    expire after USER_CACHE_TTL_SECONDS to pick up changes made elsewhere.
+    """
+
+    def __init__(self, max_entries: int = USER_CACHE_MAX_ENTRIES, ttl: float = USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[object, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username: str):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[username]
+                return None
+            self._entries.move_to_end(username)
+            return entry[0]
+
+    def put(self, username: str, user) -> None:
+        with self._lock:
+            self._entries[username] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str) -> None:
+        with self._lock:
+            self._entries.pop(username, None)
@@ -0,0 +1,206 @@
+import fcntl
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from myproject.app.core.config import CHUNK_SIZE, UPLOAD_DIR
+from myproject.app.models import SessionLocal, StoredFile
+
+# Uploaded content is stored once per SHA-256 under uploads/blobs/<aa>/<digest>
+BLOB_DIR = UPLOAD_DIR / "blobs"
+
+
+def blob_path(sha256: str) -> Path:
+    return BLOB_DIR / sha256[:2] / sha256
+
+
+def is_valid_digest(sha256: str) -> bool:
+    return len(sha256) == 64 and all(c in "0123456789abcdef" for c in sha256)
+
+
+def blob_exists(sha256: str, size: Optional[int] = None) -> bool:
+    """Whether a blob is stored (and, if given, has the expected size) (blocking)."""
+    path = blob_path(sha256)
+    try:
+        return size is None or path.stat().st_size == size
+    except FileNotFoundError:
+        return False
+
+
+def hash_file(path: Path) -> str:
+    """SHA-256 of a file on disk; only used when chunks arrived out of order (blocking)."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+@contextmanager
+def _blob_lock(sha256: str):
+    """
+    Hold the lock of a blob's shard directory (blocking).
+
+    Storing, indexing and releasing a blob run under it, so a blob is never
+    deleted between another upload finding it stored and indexing it. It is
+    an flock, so it also serializes worker processes.
+    """
+    directory = BLOB_DIR / sha256[:2]
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / ".lock", "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def store_blob(temp_path: Path, sha256: str) -> Tuple[Path, bool]:
+    """
+    Move a fully written file into the blob store (blocking).
+
+    Returns `(blob path, deduplicated)`; when the content is already stored
+    the temp file is simply dropped.
+    """
+    path = blob_path(sha256)
+    if path.exists():
+        temp_path.unlink()
+        return path, True
+    path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(temp_path, path)
+    return path, False
+
+
+def store_upload(
+    db: Session,
+    temp_path: Optional[Path],
+    owner: str,
+    filename: str,
+    sha256: str,
+    size: int
+) -> Optional[Tuple[Path, bool]]:
+    """
+    Move a finished upload into the blob store and point the user's filename at it (blocking).
+
+    Without a `temp_path` only the index changes. That needs one of the
+    user's own files to have this content: a digest alone must not give
+    access to another user's file. Otherwise None is returned and the bytes
+    have to be sent; identical content is still stored once.
+
+    Returns `(blob path, deduplicated)`, where `deduplicated` says whether
+    the user had already stored this content; other users' files are not
+    revealed.
+    """
+    with _blob_lock(sha256):
+        owned = _owns_content(db, owner, sha256, size)
+        if temp_path is None:
+            if not owned or not blob_exists(sha256, size):
+                return None
+            path = blob_path(sha256)
+        else:
+            path, _ = store_blob(temp_path, sha256)
+        previous = _index_upload(db, owner, filename, sha256, size)
+    if previous and previous != sha256:
+        release_blob_if_unused(db, previous)
+    return path, owned
+
+
+def _owns_content(db: Session, owner: str, sha256: str, size: int) -> bool:
+    return db.query(StoredFile.id).filter(
+        StoredFile.created_by == owner,
+        StoredFile.sha256 == sha256,
+        StoredFile.size == size
+    ).first() is not None
+
+
+def _index_upload(db: Session, owner: str, filename: str, sha256: str, size: int) -> Optional[str]:
+    """Point a user's filename at a blob; return the hash it pointed to before."""
+    record = db.query(StoredFile).filter(
+        StoredFile.created_by == owner,
+        StoredFile.filename == filename
+    ).first()
+    previous = None
+    if record is None:
+        db.add(StoredFile(filename=filename, sha256=sha256, size=size, created_by=owner))
+    else:
+        previous = record.sha256
+        record.sha256 = sha256
+        record.size = size
+    db.commit()
+    return previous
+
+
+def release_blob_if_unused(db: Session, sha256: str) -> None:
+    """Delete a blob once no filename in the index refers to it (blocking)."""
+    with _blob_lock(sha256):
+        still_used = db.query(StoredFile.id).filter(StoredFile.sha256 == sha256).first()
+        if still_used is None:
+            try:
+                blob_path(sha256).unlink()
+            except FileNotFoundError:
+                pass
+
+
+def resolve_upload(db: Session, owner: str, filename: str) -> Optional[Tuple[Path, str, StoredFile]]:
+    """Find the file a user stored under `filename`."""
+    record = db.query(StoredFile).filter(
+        StoredFile.created_by == owner,
+        StoredFile.filename == filename
+    ).first()
+    if record is None:
+        return None
+    return blob_path(record.sha256), record.sha256, record
+
+
+def migrate_legacy_uploads(owner: str) -> int:
+    """
+    Move files written directly into UPLOAD_DIR, before content-addressed
+    storage existed, into the blob store and index them under `owner` (blocking).
+
+    Those files record no uploader, so they are only served once they have
+    one. A name `owner` has since uploaded again keeps the newer file. Safe
+    to run from several workers at once.
+    """
+    if not UPLOAD_DIR.is_dir():
+        return 0
+    migrated = 0
+    db = SessionLocal()
+    try:
+        for path in UPLOAD_DIR.iterdir():
+            if not path.is_file():
+                continue
+            taken = db.query(StoredFile.id).filter(
+                StoredFile.created_by == owner,
+                StoredFile.filename == path.name
+            ).first()
+            try:
+                if taken is not None:
+                    path.unlink()
+                    continue
+                size = path.stat().st_size
+                sha256 = hash_file(path)
+                store_upload(db, path, owner, path.name, sha256, size)
+                migrated += 1
+            except FileNotFoundError:
+                # Another worker moved it first
+                continue
+            except IntegrityError:
+                # Another worker indexed the name first
+                db.rollback()
+                release_blob_if_unused(db, sha256)
+    finally:
+        db.close()
+    return migrated
+
+
+def start_legacy_upload_migration(owner: str) -> threading.Thread:
+    """Run `migrate_legacy_uploads` in the background, so hashing large files doesn't delay startup."""
+    thread = threading.Thread(
+        target=migrate_legacy_uploads, args=(owner,), name="legacy-upload-migration", daemon=True
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from myproject.app.core.config import CONNECTION_CACHE_CHECK_SECONDS, CONNECTION_CACHE_MAX_ENTRIES
+from myproject.app.database import dispose_connection_engines
+from myproject.app.models import DatabaseConnection, MetadataVersion
+from myproject.app.query_cache import invalidate_connection_results
+from myproject.app.replicas import replica_router
+
+_VERSION_NAME = "db_connections"
+
+# Fields that affect how a target database is reached
+_TARGET_FIELDS = ("db_type", "host", "port", "database", "username", "password", "replicas")
+
+
+class ConnectionRecord:
+    """Detached, read-only copy of a DatabaseConnection row."""
+    __slots__ = (
+        "id", "name", "db_type", "host", "port", "database", "username",
+        "password", "timeout_ms", "replicas", "created_by", "created_at",
+    )
+
+    def __init__(self, row: DatabaseConnection):
+        for field in self.__slots__:
+            object.__setattr__(self, field, getattr(row, field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ConnectionRecord is read-only")
+
+    def to_target(self) -> dict:
+        """Connection parameters in the shape used by the query and ingest paths."""
+        return {
+            "db_type": self.db_type,
+            "host": self.host,
+            "port": self.port,
+            "database": self.database,
+            "username": self.username,
+            "password": self.password,
+            "connection_id": self.id,
+        }
+
+    def same_target(self, other: "ConnectionRecord") -> bool:
+        return all(getattr(self, field) == getattr(other, field) for field in _TARGET_FIELDS)
+
+
+def bump_connections_version(db: Session) -> None:
+    """Increment the shared version counter inside the caller's transaction."""
+    updated = db.execute(
+        update(MetadataVersion)
+        .where(MetadataVersion.name == _VERSION_NAME)
+        .values(version=MetadataVersion.version + 1)
+    ).rowcount
+    if not updated:
+        db.add(MetadataVersion(name=_VERSION_NAME, version=1))
+        db.flush()
+
+
+def _read_version(db: Session) -> int:
+    version = db.query(MetadataVersion.version).filter(MetadataVersion.name == _VERSION_NAME).scalar()
+    return version or 0
+
+
+class ConnectionCache:
+    """
+    In-process LRU of stored connections keyed by `(id, created_by)`.
+
+    Writes in this process update the cache directly. Writes in other
+    workers bump the `metadata_versions` counter; it is read at most every
+    CONNECTION_CACHE_CHECK_SECONDS and a change drops the cached records.
+    When a dropped record is loaded again with different target settings,
+    pooled engines and cached results for it are discarded too.
+    """
+
+    def __init__(self, max_entries: int = CONNECTION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._records: "OrderedDict[Tuple[int, str], ConnectionRecord]" = OrderedDict()
+        self._complete_owners: Set[str] = set()
+        self._previous: Dict[Tuple[int, str], ConnectionRecord] = {}
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, connection_id: int, owner: str) -> Optional[ConnectionRecord]:
+        """Return a user's stored connection, or None if it does not exist."""
+        self._ensure_fresh(db)
+        key = (connection_id, owner)
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None:
+                self._records.move_to_end(key)
+                self._hits += 1
+                return record
+            self._misses += 1
+        row = db.query(DatabaseConnection).filter(
+            DatabaseConnection.id == connection_id,
+            DatabaseConnection.created_by == owner
+        ).first()
+        if row is None:
+            return None
+        return self._remember(ConnectionRecord(row))
+
+    def list(self, db: Session, owner: str) -> List[ConnectionRecord]:
+        """Return all stored connections of a user."""
+        self._ensure_fresh(db)
+        with self._lock:
+            if owner in self._complete_owners:
+                self._hits += 1
+                return sorted(
+                    (record for (_, record_owner), record in self._records.items() if record_owner == owner),
+                    key=lambda record: record.id
+                )
+            self._misses += 1
+        rows = db.query(DatabaseConnection).filter(
+            DatabaseConnection.created_by == owner
+        ).order_by(DatabaseConnection.id).all()
+        records = [self._remember(ConnectionRecord(row)) for row in rows]
+        with self._lock:
+            if all((record.id, owner) in self._records for record in records):
+                self._complete_owners.add(owner)
+        return records
+
+    def store(self, db: Session, row: DatabaseConnection) -> ConnectionRecord:
+        """Write-through after a create or update has been committed."""
+        self._note_own_write(db)
+        return self._remember(ConnectionRecord(row), replace=True)
+
+    def remove(self, db: Session, connection_id: int, owner: str) -> None:
+        """Write-through after a delete has been committed."""
+        self._note_own_write(db)
+        with self._lock:
+            self._records.pop((connection_id, owner), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._records),
+                "version": self._version,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+    def _remember(self, record: ConnectionRecord, replace: bool = False) -> ConnectionRecord:
+        key = (record.id, record.created_by)
+        with self._lock:
+            previous = self._previous.pop(key, None)
+            if not replace and key in self._records:
+                return self._records[key]
+            self._records[key] = record
+            self._records.move_to_end(key)
+            while len(self._records) > self.max_entries:
+                (_, evicted_owner), _ = self._records.popitem(last=False)
+                self._complete_owners.discard(evicted_owner)
+        if previous is not None and not previous.same_target(record):
+            # Changed by another worker: its pools and results here are stale
+            dispose_connection_engines(record.id)
+            invalidate_connection_results(record.id)
+            replica_router.forget(record.id)
+        return record
+
+    def _ensure_fresh(self, db: Session) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < CONNECTION_CACHE_CHECK_SECONDS:
+            return
+        version = _read_version(db)
+        with self._lock:
+            self._checked_at = now
+            if version != self._version:
+                self._drop_all()
+                self._version = version
+
+    def _note_own_write(self, db: Session) -> None:
+        """Adopt the version after our own bump; drop everything if others wrote too."""
+        version = _read_version(db)
+        with self._lock:
+            if self._version is None or version != self._version + 1:
+                self._drop_all()
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def _drop_all(self) -> None:
+        """Forget cached records but keep them for change detection (lock held)."""
+        self._previous.update(self._records)
+        self._records.clear()
+        self._complete_owners.clear()
+
+
+connection_cache = ConnectionCache()
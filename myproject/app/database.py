@@ -1,7 +1,22 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SQLAlchemyError
-from myproject.app.core.config import DATABASES
-from typing import Optional
+from myproject.app.core.config import (
+    ALLOW_SQLITE_TARGETS,
+    DATABASES,
+    ENGINE_POOL_SIZE,
+    ENGINE_MAX_OVERFLOW,
+    ENGINE_POOL_RECYCLE_SECONDS,
+    ENGINE_REGISTRY_MAX_ENGINES,
+    ENGINE_IDLE_TIMEOUT_SECONDS,
+    ENGINE_REAPER_INTERVAL_SECONDS,
+)
+from myproject.app.metrics import DB_CONNECT_SECONDS, query_labels, register_collector
+from typing import Optional, Tuple
 
 
 def build_connection_string(
@@ -14,6 +29,13 @@ def build_connection_string(
 ) -> str:
     """Build a database connection string dynamically or use defaults."""
     
+    if db_type == "sqlite":
+        if not ALLOW_SQLITE_TARGETS:
+            raise ValueError("SQLite targets are disabled. Set ALLOW_SQLITE_TARGETS=1 to enable them.")
+        if not database:
+            raise ValueError("SQLite targets need the database file path in 'database'.")
+        return f"sqlite:///{database}"
+    
     if all([host, port, database, username, password]):
         if db_type == "oracle":
             return f"oracle+cx_oracle://{username}:{password}@{host}:{port}/{database}"
@@ -28,15 +50,247 @@ def build_connection_string(
     return DATABASES[db_type]
 
 
+def make_engine_key(
+    db_type: str,
+    host: Optional[str] = None,
+    port: Optional[int] = None,
+    database: Optional[str] = None,
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+    connection_id: Optional[int] = None,
+    replica: Optional[str] = None
+) -> Tuple:
+    """
+    Build the registry key for a connection target.
+
+    Stored connections are keyed by their ID (plus the endpoint for a read
+    replica) so they can be disposed when the record changes. Ad-hoc targets
+    are keyed by their normalized spec; the password is only kept as a digest
+    so a wrong password never reuses a pool that was opened with the right one.
+    """
+    if connection_id is not None:
+        if replica is not None:
+            return ("connection", connection_id, replica)
+        return ("connection", connection_id)
+    password_digest = hashlib.sha256((password or "").encode("utf-8")).hexdigest()
+    return (
+        "spec",
+        db_type,
+        (host or "").strip().lower(),
+        port,
+        (database or "").strip(),
+        (username or "").strip(),
+        password_digest,
+    )
+
+
+class EngineRegistry:
+    """
+    Process-wide registry of pooled SQLAlchemy engines.
+
+    Engines are kept in LRU order and evicted once the registry grows past
+    `max_engines`, or once they have sat idle for `idle_timeout` seconds.
+    Engines with checked-out connections are never evicted.
+    """
+
+    def __init__(
+        self,
+        max_engines: int = ENGINE_REGISTRY_MAX_ENGINES,
+        idle_timeout: float = ENGINE_IDLE_TIMEOUT_SECONDS,
+        reaper_interval: float = ENGINE_REAPER_INTERVAL_SECONDS
+    ):
+        self.max_engines = max_engines
+        self.idle_timeout = idle_timeout
+        self.reaper_interval = reaper_interval
+        self._engines: "OrderedDict[Tuple, Engine]" = OrderedDict()
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def get_engine(self, key: Tuple, connection_string: str) -> Engine:
+        """Return the engine for `key`, creating it on first use."""
+        self._ensure_reaper()
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                engine = create_engine(
+                    connection_string,
+                    pool_pre_ping=True,
+                    pool_size=ENGINE_POOL_SIZE,
+                    max_overflow=ENGINE_MAX_OVERFLOW,
+                    pool_recycle=ENGINE_POOL_RECYCLE_SECONDS,
+                    # Streams and cancellation use a connection from more than one executor thread
+                    connect_args={"check_same_thread": False} if connection_string.startswith("sqlite") else {}
+                )
+                self._engines[key] = engine
+            self._engines.move_to_end(key)
+            self._last_used[key] = time.monotonic()
+            evicted = self._evict_over_capacity(keep=key)
+        for old_engine in evicted:
+            old_engine.dispose()
+        return engine
+
+    def checked_out(self, key: Tuple) -> int:
+        """Connections currently checked out of the engine for `key` (0 if it has none yet)."""
+        with self._lock:
+            engine = self._engines.get(key)
+        return _checked_out(engine) if engine is not None else 0
+
+    def dispose(self, key: Tuple) -> None:
+        """Drop and dispose the engine registered under `key`, if any."""
+        with self._lock:
+            engine = self._engines.pop(key, None)
+            self._last_used.pop(key, None)
+        if engine is not None:
+            engine.dispose()
+
+    def dispose_connection(self, connection_id: int) -> None:
+        """Drop every engine that belongs to a stored connection."""
+        with self._lock:
+            keys = [
+                key for key in self._engines
+                if key[0] == "connection" and key[1] == connection_id
+            ]
+            engines = [self._engines.pop(key) for key in keys]
+            for key in keys:
+                self._last_used.pop(key, None)
+        for engine in engines:
+            engine.dispose()
+
+    def dispose_all(self) -> None:
+        """Dispose every registered engine."""
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+            self._last_used.clear()
+        for engine in engines:
+            engine.dispose()
+
+    def reap_idle(self) -> int:
+        """Dispose engines that have been idle longer than `idle_timeout`."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            keys = [
+                key for key, engine in self._engines.items()
+                if self._last_used.get(key, 0) < cutoff and _checked_out(engine) == 0
+            ]
+            engines = [self._engines.pop(key) for key in keys]
+            for key in keys:
+                self._last_used.pop(key, None)
+        for engine in engines:
+            engine.dispose()
+        return len(engines)
+
+    def stats(self) -> dict:
+        """Return pool usage for every registered engine."""
+        with self._lock:
+            items = list(self._engines.items())
+        return {
+            "engines": len(items),
+            "max_engines": self.max_engines,
+            "pools": [
+                {
+                    "key": key[:3] if key[0] == "connection" else key[:6],
+                    "checked_out": _checked_out(engine),
+                    "pool_size": engine.pool.size() if hasattr(engine.pool, "size") else None,
+                }
+                for key, engine in items
+            ],
+        }
+
+    def _evict_over_capacity(self, keep: Tuple):
+        """Pop least recently used idle engines beyond `max_engines` (lock held)."""
+        evicted = []
+        if len(self._engines) <= self.max_engines:
+            return evicted
+        for key in list(self._engines.keys()):
+            if len(self._engines) <= self.max_engines:
+                break
+            engine = self._engines[key]
+            if key != keep and _checked_out(engine) == 0:
+                evicted.append(self._engines.pop(key))
+                self._last_used.pop(key, None)
+        return evicted
+
+    def _ensure_reaper(self) -> None:
+        """Start the idle-engine reaper thread on first use."""
+        if self._reaper is not None:
+            return
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(
+                target=self._reap_forever, name="engine-reaper", daemon=True
+            )
+            self._reaper.start()
+
+    def _reap_forever(self) -> None:
+        while True:
+            time.sleep(self.reaper_interval)
+            try:
+                self.reap_idle()
+            except Exception:
+                pass
+
+
+def _checked_out(engine: Engine) -> int:
+    """Number of connections currently checked out of an engine's pool."""
+    checkedout = getattr(engine.pool, "checkedout", None)
+    return checkedout() if checkedout else 0
+
+
+engine_registry = EngineRegistry()
+
+# SQLAlchemy dialect names, reported with the db_type names the API uses
+_DIALECT_DB_TYPES = {"postgresql": "postgres"}
+
+
+def _pool_metrics():
+    """Pool usage per registered engine, for /metrics."""
+    with engine_registry._lock:
+        items = list(engine_registry._engines.items())
+    # Ad-hoc engines of the same db_type are summed into one series
+    checked_out, pool_size = {}, {}
+    for key, engine in items:
+        db_type = _DIALECT_DB_TYPES.get(engine.dialect.name, engine.dialect.name)
+        labels = (db_type, str(key[1]) if key[0] == "connection" else "adhoc")
+        checked_out[labels] = checked_out.get(labels, 0) + _checked_out(engine)
+        if hasattr(engine.pool, "size"):
+            pool_size[labels] = pool_size.get(labels, 0) + engine.pool.size()
+
+    def samples(values):
+        return [({"db_type": db_type, "connection": connection}, value) for (db_type, connection), value in values.items()]
+
+    yield "db_engines", "gauge", "Engines in the registry.", [({}, len(items))]
+    yield "db_pool_checked_out", "gauge", "Connections checked out of target database pools.", samples(checked_out)
+    yield "db_pool_size", "gauge", "Configured pool size of target database engines.", samples(pool_size)
+
+
+register_collector(_pool_metrics)
+
+
+def dispose_connection_engines(connection_id: int) -> None:
+    """Dispose pooled engines for a stored connection after it changes."""
+    engine_registry.dispose_connection(connection_id)
+
+
 def get_connection(
     db_type: str,
     host: Optional[str] = None,
     port: Optional[int] = None,
     database: Optional[str] = None,
     username: Optional[str] = None,
-    password: Optional[str] = None
+    password: Optional[str] = None,
+    connection_id: Optional[int] = None,
+    replica: Optional[str] = None
 ):
-    """Get a database connection using provided parameters or defaults."""
+    """
+    Get a pooled database connection using provided parameters or defaults.
+
+    Closing the returned connection hands it back to the engine's pool.
+    `replica` names the read-replica endpoint a stored-connection target
+    points at, so each replica gets its own pool.
+    """
     connection_string = build_connection_string(
         db_type=db_type,
         host=host,
@@ -45,10 +299,21 @@ def get_connection(
         username=username,
         password=password
     )
-    
+    key = make_engine_key(
+        db_type=db_type,
+        host=host,
+        port=port,
+        database=database,
+        username=username,
+        password=password,
+        connection_id=connection_id,
+        replica=replica
+    )
+
     try:
-        engine = create_engine(connection_string, pool_pre_ping=True)
-        conn = engine.connect()
+        engine = engine_registry.get_engine(key, connection_string)
+        with DB_CONNECT_SECONDS.time(*query_labels(db_type, connection_id)):
+            conn = engine.connect()
         return conn
     except SQLAlchemyError as e:
-        raise ConnectionError(f"Failed to connect to {db_type} database: {str(e)}")
\ No newline at end of file
+        raise ConnectionError(f"Failed to connect to {db_type} database: {str(e)}")
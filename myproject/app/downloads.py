@@ -0,0 +1,224 @@
+import mimetypes
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+from urllib.parse import quote
+import anyio
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from myproject.app.core.config import CHUNK_SIZE, DOWNLOAD_MAX_RANGES
+
+# A body segment is either literal bytes (multipart framing) or a (offset, count) file region
+Segment = Union[bytes, Tuple[int, int]]
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when no requested byte range overlaps the file."""
+
+
+def make_etag(sha256: Optional[str], stat_result: os.stat_result) -> str:
+    """Strong ETag: the content hash for stored blobs, mtime and size for other files."""
+    if sha256:
+        return f'"{sha256}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def if_range_matches(header: str, etag: str, stat_result: os.stat_result) -> bool:
+    """Whether an If-Range validator (strong ETag or HTTP date) still holds."""
+    header = header.strip()
+    if header.startswith('"'):
+        return header == etag
+    if header.startswith("W/"):
+        return False
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(stat_result.st_mtime) <= since
+
+
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a `Range: bytes=...` header into sorted, merged [start, end) ranges.
+
+    Returns None when the header should be ignored (other units, syntax
+    errors, too many ranges) and the full file served instead.
+    """
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or not spec:
+        return None
+    parts = spec.split(",")
+    if len(parts) > DOWNLOAD_MAX_RANGES:
+        return None
+    ranges = []
+    for part in parts:
+        first, dash, last = part.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) + 1 if last else size
+                if last and end <= start:
+                    return None
+            else:
+                suffix = int(last)
+                start, end = max(size - suffix, 0), size
+        except ValueError:
+            return None
+        if start < size and end > start:
+            ranges.append((start, min(end, size)))
+    if not ranges:
+        raise RangeNotSatisfiable()
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def content_disposition(filename: str, disposition: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+class FileRangeResponse(Response):
+    """
+    Serve a whole file or byte ranges of it without buffering in Python.
+
+    File regions go out through the ASGI `http.response.zerocopy` extension
+    (the server calls sendfile) when the server offers it, and whole files
+    through `http.response.pathsend`. Otherwise regions are read with
+    `os.pread` in the threadpool, CHUNK_SIZE at a time.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        size: int,
+        headers: dict,
+        media_type: str,
+        ranges: Optional[Sequence[Tuple[int, int]]] = None
+    ):
+        self.path = path
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.segments: List[Segment] = [(0, size)] if size else []
+        self.init_headers(headers)
+        if ranges is None:
+            self.headers["content-length"] = str(size)
+            self.headers["content-type"] = media_type
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.status_code = 206
+            self.segments = [(start, end - start)]
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+            self.headers["content-length"] = str(end - start)
+            self.headers["content-type"] = media_type
+        else:
+            boundary = secrets.token_hex(13)
+            self.status_code = 206
+            self.segments = []
+            for start, end in ranges:
+                self.segments.append((
+                    f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n"
+                ).encode("latin-1"))
+                self.segments.append((start, end - start))
+                self.segments.append(b"\r\n")
+            self.segments.append(f"--{boundary}--\r\n".encode("latin-1"))
+            self.headers["content-length"] = str(sum(
+                len(segment) if isinstance(segment, bytes) else segment[1]
+                for segment in self.segments
+            ))
+            self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or not self.segments:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        extensions = scope.get("extensions") or {}
+        whole_file = self.status_code == 200
+        if whole_file and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": str(self.path.resolve())})
+            return
+
+        # Stop reading the file as soon as the client goes away
+        async with anyio.create_task_group() as task_group:
+            async def transmit() -> None:
+                await self._send_segments(send, "http.response.zerocopy" in extensions)
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(transmit)
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    task_group.cancel_scope.cancel()
+                    break
+
+    async def _send_segments(self, send: Send, zerocopy: bool) -> None:
+        file = await run_in_threadpool(open, self.path, "rb")
+        try:
+            fd = file.fileno()
+            last = len(self.segments) - 1
+            for index, segment in enumerate(self.segments):
+                more_body = index < last
+                if isinstance(segment, bytes):
+                    await send({"type": "http.response.body", "body": segment, "more_body": more_body})
+                    continue
+                offset, count = segment
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopy",
+                        "file": file,
+                        "offset": offset,
+                        "count": count,
+                        "more_body": more_body,
+                    })
+                    continue
+                end = offset + count
+                while offset < end:
+                    chunk = await run_in_threadpool(os.pread, fd, min(CHUNK_SIZE, end - offset), offset)
+                    if not chunk:
+                        raise RuntimeError(f"File at path {self.path} is shorter than expected")
+                    offset += len(chunk)
+                    await send({
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": more_body or offset < end,
+                    })
+        finally:
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(file.close)
+
+
+def file_headers(filename: str, etag: str, stat_result: os.stat_result, disposition: str) -> dict:
+    """Validator and metadata headers shared by 200, 206 and 304 download responses."""
+    return {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "content-disposition": content_disposition(filename, disposition),
+    }
+
+
+def guess_media_type(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
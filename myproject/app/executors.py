@@ -0,0 +1,160 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List
+from myproject.app.core.config import (
+    QUERY_EXECUTOR_WORKERS,
+    QUERY_EXECUTOR_DEFAULT_WORKERS,
+    QUERY_EXECUTOR_MAX_QUEUE,
+)
+from myproject.app.metrics import register_collector
+
+# Every executor created in this process, for /metrics
+_all_executors: List["BoundedExecutor"] = []
+
+
+class ExecutorSaturated(Exception):
+    """Raised when a bounded executor's queue is full."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a bounded wait queue and queue-depth counters.
+
+    Blocking work (driver calls, row fetching) runs on the pool so the event
+    loop stays free. Submissions beyond `max_workers + max_queue` outstanding
+    calls are rejected with `ExecutorSaturated` instead of piling up.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+        _all_executors.append(self)
+
+    async def run(self, fn: Callable, *args, force: bool = False):
+        """
+        Run `fn(*args)` on the pool and await its result.
+
+        `force` skips the queue limit; it is meant for follow-up work on
+        something already admitted, like fetching the next batch of a stream.
+        """
+        with self._lock:
+            if not force and self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated(f"{self.name} executor queue is full")
+            self._pending += 1
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._pool, self._call, fn, args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """
+        Queue `fn(*args)` as background work and return its future.
+
+        Admission is decided immediately, so callers can reject the request
+        before answering it.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated(f"{self.name} executor queue is full")
+            self._pending += 1
+        future = self._pool.submit(self._call, fn, args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+
+    def _call(self, fn: Callable, args: tuple):
+        with self._lock:
+            self._active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def stats(self) -> dict:
+        """Return current queue depth and counters."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": max(self._pending - self._active, 0),
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_query_executors: Dict[str, BoundedExecutor] = {}
+_query_executors_lock = threading.Lock()
+
+
+def get_query_executor(db_type: str) -> BoundedExecutor:
+    """Return the dedicated query executor for a database type."""
+    executor = _query_executors.get(db_type)
+    if executor is None:
+        with _query_executors_lock:
+            executor = _query_executors.get(db_type)
+            if executor is None:
+                executor = BoundedExecutor(
+                    name=f"query-{db_type}",
+                    max_workers=QUERY_EXECUTOR_WORKERS.get(db_type, QUERY_EXECUTOR_DEFAULT_WORKERS),
+                    max_queue=QUERY_EXECUTOR_MAX_QUEUE
+                )
+                _query_executors[db_type] = executor
+    return executor
+
+
+def query_executor_stats() -> dict:
+    """Return stats for every query executor created so far."""
+    return {db_type: executor.stats() for db_type, executor in list(_query_executors.items())}
+
+
+def _executor_metrics():
+    """Queue depth and counters of every bounded executor, for /metrics."""
+    stats = [(executor.name, executor.stats()) for executor in list(_all_executors)]
+    for field, metric_type, help in (
+        ("active", "gauge", "Calls running on the executor's threads."),
+        ("queued", "gauge", "Calls waiting for a free thread."),
+        ("completed", "counter", "Calls finished."),
+        ("rejected", "counter", "Calls rejected because the queue was full."),
+    ):
+        name = f"executor_{field}_total" if metric_type == "counter" else f"executor_{field}"
+        yield name, metric_type, help, [({"executor": executor}, values[field]) for executor, values in stats]
+
+
+register_collector(_executor_metrics)
+
+
+async def iterate_in_executor(executor: BoundedExecutor, iterator):
+    """Drive a blocking iterator from async code, one item per executor call."""
+    done = object()
+    try:
+        while True:
+            item = await executor.run(next, iterator, done, force=True)
+            if item is done:
+                break
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await executor.run(close, force=True)
@@ -0,0 +1,220 @@
+import heapq
+import json
+import threading
+import time
+from typing import List, Optional, Tuple
+from myproject.app.core.config import STREAM_BATCH_SIZE
+from myproject.app.metrics import DB_EXECUTE_SECONDS, DB_FETCH_SECONDS, DB_ROWS, query_labels
+from myproject.app.query_control import QueryControl
+from myproject.app.query_profile import QueryTimings
+from myproject.app.replicas import connect
+from myproject.app.result_formats import json_default
+from myproject.app.statements import subquery_text
+
+# Added to every fanned-out row so clients can tell the shards apart
+SOURCE_COLUMN = "_connection_id"
+
+# A fetched batch: sort keys (None when unordered) and the rows as NDJSON lines
+Batch = Tuple[Optional[List], List[bytes]]
+
+
+def ordered_query(query: str, key: str, descending: bool) -> str:
+    """
+    Wrap a query so a shard returns its rows sorted by `key`.
+
+    NULLs are put last explicitly, since dialects disagree on where they
+    sort and the merge needs every shard to agree with it.
+    """
+    direction = "DESC" if descending else "ASC"
+    return (
+        f"SELECT * FROM ({subquery_text(query)}\n) fanout_q "
+        f"ORDER BY CASE WHEN fanout_q.{key} IS NULL THEN 1 ELSE 0 END, fanout_q.{key} {direction}"
+    )
+
+
+class MergeKey:
+    """Merge order for one row: by value, NULLs last, inverted when descending."""
+    __slots__ = ("value", "descending")
+
+    def __init__(self, value, descending: bool):
+        self.value = value
+        self.descending = descending
+
+    def __eq__(self, other: "MergeKey") -> bool:
+        return self.value == other.value
+
+    def __lt__(self, other: "MergeKey") -> bool:
+        if self.value is None:
+            return False
+        if other.value is None:
+            return True
+        if self.descending:
+            return other.value < self.value
+        return self.value < other.value
+
+
+class ShardCursor:
+    """
+    A streaming result on one stored connection, read one batch per call.
+
+    `open`, `fetch` and `close` are blocking and run on the shard's query
+    executor. Rows are encoded to NDJSON (tagged with the connection ID) on
+    that thread, so the event loop only moves bytes around. `close` may be
+    called from another thread while a fetch is in flight; it waits for it.
+    """
+
+    def __init__(self, connection_id: int, target: Optional[dict], timeout_ms: Optional[int] = None,
+                 order_key: Optional[str] = None, error: Optional[str] = None):
+        self.connection_id = connection_id
+        self.target = target
+        self.timeout_ms = timeout_ms
+        self.order_key = order_key
+        self.error = error
+        self.control: Optional[QueryControl] = None
+        self.timings = QueryTimings()
+        self.rows = 0
+        self.elapsed_ms = 0.0
+        self._conn = None
+        self._trans = None
+        self._result = None
+        self._columns: List[str] = []
+        self._key_index: Optional[int] = None
+        self._fetching = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def labels(self):
+        return query_labels(self.target["db_type"], self.connection_id)
+
+    def start(self) -> None:
+        """Start the statement timeout; called when the shard gets a concurrency slot."""
+        self.control = QueryControl(self.timeout_ms)
+
+    def open(self, statement, params) -> None:
+        """Execute the statement with a server-side cursor (blocking)."""
+        self.timings.start()
+        with self.timings.phase("connect"):
+            conn = connect(self.target)
+        try:
+            trans = conn.begin()
+            self.control.attach(conn)
+            with DB_EXECUTE_SECONDS.time(*self.labels), self.timings.phase("execute"):
+                result = conn.execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE).execute(
+                    statement, params
+                )
+            if not result.returns_rows:
+                raise ValueError("Fan-out queries need a statement that returns rows")
+            self._columns = list(result.keys())
+            if self.order_key:
+                self._key_index = _column_index(self._columns, self.order_key)
+            with self._lock:
+                self._conn, self._trans, self._result = conn, trans, result
+            conn = None
+        finally:
+            if conn is not None:
+                self.control.detach(conn)
+                conn.close()
+
+    def fetch(self) -> Optional[Batch]:
+        """The next batch, or None once the result is exhausted (blocking)."""
+        with self._lock:
+            if self._result is None:
+                return None
+            started = time.perf_counter()
+            rows = self._result.fetchmany(STREAM_BATCH_SIZE)
+            self._fetching += time.perf_counter() - started
+            if not rows:
+                self._release(commit=True)
+                return None
+            self.rows += len(rows)
+            columns = self._columns
+            lines = [
+                (json.dumps({SOURCE_COLUMN: self.connection_id, **dict(zip(columns, row))}, default=json_default)
+                 + "\n").encode("utf-8")
+                for row in rows
+            ]
+            keys = [row[self._key_index] for row in rows] if self._key_index is not None else None
+            return keys, lines
+
+    def close(self) -> None:
+        """Release the cursor and its connection if still open (blocking)."""
+        with self._lock:
+            if self._result is not None:
+                self._release(commit=False)
+
+    def _release(self, commit: bool) -> None:
+        conn, trans, result = self._conn, self._trans, self._result
+        self._conn = self._trans = self._result = None
+        try:
+            result.close()
+            if commit:
+                trans.commit()
+        finally:
+            if trans.is_active:
+                trans.rollback()
+            self.control.detach(conn)
+            conn.close()
+            DB_FETCH_SECONDS.observe(self._fetching, *self.labels)
+            DB_ROWS.inc(self.rows, *self.labels)
+            self.timings.add("fetch", self._fetching * 1000)
+            self.timings.rows = self.rows
+
+    def summary(self) -> dict:
+        return {
+            "connection_id": self.connection_id,
+            "status": "error" if self.error else "ok",
+            "rows": self.rows,
+            "elapsed_ms": round(self.elapsed_ms, 3),
+            "error": self.error,
+        }
+
+
+def _column_index(columns: List[str], key: str) -> int:
+    """Position of the merge key, tolerating dialects that change name case."""
+    for index, column in enumerate(columns):
+        if column == key:
+            return index
+    for index, column in enumerate(columns):
+        if column.lower() == key.lower():
+            return index
+    raise ValueError(f"order_key column '{key}' is not in the result set")
+
+
+async def merge_ordered(queues, descending: bool):
+    """
+    K-way merge of per-shard batch queues whose rows are each sorted by the
+    merge key; a None item ends a shard. Yields NDJSON chunks of about
+    STREAM_BATCH_SIZE rows.
+
+    A heap holds the head row of every shard, so each row costs O(log k)
+    comparisons for k shards and only one batch per shard is held here.
+    """
+    batches: List[Optional[Batch]] = [None] * len(queues)
+    heap = []
+    for index, queue in enumerate(queues):
+        batch = await queue.get()
+        if batch is not None:
+            batches[index] = batch
+            heap.append((MergeKey(batch[0][0], descending), index, 0))
+    heapq.heapify(heap)
+
+    chunk = []
+    while heap:
+        _, index, position = heap[0]
+        keys, lines = batches[index]
+        chunk.append(lines[position])
+        position += 1
+        if position == len(lines):
+            batch = await queues[index].get()
+            batches[index] = batch
+            if batch is None:
+                heapq.heappop(heap)
+            else:
+                keys, position = batch[0], 0
+        if batches[index] is not None:
+            heapq.heapreplace(heap, (MergeKey(keys[position], descending), index, position))
+        if len(chunk) >= STREAM_BATCH_SIZE:
+            yield b"".join(chunk)
+            chunk = []
+    if chunk:
+        yield b"".join(chunk)
@@ -0,0 +1,266 @@
+import csv
+import io
+import json
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, List, Optional
+from sqlalchemy import column, insert, table
+from myproject.app.core.config import (
+    INGEST_BATCH_SIZE,
+    INGEST_HISTORY_SIZE,
+    INGEST_MAX_QUEUE,
+    INGEST_WORKERS,
+)
+from myproject.app.database import get_connection, make_engine_key
+from myproject.app.executors import BoundedExecutor
+from myproject.app.query_cache import result_cache
+
+_TABLE_RE = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*\.)?[A-Za-z_][A-Za-z0-9_]*$")
+
+# MySQL caps a single statement at 65535 placeholders
+_MYSQL_MAX_PLACEHOLDERS = 65535
+_COPY_READ_SIZE = 1024 * 1024
+
+ingest_executor = BoundedExecutor(name="ingest", max_workers=INGEST_WORKERS, max_queue=INGEST_MAX_QUEUE)
+
+
+class IngestProgress:
+    """Progress of one bulk load, polled through GET /ingest/{id}."""
+
+    def __init__(self, owner: str, connection_id: int, table_name: str, source: str, total_bytes: int):
+        self.id = secrets.token_hex(8)
+        self.owner = owner
+        self.connection_id = connection_id
+        self.table = table_name
+        self.source = source
+        self.total_bytes = total_bytes
+        self.status = "queued"
+        self.method: Optional[str] = None
+        self.rows = 0
+        self.bytes_read = 0
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return {
+            "id": self.id,
+            "status": self.status,
+            "connection_id": self.connection_id,
+            "table": self.table,
+            "source": self.source,
+            "method": self.method,
+            "rows": self.rows,
+            "bytes_read": self.bytes_read,
+            "total_bytes": self.total_bytes,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_sec": round(self.rows / elapsed, 1) if elapsed > 0 else 0.0,
+            "error": self.error,
+        }
+
+
+class IngestRegistry:
+    """Recent ingestions, oldest finished ones dropped beyond `max_entries`."""
+
+    def __init__(self, max_entries: int = INGEST_HISTORY_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, IngestProgress]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, progress: IngestProgress) -> None:
+        with self._lock:
+            self._entries[progress.id] = progress
+            for ingest_id in list(self._entries):
+                if len(self._entries) <= self.max_entries:
+                    break
+                if self._entries[ingest_id].status in ("completed", "failed"):
+                    del self._entries[ingest_id]
+
+    def get(self, ingest_id: str, owner: str) -> Optional[IngestProgress]:
+        with self._lock:
+            progress = self._entries.get(ingest_id)
+        if progress is None or progress.owner != owner:
+            return None
+        return progress
+
+
+ingest_registry = IngestRegistry()
+
+
+def validate_table_name(name: str) -> str:
+    if not _TABLE_RE.match(name):
+        raise ValueError("table must be a plain table name, optionally schema-qualified")
+    return name
+
+
+class _CountingReader(io.RawIOBase):
+    """Binary reader that reports bytes consumed into an IngestProgress."""
+
+    def __init__(self, raw, progress: IngestProgress):
+        self._raw = raw
+        self._progress = progress
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = self._raw.readinto(buffer)
+        self._progress.bytes_read += n or 0
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._raw.read(size)
+        self._progress.bytes_read += len(data)
+        return data
+
+
+def _open_text(path: Path, progress: IngestProgress):
+    raw = open(path, "rb")
+    counting = io.BufferedReader(_CountingReader(raw, progress), buffer_size=_COPY_READ_SIZE)
+    return raw, io.TextIOWrapper(counting, encoding="utf-8", newline="")
+
+
+def _csv_rows(text_file, columns: Optional[List[str]], has_header: bool):
+    """Return (columns, row iterator) for a CSV file, read lazily."""
+    reader = csv.reader(text_file)
+    if has_header:
+        header = next(reader, None)
+        if header is None:
+            return columns or [], iter(())
+        columns = columns or [name.strip() for name in header]
+    if not columns:
+        raise ValueError("columns are required when the file has no header row")
+    width = len(columns)
+
+    def _rows():
+        for line_no, record in enumerate(reader, start=2 if has_header else 1):
+            if not record:
+                continue
+            if len(record) != width:
+                raise ValueError(f"Line {line_no}: expected {width} fields, got {len(record)}")
+            yield [value if value != "" else None for value in record]
+
+    return columns, _rows()
+
+
+def _ndjson_rows(text_file, columns: Optional[List[str]]):
+    """Return (columns, row iterator) for an NDJSON file; columns default to the first record's keys."""
+    lines = (line for line in text_file if line.strip())
+    first = next(lines, None)
+    if first is None:
+        return columns or [], iter(())
+    first_record = json.loads(first)
+    columns = columns or list(first_record.keys())
+
+    def _rows():
+        yield [first_record.get(name) for name in columns]
+        for line in lines:
+            record = json.loads(line)
+            yield [record.get(name) for name in columns]
+
+    return columns, _rows()
+
+
+def _batched(rows: Iterator[list], size: int) -> Iterator[List[list]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy_postgres(conn, sa_table, columns: List[str], path: Path, has_header: bool, progress: IngestProgress) -> None:
+    """Stream a CSV file straight into COPY ... FROM STDIN."""
+    preparer = conn.dialect.identifier_preparer
+    column_list = ", ".join(preparer.quote(name) for name in columns)
+    sql = (
+        f"COPY {preparer.format_table(sa_table)} ({column_list}) "
+        f"FROM STDIN WITH (FORMAT csv, HEADER {'true' if has_header else 'false'})"
+    )
+    raw_conn = conn.connection.driver_connection
+    with open(path, "rb") as raw:
+        source = _CountingReader(raw, progress)
+        with raw_conn.cursor() as cursor:
+            cursor.copy_expert(sql, source, size=_COPY_READ_SIZE)
+            progress.rows = cursor.rowcount
+    raw_conn.commit()
+
+
+def _insert_batches(conn, sa_table, columns: List[str], rows: Iterator[list], batch_size: int, progress: IngestProgress) -> None:
+    """Insert rows batch by batch, committing each batch."""
+    multi_row = conn.dialect.name == "mysql"
+    if multi_row:
+        # One multi-row INSERT ... VALUES (...), (...) per batch
+        batch_size = min(batch_size, max(1, _MYSQL_MAX_PLACEHOLDERS // max(len(columns), 1)))
+    statement = insert(sa_table)
+    for batch in _batched(rows, batch_size):
+        records = [dict(zip(columns, row)) for row in batch]
+        with conn.begin():
+            if multi_row:
+                conn.execute(statement.values(records))
+            else:
+                # executemany: array binding on cx_Oracle, executemany elsewhere
+                conn.execute(statement, records)
+        progress.rows += len(records)
+
+
+def run_ingest(
+    progress: IngestProgress,
+    target: dict,
+    path: Path,
+    fmt: str,
+    has_header: bool = True,
+    columns: Optional[List[str]] = None,
+    batch_size: int = INGEST_BATCH_SIZE
+) -> None:
+    """Load a file into a table using the fastest path for the target dialect (blocking)."""
+    progress.status = "running"
+    progress.started_at = time.monotonic()
+    conn = None
+    raw = None
+    try:
+        conn = get_connection(**target)
+        schema, _, name = progress.table.rpartition(".")
+
+        if fmt == "csv" and has_header and columns is None and conn.dialect.driver == "psycopg2":
+            with open(path, newline="", encoding="utf-8") as header_file:
+                header = next(csv.reader(header_file), None)
+            if header:
+                header = [value.strip() for value in header]
+                sa_table = table(name, *[column(c) for c in header], schema=schema or None)
+                progress.method = "copy"
+                _copy_postgres(conn, sa_table, header, path, has_header, progress)
+                progress.status = "completed"
+                return
+
+        raw, text_file = _open_text(path, progress)
+        if fmt == "csv":
+            columns, rows = _csv_rows(text_file, columns, has_header)
+        else:
+            columns, rows = _ndjson_rows(text_file, columns)
+        sa_table = table(name, *[column(c) for c in columns], schema=schema or None)
+        progress.method = "multi_row_insert" if conn.dialect.name == "mysql" else "executemany"
+        _insert_batches(conn, sa_table, columns, rows, batch_size, progress)
+        progress.status = "completed"
+    except Exception as e:
+        progress.status = "failed"
+        progress.error = str(e)
+    finally:
+        progress.finished_at = time.monotonic()
+        if raw is not None:
+            raw.close()
+        if conn is not None:
+            conn.close()
+        # Even a failed load may have committed some batches
+        result_cache.invalidate_target(make_engine_key(**target))
+
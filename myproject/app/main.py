@@ -1,18 +1,24 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from pathlib import Path
+import sys
 from myproject.app.routers.db_router import router as db_router
 from myproject.app.routers.file_upload import router as file_router
 from myproject.app.routers.db_connection_router import router as db_connection_router
+from myproject.app.routers.ingest_router import router as ingest_router
+from myproject.app.routers.metrics_router import router as metrics_router
+from myproject.app.routers.query_jobs_router import router as query_jobs_router
 from myproject.app.auth import router as auth_router
 from myproject.app.models import init_db, User, SessionLocal
 from myproject.app.auth import hash_password
+from myproject.app.blob_store import start_legacy_upload_migration
+from myproject.app.core.config import LEGACY_UPLOADS_OWNER
+from myproject.app.metrics import MetricsMiddleware
+from myproject.app.startup import profile_startup, startup_step
 
-app = FastAPI(title="Multi-Database API", description="FastAPI with JWT Auth, Multi-DB Support, and File Upload")
-
-
-init_db()
+static_dir = Path(__file__).parent.parent / "static"
 
 
 def create_default_admin():
@@ -32,18 +38,48 @@ def create_default_admin():
     finally:
         db.close()
 
-create_default_admin()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    One-time startup work, run when the server starts instead of at import.
+    
+    Database drivers are not loaded here: SQLAlchemy imports cx_Oracle,
+    mysql-connector or psycopg2 when an engine for that db_type is first
+    created.
+    """
+    with startup_step("init_db"):
+        init_db()
+    with startup_step("create_default_admin"):
+        create_default_admin()
+    with startup_step("static_dir"):
+        static_dir.mkdir(exist_ok=True)
+    if LEGACY_UPLOADS_OWNER:
+        with startup_step("legacy_uploads"):
+            start_legacy_upload_migration(LEGACY_UPLOADS_OWNER)
+    yield
+
+
+app = FastAPI(
+    title="Multi-Database API",
+    description="FastAPI with JWT Auth, Multi-DB Support, and File Upload",
+    lifespan=lifespan
+)
+
+# Per-route latency, status and in-flight counts for /metrics
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(auth_router)
 app.include_router(db_router)
 app.include_router(db_connection_router)
 app.include_router(file_router)
+app.include_router(ingest_router)
+app.include_router(query_jobs_router)
+app.include_router(metrics_router)
 
-# Serve static files (frontend)
-static_dir = Path(__file__).parent.parent / "static"
-static_dir.mkdir(exist_ok=True)
-app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
+# Serve static files (frontend); the directory is created at startup
+app.mount("/static", StaticFiles(directory=str(static_dir), check_dir=False), name="static")
 
 
 @app.get("/")
@@ -53,3 +89,10 @@ async def read_root():
     if index_file.exists():
         return FileResponse(str(index_file))
     return {"message": "Frontend not found. Please ensure static/index.html exists."}
+
+
+if __name__ == "__main__":
+    if "--profile-startup" in sys.argv:
+        profile_startup()
+    else:
+        print("Usage: python -m myproject.app.main --profile-startup")
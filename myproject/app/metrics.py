@@ -0,0 +1,296 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from myproject.app.core.config import METRICS_LATENCY_BUCKETS, METRICS_THROUGHPUT_BUCKETS
+
+# A collector yields (name, type, help, [(labels, value), ...]) for values read at scrape time
+Sample = Tuple[Dict[str, str], float]
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+_metrics: List["_Metric"] = []
+_collectors: List[Collector] = []
+
+# request.state attribute the query endpoint sets so response bytes are attributed to a target
+QUERY_LABELS_STATE = "metrics_query_labels"
+
+
+class _Shards:
+    """
+    Per-thread value dicts.
+
+    Each thread only ever writes its own dict, so updates need no lock (the
+    GIL keeps a single dict operation atomic). The lock is taken when a
+    thread records its first value and when a scrape copies the shards.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+
+    def mine(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            shards = list(self._shards)
+        return [dict(shard) for shard in shards]
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._shards = _Shards()
+        _metrics.append(self)
+
+    def _label_dict(self, values: Tuple) -> Dict[str, str]:
+        return dict(zip(self.labels, values))
+
+
+class Counter(_Metric):
+    """Monotonic counter; label values are passed positionally."""
+    type = "counter"
+
+    def inc(self, amount: float = 1, *label_values) -> None:
+        shard = self._shards.mine()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        totals: Dict[Tuple, float] = {}
+        for shard in self._shards.snapshot():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        return [(self.name, self._label_dict(key), value) for key, value in totals.items()]
+
+
+class Gauge(Counter):
+    """Up/down value such as an in-flight count (summed across threads)."""
+    type = "gauge"
+
+    def dec(self, amount: float = 1, *label_values) -> None:
+        self.inc(-amount, *label_values)
+
+
+class Histogram(_Metric):
+    """Bucketed observations with Prometheus' cumulative `le` buckets."""
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = METRICS_LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values) -> None:
+        shard = self._shards.mine()
+        cells = shard.get(label_values)
+        if cells is None:
+            # One slot per bucket plus +Inf, then sum and count
+            cells = shard[label_values] = [0] * (len(self.buckets) + 3)
+        cells[bisect_left(self.buckets, value)] += 1
+        cells[-2] += value
+        cells[-1] += 1
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        totals: Dict[Tuple, List[float]] = {}
+        for shard in self._shards.snapshot():
+            for key, cells in shard.items():
+                merged = totals.setdefault(key, [0] * len(cells))
+                for index, value in enumerate(list(cells)):
+                    merged[index] += value
+        samples = []
+        for key, cells in totals.items():
+            labels = self._label_dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), cells):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, cells[-2]))
+            samples.append((f"{self.name}_count", labels, cells[-1]))
+        return samples
+
+    def time(self, *label_values) -> "_Timer":
+        """Context manager observing the elapsed seconds of its block."""
+        return _Timer(self, label_values)
+
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "started")
+
+    def __init__(self, histogram: Histogram, label_values: Tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+def register_collector(collector: Collector) -> None:
+    """Add a callback that reports values read at scrape time (pool usage, queue depth)."""
+    _collectors.append(collector)
+
+
+def query_labels(db_type: str, connection_id: Optional[int] = None) -> Tuple[str, str]:
+    """Label values for per-target database metrics; ad-hoc targets share one series per db_type."""
+    return db_type, str(connection_id) if connection_id is not None else "adhoc"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+        return f"{name}{{{rendered}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(_format_sample(*sample) for sample in metric.samples())
+    for collector in _collectors:
+        try:
+            families = list(collector())
+        except Exception:
+            # A failing collector must not break the scrape
+            continue
+        for name, metric_type, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(_format_sample(name, labels, value) for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+# HTTP
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time until the response was fully sent.", ("method", "route")
+)
+HTTP_RESPONSE_BYTES = Counter(
+    "http_response_bytes_total", "Response body bytes sent.", ("method", "route")
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled.", ("method",))
+
+# Target databases (labelled by db_type and stored connection ID, or "adhoc")
+DB_CONNECT_SECONDS = Histogram(
+    "db_connect_seconds", "Time to get a pooled connection.", ("db_type", "connection")
+)
+DB_EXECUTE_SECONDS = Histogram(
+    "db_execute_seconds", "Time to execute a statement, before rows are fetched.", ("db_type", "connection")
+)
+DB_FETCH_SECONDS = Histogram(
+    "db_fetch_seconds", "Time spent fetching rows of a result.", ("db_type", "connection")
+)
+DB_ROWS = Counter("db_rows_returned_total", "Rows returned to clients.", ("db_type", "connection"))
+DB_BYTES_SERIALIZED = Counter(
+    "db_bytes_serialized_total", "Response bytes sent for /db/query, in any format.", ("db_type", "connection")
+)
+DB_READ_ROUTING = Counter(
+    "db_read_routing_total", "Reads on connections with replicas, by the endpoint chosen.", ("connection", "endpoint")
+)
+
+# Admission control for /db/query
+ADMISSION_WAIT_SECONDS = Histogram(
+    "query_admission_wait_seconds", "Time a query waited in the admission queue before running."
+)
+ADMISSION_REJECTED = Counter(
+    "query_admission_rejected_total", "Queries turned away with 429, by reason.", ("reason",)
+)
+
+# Uploads
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes received by upload endpoints.", ("endpoint",))
+UPLOAD_SECONDS = Histogram("upload_duration_seconds", "Time to receive and store an upload.", ("endpoint",))
+UPLOAD_THROUGHPUT = Histogram(
+    "upload_throughput_bytes_per_second", "Per-upload throughput.", ("endpoint",),
+    buckets=METRICS_THROUGHPUT_BUCKETS
+)
+
+# Authentication
+BCRYPT_QUEUE_WAIT = Histogram(
+    "bcrypt_queue_wait_seconds", "Time a password hash or check waited for a bcrypt worker."
+)
+
+
+def record_upload(endpoint: str, size: int, seconds: float) -> None:
+    UPLOAD_BYTES.inc(size, endpoint)
+    UPLOAD_SECONDS.observe(seconds, endpoint)
+    if seconds > 0:
+        UPLOAD_THROUGHPUT.observe(size / seconds, endpoint)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency, status counts, response
+    bytes and in-flight requests.
+
+    Routes are labelled with their path template (`/upload/files/{filename}`),
+    so label cardinality stays bounded; requests that match no route are
+    labelled "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        # Shared with request.state so the endpoint can attach query labels
+        state = scope.setdefault("state", {})
+        status_code = 500
+        sent = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, sent
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            elif message["type"] == "http.response.zerocopy":
+                sent += message.get("count") or 0
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(1, method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec(1, method)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUESTS.inc(1, method, route, str(status_code))
+            HTTP_REQUEST_SECONDS.observe(elapsed, method, route)
+            HTTP_RESPONSE_BYTES.inc(sent, method, route)
+            labels = state.get(QUERY_LABELS_STATE)
+            if labels is not None:
+                DB_BYTES_SERIALIZED.inc(sent, *labels)
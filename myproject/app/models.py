@@ -1,7 +1,18 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text
+from sqlalchemy import create_engine, event, inspect, BigInteger, Boolean, Column, Float, Index, Integer, JSON, String, DateTime, Text, UniqueConstraint
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+import hashlib
+import threading
+from myproject.app.core.config import (
+    APP_DB_PATH,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_MMAP_SIZE,
+)
+from myproject.app.metrics import register_collector
 
 Base = declarative_base()
 
@@ -16,9 +27,22 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class RevokedToken(Base):
+    """Access token revoked by logout; kept until the token would have expired."""
+    __tablename__ = "revoked_tokens"
+    
+    token_hash = Column(String, primary_key=True)  # Hex SHA-256 of the token
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
 class DatabaseConnection(Base):
     """Database connection configuration model."""
     __tablename__ = "database_connections"
+    __table_args__ = (
+        # Lookups by name and listings/lookups by ID are always scoped to the owner
+        Index("ix_database_connections_owner_name", "created_by", "name"),
+        Index("ix_database_connections_owner_id", "created_by", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)  # User-friendly name
@@ -28,23 +52,223 @@ class DatabaseConnection(Base):
     database = Column(String, nullable=False)
     username = Column(String, nullable=False)
     password = Column(String, nullable=False)  # In production, encrypt this
+    timeout_ms = Column(Integer, nullable=True)  # Statement timeout for queries on this connection
+    replicas = Column(JSON, nullable=True)  # Read replicas: [{"host": ..., "port": ...}]
+    created_by = Column(String, nullable=False)  # username
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UploadSession(Base):
+    """Resumable upload session; chunks land in a preallocated partial file."""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String, primary_key=True)  # Random session token
+    filename = Column(String, nullable=False)  # Sanitized target filename
+    length = Column(BigInteger, nullable=False)  # Total upload size in bytes
+    status = Column(String, nullable=False, default="open")  # open, completed
+    created_by = Column(String, nullable=False, index=True)  # username
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=True)  # Last chunk received
+    completed_at = Column(DateTime, nullable=True)
+
+
+class UploadChunk(Base):
+    """Byte range received for an upload session."""
+    __tablename__ = "upload_chunks"
+    
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String, nullable=False, index=True)
+    offset = Column(BigInteger, nullable=False)
+    length = Column(BigInteger, nullable=False)
+
+
+class QueryJobRecord(Base):
+    """Background query job; its result is spooled to a file under QUERY_JOB_DIR."""
+    __tablename__ = "query_jobs"
+    
+    id = Column(String, primary_key=True)  # Random job token
+    connection_id = Column(Integer, nullable=False)
+    query = Column(Text, nullable=False)
+    format = Column(String, nullable=False)  # ndjson, parquet
+    timeout_ms = Column(Integer, nullable=True)
+    status = Column(String, nullable=False, default="queued")  # queued, running, completed, failed, cancelled
+    columns = Column(JSON, nullable=True)
+    rows = Column(BigInteger, nullable=False, default=0)
+    bytes_written = Column(BigInteger, nullable=False, default=0)
+    offsets = Column(JSON, nullable=True)  # Byte offset of every QUERY_JOB_INDEX_STRIDE-th NDJSON row
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_by = Column(String, nullable=False, index=True)  # username
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # Last progress save by the worker running the job
+
+
+class StoredFile(Base):
+    """Per-user filename -> content hash index for content-addressed uploads."""
+    __tablename__ = "stored_files"
+    __table_args__ = (UniqueConstraint("created_by", "filename", name="uq_stored_files_owner_filename"),)
+    
+    id = Column(Integer, primary_key=True)
+    filename = Column(String, nullable=False)  # Sanitized filename as uploaded
+    sha256 = Column(String, nullable=False, index=True)  # Blob key under uploads/blobs
+    size = Column(BigInteger, nullable=False)
     created_by = Column(String, nullable=False)  # username
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class SlowQuery(Base):
+    """A /db/query call that exceeded SLOW_QUERY_THRESHOLD_MS; a bounded ring of the newest entries."""
+    __tablename__ = "slow_queries"
+    __table_args__ = (
+        Index("ix_slow_queries_owner_fingerprint", "created_by", "fingerprint", "connection_id"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String, nullable=False)  # Hash of the normalized statement
+    statement = Column(Text, nullable=False)  # Normalized statement, literals replaced with ?
+    db_type = Column(String, nullable=False)
+    connection_id = Column(Integer, nullable=True)  # None for ad-hoc targets
+    created_by = Column(String, nullable=False)  # username
+    duration_ms = Column(Float, nullable=False)
+    queue_ms = Column(Float, nullable=True)
+    connect_ms = Column(Float, nullable=True)
+    execute_ms = Column(Float, nullable=True)
+    fetch_ms = Column(Float, nullable=True)
+    serialize_ms = Column(Float, nullable=True)
+    rows = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MetadataVersion(Base):
+    """Change counter for cached metadata, so other workers can detect stale caches."""
+    __tablename__ = "metadata_versions"
+    
+    name = Column(String, primary_key=True)  # e.g. "db_connections"
+    version = Column(Integer, nullable=False, default=0)
+
+
 # SQLite database for storing users and connections
-SQLALCHEMY_DATABASE_URL = "sqlite:///./app.db"
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{APP_DB_PATH}"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # Needed for SQLite
+    connect_args={
+        "check_same_thread": False,  # Needed for SQLite
+        "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+    }
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+@event.listens_for(engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    """Apply the concurrency settings to every new SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}")
+    finally:
+        cursor.close()
+
+
+def _metadata_pool_metrics():
+    """Usage of the metadata store's connection pool, for /metrics."""
+    yield "app_db_pool_checked_out", "gauge", "Connections checked out of the metadata store pool.", [
+        ({}, engine.pool.checkedout())
+    ]
+    yield "app_db_pool_size", "gauge", "Pool size of the metadata store.", [({}, engine.pool.size())]
+
+
+register_collector(_metadata_pool_metrics)
+
+
+_init_lock = threading.Lock()
+_initialized = False
+
+# metadata_versions row holding a fingerprint of the schema init_db last applied
+_SCHEMA_VERSION_NAME = "schema"
+
+
 def init_db():
-    """Initialize the database by creating all tables."""
+    """
+    Initialize the database by creating all tables.
+    
+    Runs once per process. When the database already matches the declared
+    schema (checked with a single fingerprint lookup) nothing is inspected
+    or created, so starting many workers stays cheap.
+    """
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        fingerprint = _schema_fingerprint()
+        if _stored_fingerprint() != fingerprint:
+            try:
+                _apply_schema(fingerprint)
+            except OperationalError:
+                # Another worker may have created the same objects concurrently; retry once
+                _apply_schema(fingerprint)
+        _initialized = True
+
+
+def _schema_fingerprint() -> int:
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{column.name}:{column.type}" for column in table.columns)
+        parts.extend(sorted(index.name for index in table.indexes))
+    digest = hashlib.sha256("|".join(parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:7], "big")
+
+
+def _stored_fingerprint():
+    try:
+        with engine.connect() as conn:
+            return conn.exec_driver_sql(
+                "SELECT version FROM metadata_versions WHERE name = ?", (_SCHEMA_VERSION_NAME,)
+            ).scalar()
+    except OperationalError:
+        # Fresh database without the metadata_versions table yet
+        return None
+
+
+def _apply_schema(fingerprint: int) -> None:
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _add_missing_indexes()
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT OR REPLACE INTO metadata_versions (name, version) VALUES (?, ?)",
+            (_SCHEMA_VERSION_NAME, fingerprint)
+        )
+
+
+def _add_missing_columns():
+    """Add nullable columns introduced after a table was first created."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}')
+
+
+def _add_missing_indexes():
+    """Create indexes introduced after a table was first created."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
 
 
 def get_db():
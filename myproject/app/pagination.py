@@ -0,0 +1,252 @@
+import base64
+import hashlib
+import hmac
+import json
+import re
+import secrets
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Hashable, Optional, Tuple
+from myproject.app.core.config import (
+    CURSOR_TTL_SECONDS,
+    MAX_HELD_CURSORS,
+    MAX_HELD_CURSORS_PER_CONNECTION,
+    MAX_HELD_CURSORS_PER_USER,
+    SECRET_KEY,
+)
+from myproject.app.query_cache import normalize_query
+from myproject.app.query_control import QueryControl
+from myproject.app.result_formats import json_default
+from myproject.app.statements import subquery_text
+
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class PageTokenError(ValueError):
+    """Raised for malformed, tampered or mismatched page tokens."""
+
+
+class CursorLimitReached(Exception):
+    """Raised when a cursor can't be opened; `reason` is "total", "user" or "connection"."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def validate_key_column(column: str) -> str:
+    if not _IDENTIFIER_RE.match(column):
+        raise ValueError("order_key must be a plain column name")
+    return column
+
+
+def query_fingerprint(target_key: Tuple, query: str, params: Any) -> str:
+    """Identify a query so a page token can't be replayed against another one."""
+    payload = json.dumps(
+        [list(target_key), normalize_query(query), params], sort_keys=True, default=json_default
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def encode_page_token(payload: Dict[str, Any]) -> str:
+    """Serialize and sign a page token."""
+    body = json.dumps(payload, separators=(",", ":"), default=json_default).encode("utf-8")
+    signature = hmac.new(SECRET_KEY.encode("utf-8"), body, hashlib.sha256).digest()
+    return f"{_b64encode(body)}.{_b64encode(signature)}"
+
+
+def decode_page_token(token: str, fingerprint: str) -> Dict[str, Any]:
+    """Verify a page token's signature and that it belongs to this query."""
+    try:
+        body_part, signature_part = token.split(".", 1)
+        body = _b64decode(body_part)
+        signature = _b64decode(signature_part)
+    except (ValueError, TypeError):
+        raise PageTokenError("Malformed page token")
+    expected = hmac.new(SECRET_KEY.encode("utf-8"), body, hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        raise PageTokenError("Invalid page token")
+    payload = json.loads(body)
+    if payload.get("f") != fingerprint:
+        raise PageTokenError("Page token does not match this query")
+    return payload
+
+
+def keyset_query(query: str, db_type: str, key: str, descending: bool, has_after: bool, limit: int) -> str:
+    """
+    Wrap a query so it returns one keyset page ordered by `key`.
+
+    The page after the previous one is selected with `key > :page_after`
+    (or `<` when descending), which stays fast at any depth given an index.
+    """
+    inner = subquery_text(query)
+    direction = "DESC" if descending else "ASC"
+    comparison = "<" if descending else ">"
+    where = f" WHERE page_q.{key} {comparison} :page_after" if has_after else ""
+    if db_type == "oracle":
+        limit_clause = f" FETCH FIRST {limit} ROWS ONLY"
+    else:
+        limit_clause = f" LIMIT {limit}"
+    return f"SELECT * FROM ({inner}\n) page_q{where} ORDER BY page_q.{key} {direction}{limit_clause}"
+
+
+class HeldCursor:
+    """A server-side cursor kept open between page requests."""
+
+    def __init__(self, owner: str, engine_key: Hashable, fingerprint: str, conn, trans, result, columns, lookahead):
+        self.owner = owner
+        self.engine_key = engine_key
+        self.fingerprint = fingerprint
+        self.conn = conn
+        self.trans = trans
+        self.result = result
+        self.columns = columns
+        self.lookahead = lookahead
+        self.expires_at = time.monotonic() + CURSOR_TTL_SECONDS
+
+    def fetch_page(self, page_size: int, control: Optional[QueryControl] = None):
+        """Return `(rows, has_more)`, reading one row ahead to detect the end (blocking)."""
+        rows = list(self.lookahead)
+        if control is not None:
+            control.attach(self.conn)
+        try:
+            rows.extend(self.result.fetchmany(page_size + 1 - len(rows)))
+        finally:
+            if control is not None:
+                control.detach(self.conn)
+        self.lookahead = rows[page_size:]
+        self.expires_at = time.monotonic() + CURSOR_TTL_SECONDS
+        return [dict(zip(self.columns, row)) for row in rows[:page_size]], bool(self.lookahead)
+
+    def close(self) -> None:
+        """Release the cursor and hand the connection back to its pool (blocking)."""
+        try:
+            self.result.close()
+            if self.trans.is_active:
+                self.trans.rollback()
+        finally:
+            self.conn.close()
+
+
+class CursorRegistry:
+    """
+    Open cursors waiting for their next page request.
+
+    A cursor is taken out of the registry while a page is read from it, so
+    concurrent requests with the same token can't interleave. Expired
+    cursors are closed by a background reaper.
+
+    Every open cursor holds a pooled connection, so open cursors are capped
+    in total, per user and per engine; a cursor counts from `reserve` until
+    it is closed through `close`, including while a page is read from it.
+    """
+
+    def __init__(
+        self,
+        max_cursors: int = MAX_HELD_CURSORS,
+        max_per_user: int = MAX_HELD_CURSORS_PER_USER,
+        max_per_connection: int = MAX_HELD_CURSORS_PER_CONNECTION
+    ):
+        self.max_cursors = max_cursors
+        self.max_per_user = max_per_user
+        self.max_per_connection = max_per_connection
+        self._cursors: Dict[str, HeldCursor] = {}
+        self._open = 0
+        self._open_by_user: Counter = Counter()
+        self._open_by_connection: Counter = Counter()
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def reserve(self, owner: str, engine_key: Hashable) -> None:
+        """Count a cursor about to be opened, or raise CursorLimitReached."""
+        with self._lock:
+            if self._open >= self.max_cursors:
+                raise CursorLimitReached("Too many open result cursors", "total")
+            if self._open_by_user[owner] >= self.max_per_user:
+                raise CursorLimitReached(
+                    f"You already have {self.max_per_user} open result cursors; "
+                    "read them to the end or wait for them to expire",
+                    "user"
+                )
+            if self._open_by_connection[engine_key] >= self.max_per_connection:
+                raise CursorLimitReached("Too many open result cursors on this connection", "connection")
+            self._open += 1
+            self._open_by_user[owner] += 1
+            self._open_by_connection[engine_key] += 1
+
+    def unreserve(self, owner: str, engine_key: Hashable) -> None:
+        """Give back a reservation whose cursor was closed or never opened."""
+        with self._lock:
+            self._open -= 1
+            self._open_by_user[owner] -= 1
+            if self._open_by_user[owner] <= 0:
+                del self._open_by_user[owner]
+            self._open_by_connection[engine_key] -= 1
+            if self._open_by_connection[engine_key] <= 0:
+                del self._open_by_connection[engine_key]
+
+    def close(self, cursor: HeldCursor) -> None:
+        """Close a cursor that is not in the registry and give back its reservation (blocking)."""
+        try:
+            cursor.close()
+        finally:
+            self.unreserve(cursor.owner, cursor.engine_key)
+
+    def put(self, cursor: HeldCursor, cursor_id: Optional[str] = None) -> str:
+        self._ensure_reaper()
+        cursor_id = cursor_id or secrets.token_urlsafe(16)
+        with self._lock:
+            self._cursors[cursor_id] = cursor
+        return cursor_id
+
+    def take(self, cursor_id: str, owner: str) -> Optional[HeldCursor]:
+        with self._lock:
+            cursor = self._cursors.get(cursor_id)
+            if cursor is None or cursor.owner != owner:
+                return None
+            return self._cursors.pop(cursor_id)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._cursors)
+
+    def reap_expired(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [cid for cid, cursor in self._cursors.items() if cursor.expires_at <= now]
+            cursors = [self._cursors.pop(cid) for cid in expired]
+        for cursor in cursors:
+            try:
+                self.close(cursor)
+            except Exception:
+                pass
+        return len(cursors)
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is not None:
+            return
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, name="cursor-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self) -> None:
+        while True:
+            time.sleep(max(CURSOR_TTL_SECONDS / 4, 1))
+            try:
+                self.reap_expired()
+            except Exception:
+                pass
+
+
+cursor_registry = CursorRegistry()
@@ -0,0 +1,144 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+from myproject.app.core.config import QUERY_CACHE_MAX_BYTES, QUERY_CACHE_MAX_ENTRY_BYTES
+from myproject.app.result_formats import json_default
+
+# Quoted literals/identifiers are kept verbatim; only whitespace between them is collapsed
+_TOKEN_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|(\s+)")
+_READ_PREFIX_RE = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+_WRITE_RE = re.compile(
+    r"\b(insert|update|delete|merge|upsert|replace|create|alter|drop|truncate|"
+    r"grant|revoke|call|exec|execute|lock|into|nextval|setval)\b",
+    re.IGNORECASE
+)
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace outside quotes and drop a trailing semicolon."""
+    normalized = _TOKEN_RE.sub(lambda m: m.group(1) or " ", query.strip())
+    return normalized.rstrip("; ")
+
+
+def is_read_only(query: str) -> bool:
+    """Conservatively decide whether a statement is a plain read."""
+    if not _READ_PREFIX_RE.match(query):
+        return False
+    # Ignore keywords that only appear inside string literals
+    unquoted = _TOKEN_RE.sub(lambda m: " " if m.group(1) else m.group(0), query)
+    return not _WRITE_RE.search(unquoted)
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at", "target_key")
+
+    def __init__(self, value: dict, size: int, expires_at: float, target_key: Tuple):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.target_key = target_key
+
+
+class QueryResultCache:
+    """
+    Memory-bounded LRU of query responses with per-entry TTLs.
+
+    Entries are grouped by connection target so a write or a connection
+    change drops everything cached for that target. Each target carries a
+    generation counter; a result computed before an invalidation is
+    discarded instead of being stored.
+    """
+
+    def __init__(self, max_bytes: int = QUERY_CACHE_MAX_BYTES, max_entry_bytes: int = QUERY_CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._by_target: Dict[Tuple, Set[Tuple]] = {}
+        self._generations: Dict[Tuple, int] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(target_key: Tuple, query: str, params: Any = None) -> Tuple:
+        return (
+            target_key,
+            normalize_query(query),
+            json.dumps(params, sort_keys=True, default=json_default),
+        )
+
+    def generation(self, target_key: Tuple) -> int:
+        with self._lock:
+            return self._generations.get(target_key, 0)
+
+    def get(self, key: Tuple) -> Optional[dict]:
+        """Return a cached response, or None on a miss or expiry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry.value
+
+    def put(self, key: Tuple, value: dict, ttl: float, generation: int) -> bool:
+        """Store a response unless it is too large or its target changed meanwhile."""
+        size = len(json.dumps(value, default=json_default))
+        if size > self.max_entry_bytes:
+            return False
+        target_key = key[0]
+        with self._lock:
+            if self._generations.get(target_key, 0) != generation:
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, size, time.monotonic() + ttl, target_key)
+            self._by_target.setdefault(target_key, set()).add(key)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def invalidate_target(self, target_key: Tuple) -> None:
+        """Drop all entries for a connection target and bump its generation."""
+        with self._lock:
+            self._generations[target_key] = self._generations.get(target_key, 0) + 1
+            for key in list(self._by_target.get(target_key, ())):
+                self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+    def _remove(self, key: Tuple) -> None:
+        """Remove one entry and its accounting (lock held)."""
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        keys = self._by_target.get(entry.target_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_target[entry.target_key]
+
+
+result_cache = QueryResultCache()
+
+
+def invalidate_connection_results(connection_id: int) -> None:
+    """Drop cached results for a stored connection after it changes."""
+    result_cache.invalidate_target(("connection", connection_id))
@@ -0,0 +1,101 @@
+import threading
+import time
+from typing import Optional
+
+# How often (in SQLite VM instructions) the progress handler checks the deadline
+_SQLITE_PROGRESS_STEPS = 1000
+
+
+def effective_timeout(*timeouts_ms) -> Optional[int]:
+    """The tightest of the timeouts that are set, or None."""
+    timeouts_ms = [timeout for timeout in timeouts_ms if timeout]
+    return min(timeouts_ms) if timeouts_ms else None
+
+
+class QueryTimeout(Exception):
+    """Raised when a statement was stopped by its timeout."""
+
+
+class QueryControl:
+    """
+    Deadline and cancellation for one running statement.
+
+    `attach` applies the dialect's native statement timeout to the connection
+    right after the transaction begins; `cancel` can be called from another
+    thread to abort the statement (used when the HTTP client disconnects).
+    """
+
+    def __init__(self, timeout_ms: Optional[int] = None):
+        self.timeout_ms = timeout_ms
+        self.deadline = time.monotonic() + timeout_ms / 1000 if timeout_ms else None
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._conn = None
+        self._dialect: Optional[str] = None
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def attach(self, conn) -> None:
+        """Apply the statement timeout; must run inside the query's transaction (blocking)."""
+        dialect = conn.dialect.name
+        driver_conn = conn.connection.driver_connection
+        with self._lock:
+            self._conn = conn
+            self._dialect = dialect
+        if self.cancelled:
+            raise QueryTimeout("Query was cancelled")
+        if self.timeout_ms:
+            ms = int(self.timeout_ms)
+            if dialect == "postgresql":
+                # SET LOCAL is scoped to the transaction, so pooled connections come back clean
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {ms}")
+            elif dialect == "mysql":
+                conn.exec_driver_sql(f"SET SESSION MAX_EXECUTION_TIME = {ms}")
+            elif dialect == "oracle":
+                driver_conn.callTimeout = ms
+        if dialect == "sqlite":
+            driver_conn.set_progress_handler(self._sqlite_progress, _SQLITE_PROGRESS_STEPS)
+
+    def detach(self, conn) -> None:
+        """Undo session-level settings before the connection returns to its pool (blocking)."""
+        with self._lock:
+            self._conn = None
+        dialect = conn.dialect.name
+        try:
+            driver_conn = conn.connection.driver_connection
+            if dialect == "mysql" and self.timeout_ms:
+                conn.exec_driver_sql("SET SESSION MAX_EXECUTION_TIME = 0")
+            elif dialect == "oracle" and self.timeout_ms:
+                driver_conn.callTimeout = 0
+            elif dialect == "sqlite":
+                driver_conn.set_progress_handler(None, 0)
+        except Exception:
+            # A broken connection is invalidated by the pool anyway
+            pass
+
+    def cancel(self) -> None:
+        """Abort the running statement from another thread (blocking)."""
+        with self._lock:
+            self.cancelled = True
+            conn = self._conn
+            dialect = self._dialect
+        if conn is None:
+            return
+        try:
+            driver_conn = conn.connection.driver_connection
+            if dialect in ("postgresql", "oracle"):
+                driver_conn.cancel()
+            elif dialect == "sqlite":
+                driver_conn.interrupt()
+            elif dialect == "mysql":
+                # KILL QUERY has to come from a different session
+                thread_id = driver_conn.connection_id
+                with conn.engine.connect() as killer:
+                    killer.exec_driver_sql(f"KILL QUERY {int(thread_id)}")
+        except Exception:
+            pass
+
+    def _sqlite_progress(self) -> int:
+        return 1 if self.cancelled or self.expired else 0
@@ -0,0 +1,624 @@
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional
+from sqlalchemy import update
+from myproject.app.admission import AdmissionRejected, query_scheduler
+from myproject.app.core.config import (
+    QUERY_JOB_DIR,
+    QUERY_JOB_HEARTBEAT_SECONDS,
+    QUERY_JOB_INDEX_STRIDE,
+    QUERY_JOB_MAX_PER_USER,
+    QUERY_JOB_MAX_QUEUE,
+    QUERY_JOB_MAX_RESULT_BYTES,
+    QUERY_JOB_RESULT_TTL_SECONDS,
+    QUERY_JOB_STALE_SECONDS,
+    QUERY_JOB_WORKERS,
+    STREAM_BATCH_SIZE,
+)
+from myproject.app.executors import BoundedExecutor
+from myproject.app.metrics import DB_EXECUTE_SECONDS, DB_FETCH_SECONDS, DB_ROWS, query_labels
+from myproject.app.models import QueryJobRecord, SessionLocal
+from myproject.app.query_control import QueryControl, QueryTimeout
+from myproject.app.replicas import connect
+from myproject.app.result_formats import arrow_batches, decimal_scales, empty_arrow_schema, json_default
+
+JOB_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_FINISHED = ("completed", "failed", "cancelled")
+_EPOCH = datetime(1970, 1, 1)
+
+query_job_executor = BoundedExecutor(
+    name="query-jobs", max_workers=QUERY_JOB_WORKERS, max_queue=QUERY_JOB_MAX_QUEUE
+)
+
+
+class JobLimitReached(Exception):
+    """Raised when a user already has QUERY_JOB_MAX_PER_USER unfinished jobs."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled."""
+
+
+class ResultTooLarge(Exception):
+    """Raised when a spooled result grows past QUERY_JOB_MAX_RESULT_BYTES."""
+
+
+def _to_timestamp(value: Optional[datetime]) -> Optional[float]:
+    return (value - _EPOCH).total_seconds() if value is not None else None
+
+
+def _to_datetime(value: Optional[float]) -> Optional[datetime]:
+    return datetime.utcfromtimestamp(value) if value is not None else None
+
+
+class QueryJob:
+    """A query run in the background with its result spooled to a file."""
+
+    def __init__(self, owner: str, connection_id: int, query: str, result_format: str, timeout_ms: Optional[int]):
+        self.id = secrets.token_hex(12)
+        self.owner = owner
+        self.connection_id = connection_id
+        self.query = query
+        self.format = result_format
+        self.timeout_ms = timeout_ms
+        self.status = "queued"
+        self.columns: Optional[List[str]] = None
+        self.rows = 0
+        self.bytes_written = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Byte offset of every QUERY_JOB_INDEX_STRIDE-th NDJSON row, for paging
+        self.offsets: List[int] = []
+        self.control: Optional[QueryControl] = None
+        self._cancel_requested = False
+        self._lock = threading.Lock()
+        # Serializes saves, so an older progress snapshot can't overwrite the final state
+        self._save_lock = threading.Lock()
+        self._saved_final = False
+
+    @classmethod
+    def from_record(cls, record: QueryJobRecord) -> "QueryJob":
+        """Snapshot of a persisted job, e.g. one running in another worker."""
+        job = cls.__new__(cls)
+        job.id = record.id
+        job.owner = record.created_by
+        job.connection_id = record.connection_id
+        job.query = record.query
+        job.format = record.format
+        job.timeout_ms = record.timeout_ms
+        job.status = record.status
+        job.columns = record.columns
+        job.rows = record.rows
+        job.bytes_written = record.bytes_written
+        job.error = record.error
+        job.created_at = _to_timestamp(record.created_at)
+        job.started_at = _to_timestamp(record.started_at)
+        job.finished_at = _to_timestamp(record.finished_at)
+        job.offsets = record.offsets or []
+        job.control = None
+        job._cancel_requested = record.cancel_requested
+        job._lock = threading.Lock()
+        job._save_lock = threading.Lock()
+        job._saved_final = job.finished
+        heartbeat = record.heartbeat_at or record.created_at
+        if not job.finished and heartbeat < datetime.utcnow() - timedelta(seconds=QUERY_JOB_STALE_SECONDS):
+            # Its worker stopped, e.g. on a restart; the reaper records this too
+            job.status, job.error = "failed", "Job was interrupted"
+            job.finished_at = _to_timestamp(heartbeat)
+        return job
+
+    @property
+    def path(self) -> Path:
+        return QUERY_JOB_DIR / f"{self.id}.{self.format}"
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINISHED
+
+    def begin(self) -> bool:
+        """Mark the job running; False if it was cancelled while queued."""
+        with self._lock:
+            if self._cancel_requested:
+                return False
+            # The timeout counts from here, not from submission
+            self.control = QueryControl(self.timeout_ms)
+            self.status = "running"
+            self.started_at = time.time()
+            return True
+
+    def cancel(self) -> None:
+        """Stop the job; a running statement is aborted (blocking)."""
+        with self._lock:
+            self._cancel_requested = True
+            control = self.control
+            if self.status == "queued":
+                self.status = "cancelled"
+                self.finished_at = time.time()
+        if control is not None:
+            control.cancel()
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.finished_at = time.time()
+            self.error = error
+            self.status = status
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_requested
+
+    def progress_values(self) -> dict:
+        """Columns of the job's row that change as it runs."""
+        with self._lock:
+            return {
+                "status": self.status,
+                "columns": self.columns,
+                "rows": self.rows,
+                "bytes_written": self.bytes_written,
+                "offsets": list(self.offsets) if self.finished else None,
+                "error": self.error,
+                "started_at": _to_datetime(self.started_at),
+                "finished_at": _to_datetime(self.finished_at),
+                "heartbeat_at": datetime.utcnow(),
+            }
+
+    def to_dict(self) -> dict:
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        expires_in = None
+        if self.finished_at is not None:
+            expires_in = max(0, round(self.finished_at + QUERY_JOB_RESULT_TTL_SECONDS - time.time()))
+        return {
+            "id": self.id,
+            "status": self.status,
+            "connection_id": self.connection_id,
+            "format": self.format,
+            "columns": self.columns,
+            "rows": self.rows,
+            "bytes": self.bytes_written,
+            "elapsed_seconds": round(elapsed, 3),
+            "error": self.error,
+            "expires_in_seconds": expires_in,
+        }
+
+
+class QueryJobRegistry:
+    """
+    Query jobs, persisted in the app database so any worker can report on,
+    page through or cancel them, and they survive restarts.
+
+    Jobs queued or running in this process are also kept in memory. A
+    background thread saves their progress every `heartbeat` seconds and
+    cancels the ones cancelled through another worker. An unfinished job
+    whose progress hasn't been saved for QUERY_JOB_STALE_SECONDS lost its
+    worker and is marked failed. Finished jobs and their result files are
+    removed `ttl` seconds after they finish.
+    """
+
+    def __init__(
+        self,
+        max_per_user: int = QUERY_JOB_MAX_PER_USER,
+        ttl: float = QUERY_JOB_RESULT_TTL_SECONDS,
+        heartbeat: float = QUERY_JOB_HEARTBEAT_SECONDS
+    ):
+        self.max_per_user = max_per_user
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self._local: Dict[str, QueryJob] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def add(self, job: QueryJob) -> None:
+        """Persist a new job, or raise JobLimitReached if the user is at their limit (blocking)."""
+        self._ensure_reaper()
+        stale_before = datetime.utcnow() - timedelta(seconds=QUERY_JOB_STALE_SECONDS)
+        db = SessionLocal()
+        try:
+            active = db.query(QueryJobRecord).filter(
+                QueryJobRecord.created_by == job.owner,
+                QueryJobRecord.status.in_(("queued", "running")),
+                QueryJobRecord.heartbeat_at >= stale_before
+            ).count()
+            if active >= self.max_per_user:
+                raise JobLimitReached(f"At most {self.max_per_user} query jobs can be queued or running per user")
+            db.add(QueryJobRecord(
+                id=job.id,
+                connection_id=job.connection_id,
+                query=job.query,
+                format=job.format,
+                timeout_ms=job.timeout_ms,
+                created_by=job.owner,
+                created_at=_to_datetime(job.created_at),
+                **job.progress_values()
+            ))
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            self._local[job.id] = job
+
+    def get(self, job_id: str, owner: str) -> Optional[QueryJob]:
+        """A job of `owner`, live if it runs in this process (blocking)."""
+        with self._lock:
+            job = self._local.get(job_id)
+        if job is not None:
+            return job if job.owner == owner else None
+        db = SessionLocal()
+        try:
+            record = db.query(QueryJobRecord).filter(
+                QueryJobRecord.id == job_id,
+                QueryJobRecord.created_by == owner
+            ).first()
+            return QueryJob.from_record(record) if record is not None else None
+        finally:
+            db.close()
+
+    def list(self, owner: str) -> List[QueryJob]:
+        """All jobs of `owner`, oldest first (blocking)."""
+        db = SessionLocal()
+        try:
+            records = db.query(QueryJobRecord).filter(
+                QueryJobRecord.created_by == owner
+            ).order_by(QueryJobRecord.created_at).all()
+            jobs = [QueryJob.from_record(record) for record in records]
+        finally:
+            db.close()
+        with self._lock:
+            return [self._local.get(job.id, job) for job in jobs]
+
+    def save(self, job: QueryJob) -> None:
+        """Persist a job's progress; a finished job is then no longer tracked here (blocking)."""
+        with job._save_lock:
+            if job._saved_final:
+                return
+            values = job.progress_values()
+            db = SessionLocal()
+            try:
+                # cancel_requested is left alone; other workers set it
+                db.execute(update(QueryJobRecord).where(QueryJobRecord.id == job.id).values(**values))
+                db.commit()
+            finally:
+                db.close()
+            job._saved_final = values["status"] in _FINISHED
+        if job._saved_final:
+            with self._lock:
+                self._local.pop(job.id, None)
+
+    def cancel(self, job: QueryJob) -> None:
+        """Cancel a job here, or ask the worker running it to (blocking)."""
+        with self._lock:
+            local = self._local.get(job.id)
+        if local is not None:
+            local.cancel()
+            if local.finished:
+                self.save(local)
+            return
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(QueryJobRecord).where(QueryJobRecord.id == job.id).values(cancel_requested=True)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def remove(self, job_id: str) -> None:
+        """Forget a job and delete its result file (blocking)."""
+        with self._lock:
+            self._local.pop(job_id, None)
+        db = SessionLocal()
+        try:
+            record = db.get(QueryJobRecord, job_id)
+            if record is None:
+                return
+            path = QueryJob.from_record(record).path
+            db.delete(record)
+            db.commit()
+        finally:
+            db.close()
+        _discard(path)
+
+    def sync(self) -> None:
+        """Save progress of this process's jobs and apply cancellations from other workers (blocking)."""
+        with self._lock:
+            jobs = list(self._local.values())
+        if not jobs:
+            return
+        db = SessionLocal()
+        try:
+            cancelled = {
+                job_id for (job_id,) in db.query(QueryJobRecord.id).filter(
+                    QueryJobRecord.id.in_([job.id for job in jobs]),
+                    QueryJobRecord.cancel_requested.is_(True)
+                )
+            }
+        finally:
+            db.close()
+        for job in jobs:
+            if job.id in cancelled and not job.cancel_requested:
+                job.cancel()
+            self.save(job)
+
+    def expire(self) -> int:
+        """Remove finished jobs past their TTL and orphaned result files; fail jobs that lost their worker (blocking)."""
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.ttl)
+        stale_before = now - timedelta(seconds=QUERY_JOB_STALE_SECONDS)
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(QueryJobRecord)
+                .where(QueryJobRecord.status.in_(("queued", "running")), QueryJobRecord.heartbeat_at < stale_before)
+                .values(status="failed", error="Job was interrupted", finished_at=QueryJobRecord.heartbeat_at)
+            )
+            expired = db.query(QueryJobRecord).filter(
+                QueryJobRecord.status.in_(_FINISHED),
+                QueryJobRecord.finished_at < cutoff
+            ).all()
+            paths = [QueryJob.from_record(record).path for record in expired]
+            for record in expired:
+                db.delete(record)
+            db.commit()
+            known = {job_id for (job_id,) in db.query(QueryJobRecord.id)}
+        finally:
+            db.close()
+        for path in paths:
+            _discard(path)
+        if QUERY_JOB_DIR.is_dir():
+            cutoff_ts = time.time() - self.ttl
+            for path in QUERY_JOB_DIR.iterdir():
+                # Files without a job row, e.g. left by a crash while it was being removed
+                if path.name.split(".")[0] not in known and path.stat().st_mtime < cutoff_ts:
+                    _discard(path)
+        return len(paths)
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is not None:
+            return
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, name="query-job-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self) -> None:
+        expire_every = min(60.0, self.ttl / 2)
+        expired_at = 0.0
+        while True:
+            try:
+                self.sync()
+                if time.monotonic() - expired_at >= expire_every:
+                    expired_at = time.monotonic()
+                    self.expire()
+            except Exception:
+                pass
+            time.sleep(self.heartbeat)
+
+
+query_job_registry = QueryJobRegistry()
+
+
+def _discard(path: Path) -> None:
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _checked_batches(job: QueryJob, partitions, labels):
+    """Yield row batches, stopping when the job is cancelled; records fetch time."""
+    fetching = 0.0
+    try:
+        while True:
+            if job.cancel_requested:
+                raise JobCancelled("Job was cancelled")
+            if job.control.expired:
+                raise QueryTimeout(f"Query exceeded its {job.timeout_ms} ms timeout")
+            started = time.perf_counter()
+            batch = next(partitions, None)
+            fetching += time.perf_counter() - started
+            if batch is None:
+                return
+            yield batch
+    finally:
+        DB_FETCH_SECONDS.observe(fetching, *labels)
+
+
+def _write_ndjson(path: Path, job: QueryJob, batches) -> None:
+    columns = job.columns
+    with open(path, "wb") as f:
+        written = 0
+        for batch in batches:
+            buffer = bytearray()
+            for row in batch:
+                if job.rows % QUERY_JOB_INDEX_STRIDE == 0:
+                    job.offsets.append(written + len(buffer))
+                buffer += json.dumps(
+                    dict(zip(columns, row)), separators=(",", ":"), default=json_default
+                ).encode("utf-8")
+                buffer += b"\n"
+                job.rows += 1
+            written += len(buffer)
+            if written > QUERY_JOB_MAX_RESULT_BYTES:
+                raise ResultTooLarge(f"Result exceeds {QUERY_JOB_MAX_RESULT_BYTES} bytes")
+            f.write(buffer)
+            job.bytes_written = written
+
+
+def _write_parquet(path: Path, job: QueryJob, batches, scales=None) -> None:
+    """
+    One zstd-compressed row group per fetched batch.
+
+    When a later batch widens a column's type (see arrow_batches), the row
+    groups written so far are rewritten with the wider schema.
+    """
+    import pyarrow.parquet as pq
+
+    f = open(path, "wb")
+    writer = None
+    try:
+        for record_batch in arrow_batches(job.columns, batches, scales):
+            if writer is not None and not record_batch.schema.equals(writer.schema):
+                writer.close()
+                f.close()
+                f, writer = _widen_parquet(path, record_batch.schema)
+            if writer is None:
+                writer = pq.ParquetWriter(f, record_batch.schema, compression="zstd")
+            writer.write_batch(record_batch)
+            job.rows += record_batch.num_rows
+            job.bytes_written = f.tell()
+            if job.bytes_written > QUERY_JOB_MAX_RESULT_BYTES:
+                raise ResultTooLarge(f"Result exceeds {QUERY_JOB_MAX_RESULT_BYTES} bytes")
+        if writer is None:
+            writer = pq.ParquetWriter(f, empty_arrow_schema(job.columns))
+        writer.close()
+        job.bytes_written = f.tell()
+    finally:
+        if writer is not None:
+            writer.close()
+        f.close()
+
+
+def _widen_parquet(path: Path, schema):
+    """Copy a partly written spool into one with `schema`; return its open file and writer."""
+    import pyarrow.parquet as pq
+
+    widened = path.with_name(path.name + ".widen")
+    f = open(widened, "wb")
+    writer = pq.ParquetWriter(f, schema, compression="zstd")
+    try:
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=STREAM_BATCH_SIZE):
+            writer.write_batch(record_batch.cast(schema))
+        os.replace(widened, path)
+    except BaseException:
+        writer.close()
+        f.close()
+        _discard(widened)
+        raise
+    return f, writer
+
+
+def run_query_job(job: QueryJob, target: dict, statement, params, admission_key: Hashable) -> None:
+    """
+    Execute a job's query and spool its rows to disk (blocking, on the job executor).
+
+    The job stays queued until admission control gives it a slot on its
+    connection, like a /db/query call; it waits as long as that takes.
+    """
+    try:
+        ticket = query_scheduler.acquire_blocking(job.owner, admission_key, stop=lambda: job.cancel_requested)
+    except AdmissionRejected as e:
+        job.finish("failed", str(e))
+        query_job_registry.save(job)
+        return
+    if ticket is None:
+        # Cancelled while waiting; the cancellation already finished the job
+        return
+    try:
+        _run_admitted_job(job, target, statement, params)
+    finally:
+        query_scheduler.release(ticket)
+
+
+def _run_admitted_job(job: QueryJob, target: dict, statement, params) -> None:
+    if not job.begin():
+        return
+    query_job_registry.save(job)
+    labels = query_labels(target["db_type"], target.get("connection_id"))
+    partial = job.path.with_name(job.path.name + ".partial")
+    status, error = "completed", None
+    try:
+        QUERY_JOB_DIR.mkdir(parents=True, exist_ok=True)
+        conn = connect(target)
+        trans = None
+        try:
+            trans = conn.begin()
+            job.control.attach(conn)
+            with DB_EXECUTE_SECONDS.time(*labels):
+                result = conn.execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE).execute(
+                    statement, params
+                )
+            try:
+                if not result.returns_rows:
+                    raise ValueError("Query jobs need a statement that returns rows")
+                job.columns = list(result.keys())
+                batches = _checked_batches(job, result.partitions(STREAM_BATCH_SIZE), labels)
+                if job.format == "parquet":
+                    _write_parquet(partial, job, batches, decimal_scales(result.cursor.description))
+                else:
+                    _write_ndjson(partial, job, batches)
+            finally:
+                result.close()
+            trans.commit()
+        finally:
+            if trans is not None and trans.is_active:
+                trans.rollback()
+            job.control.detach(conn)
+            conn.close()
+        os.replace(partial, job.path)
+    except Exception as e:
+        _discard(partial)
+        if job.cancel_requested:
+            status, error = "cancelled", "Job was cancelled"
+        elif job.control.expired:
+            status, error = "failed", f"Query exceeded its {job.timeout_ms} ms timeout"
+        else:
+            status, error = "failed", str(e)
+    finally:
+        job.finish(status, error)
+        DB_ROWS.inc(job.rows, *labels)
+        query_job_registry.save(job)
+
+
+def read_page(job: QueryJob, offset: int, limit: int) -> List[dict]:
+    """Rows `offset` .. `offset + limit` of a completed job's result (blocking)."""
+    if offset >= job.rows:
+        return []
+    if job.format == "parquet":
+        return _read_parquet_page(job.path, offset, limit)
+
+    # Seek to the nearest indexed row, then skip at most QUERY_JOB_INDEX_STRIDE - 1 lines
+    index = offset // QUERY_JOB_INDEX_STRIDE
+    rows = []
+    with open(job.path, "rb") as f:
+        f.seek(job.offsets[index])
+        for _ in range(offset - index * QUERY_JOB_INDEX_STRIDE):
+            f.readline()
+        for _ in range(limit):
+            line = f.readline()
+            if not line:
+                break
+            rows.append(json.loads(line))
+    return rows
+
+
+def _read_parquet_page(path: Path, offset: int, limit: int) -> List[dict]:
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    groups = []
+    first_row = 0
+    group_start = 0
+    for index in range(parquet_file.num_row_groups):
+        group_rows = parquet_file.metadata.row_group(index).num_rows
+        if group_start + group_rows > offset and group_start < offset + limit:
+            if not groups:
+                first_row = group_start
+            groups.append(index)
+        group_start += group_rows
+    if not groups:
+        return []
+    table = parquet_file.read_row_groups(groups)
+    return table.slice(offset - first_row, limit).to_pylist()
@@ -0,0 +1,112 @@
+import secrets
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from myproject.app.statements import prepare_statement
+
+# Plan statement prefix per SQLAlchemy dialect: (plain, analyze); None means no ANALYZE variant
+_EXPLAIN_PREFIXES = {
+    "postgresql": ("EXPLAIN ", "EXPLAIN (ANALYZE, BUFFERS) "),
+    "mysql": ("EXPLAIN ", "EXPLAIN ANALYZE "),
+    "sqlite": ("EXPLAIN QUERY PLAN ", None),
+}
+
+
+class QueryTimings:
+    """
+    Wall-clock milliseconds spent in each phase of one query.
+
+    Created when the request is accepted; `start` marks the moment an
+    executor thread picked the work up, so the gap is reported as `queue`.
+    """
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.rows: Optional[int] = None
+
+    def start(self) -> None:
+        self.phases["queue"] = (time.perf_counter() - self.created) * 1000
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name: str, ms: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.created) * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        """Rounded per-phase timings plus the total so far."""
+        timings = {name: round(ms, 3) for name, ms in self.phases.items()}
+        timings["total"] = round(self.total_ms, 3)
+        return timings
+
+
+def _plan_rows(result, dialect: str) -> List:
+    rows = result.fetchall()
+    if dialect == "sqlite":
+        return [row._mapping["detail"] for row in rows]
+    if rows and len(rows[0]) == 1:
+        # PostgreSQL, MySQL's ANALYZE tree and DBMS_XPLAN output are one line per row
+        return [row[0] for row in rows]
+    return [dict(row._mapping) for row in rows]
+
+
+def explain_plan(conn, query: str, params=None, analyze: bool = False) -> Tuple[List, bool]:
+    """
+    Return the dialect's plan for a query and whether it was measured (blocking).
+
+    PostgreSQL uses EXPLAIN / EXPLAIN (ANALYZE, BUFFERS), MySQL EXPLAIN /
+    EXPLAIN ANALYZE, SQLite EXPLAIN QUERY PLAN and Oracle EXPLAIN PLAN with
+    DBMS_XPLAN.DISPLAY. ANALYZE runs the statement again, so call this
+    inside a transaction that is rolled back afterwards (Oracle's plan table
+    rows are discarded the same way). SQLite and Oracle plans are never
+    analyzed.
+    """
+    dialect = conn.dialect.name
+    if dialect == "oracle":
+        statement_id = secrets.token_hex(8)
+        statement, bind_params = prepare_statement(
+            f"EXPLAIN PLAN SET STATEMENT_ID = '{statement_id}' FOR {query}", params
+        )
+        conn.execute(statement, bind_params)
+        result = conn.execute(
+            text("SELECT plan_table_output FROM TABLE(DBMS_XPLAN.DISPLAY('PLAN_TABLE', :statement_id, 'TYPICAL'))"),
+            {"statement_id": statement_id}
+        )
+        return _plan_rows(result, dialect), False
+
+    if dialect not in _EXPLAIN_PREFIXES:
+        raise ValueError(f"EXPLAIN is not supported for {dialect}")
+    plain, analyzed = _EXPLAIN_PREFIXES[dialect]
+    analyze = analyze and analyzed is not None
+    statement, bind_params = prepare_statement((analyzed if analyze else plain) + query, params)
+    return _plan_rows(conn.execute(statement, bind_params), dialect), analyze
+
+
+def profile_section(
+    timings: QueryTimings,
+    plan: Optional[List],
+    analyzed: bool,
+    fingerprint: str,
+    plan_error: Optional[str] = None
+) -> dict:
+    section = {
+        "timings_ms": timings.as_dict(),
+        "rows": timings.rows,
+        "plan": plan,
+        "plan_analyzed": analyzed,
+        "fingerprint": fingerprint,
+    }
+    if plan_error is not None:
+        section["plan_error"] = plan_error
+    return section
@@ -0,0 +1,232 @@
+import itertools
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from myproject.app.core.config import (
+    REPLICA_BALANCING,
+    REPLICA_EJECT_AFTER_FAILURES,
+    REPLICA_EJECT_SECONDS,
+    REPLICA_HEALTH_CHECK_SECONDS,
+    REPLICA_READ_YOUR_WRITES_SECONDS,
+)
+from myproject.app.database import engine_registry, get_connection, make_engine_key
+from myproject.app.metrics import DB_READ_ROUTING, register_collector
+
+# Locking reads that is_read_only lets through (FOR UPDATE and LOCK ... are already writes)
+_LOCKING_READ_RE = re.compile(r"\bfor\s+(?:key\s+)?share\b", re.IGNORECASE)
+
+
+class _ReplicaHealth:
+    __slots__ = ("target", "failures", "ejected_at")
+
+    def __init__(self, target: dict):
+        self.target = target
+        self.failures = 0
+        self.ejected_at: Optional[float] = None
+
+
+class ReplicaRouter:
+    """
+    Picks the endpoint for reads on stored connections that have replicas.
+
+    Balancing is least-outstanding-requests (the connections checked out of
+    each replica's pool) or round-robin. A replica that fails
+    `eject_after` connects in a row is ejected; a background check probes
+    it every `check_interval` seconds once `eject_seconds` have passed and
+    puts it back when it answers. With no healthy replica, reads go to the
+    primary.
+
+    After a user writes through a connection, their reads on it go to the
+    primary for `sticky_seconds`, so they see their own writes despite
+    replica lag. This is tracked per process.
+    """
+
+    def __init__(
+        self,
+        policy: str = REPLICA_BALANCING,
+        eject_after: int = REPLICA_EJECT_AFTER_FAILURES,
+        eject_seconds: float = REPLICA_EJECT_SECONDS,
+        check_interval: float = REPLICA_HEALTH_CHECK_SECONDS,
+        sticky_seconds: float = REPLICA_READ_YOUR_WRITES_SECONDS
+    ):
+        self.policy = policy
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.check_interval = check_interval
+        self.sticky_seconds = sticky_seconds
+        self._health: Dict[Tuple, _ReplicaHealth] = {}
+        self._turns: Dict[int, itertools.count] = {}
+        self._writes: Dict[Tuple[str, int], float] = {}
+        self._lock = threading.Lock()
+        self._checker: Optional[threading.Thread] = None
+
+    def read_target(self, record, query: str, owner: str) -> dict:
+        """
+        Target for a read-only statement on a stored connection.
+
+        Either the primary's target, or the primary's with the chosen
+        replica's target under "read_replica"; open it with `connect`.
+        """
+        target = record.to_target()
+        if not record.replicas or _LOCKING_READ_RE.search(query) or self.wrote_recently(owner, record.id):
+            return target
+        replica = self._choose(target, record.replicas)
+        DB_READ_ROUTING.inc(1, str(record.id), replica["replica"] if replica else "primary")
+        if replica is None:
+            return target
+        return {**target, "read_replica": replica}
+
+    def note_write(self, owner: str, connection_id: int) -> None:
+        """Start the user's read-your-writes window on a connection."""
+        if self.sticky_seconds <= 0:
+            return
+        self._ensure_checker()
+        with self._lock:
+            self._writes[(owner, connection_id)] = time.monotonic()
+
+    def wrote_recently(self, owner: str, connection_id: int) -> bool:
+        written_at = self._writes.get((owner, connection_id))
+        return written_at is not None and time.monotonic() - written_at < self.sticky_seconds
+
+    def record_failure(self, replica: dict) -> None:
+        key = make_engine_key(**replica)
+        with self._lock:
+            health = self._health.setdefault(key, _ReplicaHealth(replica))
+            health.failures += 1
+            if health.failures >= self.eject_after and health.ejected_at is None:
+                health.ejected_at = time.monotonic()
+
+    def record_success(self, replica: dict) -> None:
+        health = self._health.get(make_engine_key(**replica))
+        if health is not None and health.failures:
+            with self._lock:
+                health.failures = 0
+
+    def forget(self, connection_id: int) -> None:
+        """Drop health state of a stored connection's replicas after it changes."""
+        with self._lock:
+            for key in [key for key in self._health if key[1] == connection_id]:
+                del self._health[key]
+            self._turns.pop(connection_id, None)
+
+    def status(self, record) -> List[dict]:
+        """Health and load of each of a stored connection's replicas."""
+        now = time.monotonic()
+        endpoints = []
+        for endpoint in record.replicas or []:
+            key = make_engine_key(**_replica_target(record.to_target(), endpoint))
+            health = self._health.get(key)
+            ejected_at = health.ejected_at if health is not None else None
+            endpoints.append({
+                "host": endpoint["host"],
+                "port": endpoint["port"],
+                "healthy": ejected_at is None,
+                "consecutive_failures": health.failures if health is not None else 0,
+                "ejected_seconds": round(now - ejected_at, 1) if ejected_at is not None else None,
+                "outstanding": engine_registry.checked_out(key),
+            })
+        return endpoints
+
+    def check(self) -> None:
+        """Probe ejected replicas and readmit the ones that answer; prune old writes (blocking)."""
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                health for health in self._health.values()
+                if health.ejected_at is not None and now - health.ejected_at >= self.eject_seconds
+            ]
+            for key in [key for key, written_at in self._writes.items() if now - written_at >= self.sticky_seconds]:
+                del self._writes[key]
+        for health in due:
+            try:
+                # The pool pings the connection before handing it out
+                get_connection(**health.target).close()
+            except Exception:
+                with self._lock:
+                    health.ejected_at = time.monotonic()
+                continue
+            with self._lock:
+                health.failures = 0
+                health.ejected_at = None
+
+    def _choose(self, primary: dict, endpoints: List[dict]) -> Optional[dict]:
+        connection_id = primary["connection_id"]
+        replicas = [_replica_target(primary, endpoint) for endpoint in endpoints]
+        with self._lock:
+            turn = next(self._turns.setdefault(connection_id, itertools.count()))
+            healthy = []
+            for replica in replicas:
+                health = self._health.get(make_engine_key(**replica))
+                if health is None or health.ejected_at is None:
+                    healthy.append(replica)
+        if not healthy:
+            return None
+        # Rotate so ties (e.g. all idle) are spread instead of always hitting the first
+        start = turn % len(healthy)
+        rotated = healthy[start:] + healthy[:start]
+        if self.policy == "round_robin":
+            return rotated[0]
+        return min(rotated, key=lambda replica: engine_registry.checked_out(make_engine_key(**replica)))
+
+    def _ensure_checker(self) -> None:
+        if self._checker is not None:
+            return
+        with self._lock:
+            if self._checker is not None:
+                return
+            self._checker = threading.Thread(target=self._check_forever, name="replica-health", daemon=True)
+            self._checker.start()
+
+    def _check_forever(self) -> None:
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.check()
+            except Exception:
+                pass
+
+
+def _replica_target(primary: dict, endpoint: dict) -> dict:
+    return {
+        **primary,
+        "host": endpoint["host"],
+        "port": endpoint["port"],
+        "replica": f"{endpoint['host']}:{endpoint['port']}",
+    }
+
+
+replica_router = ReplicaRouter()
+
+
+def connect(target: dict):
+    """
+    Get a pooled connection for a target from `read_target` or `to_target` (blocking).
+
+    When the chosen replica can't be reached the failure is counted against
+    it and the primary is used instead; nothing has run yet, so this is safe.
+    """
+    replica = target.get("read_replica")
+    if replica is None:
+        return get_connection(**target)
+    replica_router._ensure_checker()
+    try:
+        conn = get_connection(**replica)
+    except ConnectionError:
+        replica_router.record_failure(replica)
+        primary = {key: value for key, value in target.items() if key != "read_replica"}
+        return get_connection(**primary)
+    replica_router.record_success(replica)
+    return conn
+
+
+def _replica_metrics():
+    with replica_router._lock:
+        items = list(replica_router._health.items())
+    yield "db_replica_ejected", "gauge", "1 while a read replica is ejected after failing.", [
+        ({"connection": str(key[1]), "endpoint": key[2]}, 1 if health.ejected_at is not None else 0)
+        for key, health in items
+    ]
+
+
+register_collector(_replica_metrics)
@@ -0,0 +1,318 @@
+import csv
+import io
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+# Formats that are streamed batch by batch instead of returned as one document
+STREAM_FORMATS = ("ndjson", "csv", "arrow", "msgpack")
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "msgpack": "application/x-msgpack",
+}
+
+# Binary formats rely on optional packages
+_OPTIONAL_MODULES = {"arrow": "pyarrow", "msgpack": "msgpack", "parquet": "pyarrow"}
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """Pick the response format from the `format` query parameter or Accept header."""
+    if requested:
+        return requested
+    if accept:
+        for media_range in accept.split(","):
+            media_type = media_range.split(";")[0].strip().lower()
+            for fmt, known in MEDIA_TYPES.items():
+                if media_type == known:
+                    return fmt
+    return "json"
+
+
+def format_available(fmt: str) -> bool:
+    """Whether the optional package behind a response format is installed."""
+    module = _OPTIONAL_MODULES.get(fmt)
+    if module is None:
+        return True
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+def json_default(value):
+    """Serialize values the json module does not handle, like FastAPI does."""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode("utf-8", errors="replace")
+    return str(value)
+
+
+def encode_batches(
+    fmt: str,
+    columns: List[str],
+    batches: Iterable[Sequence[Sequence]],
+    scales: Optional[List[Optional[int]]] = None
+) -> Iterator[bytes]:
+    """
+    Encode row batches into chunks of the requested streaming format.
+
+    `scales` are the declared decimal scales used to type arrow columns
+    (see decimal_scales).
+    """
+    if fmt == "ndjson":
+        for batch in batches:
+            yield "".join(
+                json.dumps(dict(zip(columns, row)), default=json_default) + "\n"
+                for row in batch
+            ).encode("utf-8")
+    elif fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue().encode("utf-8")
+        for batch in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(batch)
+            yield buffer.getvalue().encode("utf-8")
+    elif fmt == "arrow":
+        yield from _encode_arrow(columns, batches, scales)
+    elif fmt == "msgpack":
+        yield from _encode_msgpack(columns, batches)
+    else:
+        raise ValueError(f"Unsupported streaming format: {fmt}")
+
+
+# Decimal columns without a declared scale start at decimal128(38, 18), Spark's
+# default, so later values with more fractional digits still fit the stream
+_DEFAULT_DECIMAL_SCALE = 18
+_MAX_DECIMAL_PRECISION = 38
+
+
+def decimal_scales(description) -> Optional[List[Optional[int]]]:
+    """
+    Declared scale of each NUMERIC/DECIMAL column in a DB-API cursor description.
+
+    Drivers that report it (psycopg2 for NUMERIC(p, s), cx_Oracle for
+    NUMBER(p, s)) give it in the precision/scale fields; other columns and
+    drivers give None.
+    """
+    if not description:
+        return None
+    scales = []
+    for entry in description:
+        precision, scale = (entry[4], entry[5]) if len(entry) > 5 else (None, None)
+        if (
+            isinstance(precision, int) and isinstance(scale, int)
+            and 0 < precision <= _MAX_DECIMAL_PRECISION and 0 <= scale <= precision
+        ):
+            scales.append(scale)
+        else:
+            scales.append(None)
+    return scales
+
+
+def arrow_batches(
+    columns: List[str],
+    batches: Iterable[Sequence[Sequence]],
+    scales: Optional[List[Optional[int]]] = None
+):
+    """
+    Convert row batches into Arrow record batches.
+
+    Column types are inferred from the first batch, with decimals at
+    precision 38 and the declared scale from `scales` (see decimal_scales)
+    or at least _DEFAULT_DECIMAL_SCALE. Columns that are all NULL in the
+    first batch become strings.
+
+    A later batch that does not fit widens the schema: decimals to the
+    larger scale, integers mixed with floats to float64, and anything else
+    that conflicts to strings. Batches after that carry the wider schema,
+    so callers writing a single-schema format must handle the change.
+    """
+    import pyarrow as pa
+
+    schema = None
+    for batch in batches:
+        column_values = list(zip(*batch)) if batch else [() for _ in columns]
+        if schema is None:
+            fields = []
+            for index, (name, values) in enumerate(zip(columns, column_values)):
+                column_type = _initial_arrow_type(_inferred_arrow_type(values), scales[index] if scales else None)
+                fields.append(pa.field(name, column_type))
+            schema = pa.schema(fields)
+
+        arrays = []
+        for index, values in enumerate(column_values):
+            column_type = _widen_arrow_type(schema.field(index).type, _inferred_arrow_type(values))
+            array = _arrow_array(values, column_type)
+            if not array.type.equals(schema.field(index).type):
+                schema = schema.set(index, pa.field(columns[index], array.type))
+            arrays.append(array)
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _inferred_arrow_type(values):
+    """Arrow type pyarrow infers for a column of values, or string when they do not share one."""
+    import pyarrow as pa
+
+    try:
+        return pa.array(values).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return pa.string()
+
+
+def _initial_arrow_type(inferred, scale: Optional[int]):
+    import pyarrow as pa
+
+    if pa.types.is_null(inferred):
+        return pa.string()
+    if pa.types.is_integer(inferred):
+        return pa.int64()
+    if pa.types.is_floating(inferred):
+        return pa.float64()
+    if pa.types.is_decimal(inferred):
+        integer_digits = inferred.precision - inferred.scale
+        if scale is None:
+            scale = min(_DEFAULT_DECIMAL_SCALE, _MAX_DECIMAL_PRECISION - integer_digits)
+        scale = max(scale, inferred.scale)
+        if integer_digits + scale > _MAX_DECIMAL_PRECISION:
+            return pa.string()
+        return pa.decimal128(_MAX_DECIMAL_PRECISION, scale)
+    return inferred
+
+
+def _widen_arrow_type(current, inferred):
+    """Narrowest type holding values of both `current` and `inferred` without loss."""
+    import pyarrow as pa
+
+    if pa.types.is_null(inferred) or current.equals(inferred):
+        return current
+    if pa.types.is_string(current):
+        return current
+    if pa.types.is_decimal(current):
+        if pa.types.is_integer(inferred):
+            return current
+        if pa.types.is_decimal(inferred):
+            scale = max(current.scale, inferred.scale)
+            if inferred.precision - inferred.scale + scale > _MAX_DECIMAL_PRECISION:
+                return pa.string()
+            return pa.decimal128(_MAX_DECIMAL_PRECISION, scale)
+        if pa.types.is_floating(inferred):
+            return pa.float64()
+    numeric = (pa.types.is_integer, pa.types.is_floating)
+    if any(check(current) for check in numeric) and any(check(inferred) for check in numeric):
+        if pa.types.is_integer(current) and pa.types.is_integer(inferred):
+            return current if inferred.bit_width <= 64 and pa.types.is_signed_integer(inferred) else pa.string()
+        return pa.float64()
+    if pa.types.is_floating(current) and pa.types.is_decimal(inferred):
+        return current
+    if pa.types.is_integer(current) and pa.types.is_decimal(inferred):
+        return _widen_arrow_type(_initial_arrow_type(inferred, None), pa.int64())
+    return pa.string()
+
+
+def _arrow_array(values, column_type):
+    """Build an array of `column_type`, falling back to strings if a value does not fit."""
+    import pyarrow as pa
+
+    if not pa.types.is_string(column_type):
+        try:
+            return pa.array(values).cast(column_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OverflowError):
+            pass
+    return pa.array(
+        [value if value is None or isinstance(value, str) else str(value) for value in values],
+        type=pa.string()
+    )
+
+
+def empty_arrow_schema(columns: List[str]):
+    """Schema for a result without rows, when no types could be inferred."""
+    import pyarrow as pa
+
+    return pa.schema([pa.field(name, pa.null()) for name in columns])
+
+
+def _encode_arrow(
+    columns: List[str],
+    batches: Iterable[Sequence[Sequence]],
+    scales: Optional[List[Optional[int]]] = None
+) -> Iterator[bytes]:
+    """
+    Encode row batches as an Arrow IPC stream.
+
+    The stream's schema is sent with the first batch and cannot change, so a
+    later batch that widened the schema is cast back to it. That works when
+    no value changes (smaller-scale decimals, integers into a float column);
+    otherwise the stream fails rather than send altered values.
+    """
+    import pyarrow as pa
+
+    sink = io.BytesIO()
+    writer = None
+    schema = None
+
+    def _drain() -> bytes:
+        chunk = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return chunk
+
+    for record_batch in arrow_batches(columns, batches, scales):
+        if writer is None:
+            schema = record_batch.schema
+            writer = pa.ipc.new_stream(sink, schema)
+        elif not record_batch.schema.equals(schema):
+            record_batch = _cast_record_batch(record_batch, schema)
+        writer.write_batch(record_batch)
+        yield _drain()
+
+    if writer is None:
+        writer = pa.ipc.new_stream(sink, empty_arrow_schema(columns))
+    writer.close()
+    yield _drain()
+
+
+def _cast_record_batch(record_batch, schema):
+    """Cast a record batch to `schema`, raising ValueError if a value would change."""
+    import pyarrow as pa
+
+    arrays = []
+    for field, array in zip(schema, record_batch.columns):
+        try:
+            if pa.types.is_string(array.type) and not pa.types.is_string(field.type):
+                # Values that only fit as text would be parsed back, not kept as sent
+                raise pa.ArrowInvalid(f"{field.name} widened to string")
+            arrays.append(array.cast(field.type))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ValueError(
+                f"Column {field.name!r} has values that do not fit its {field.type} type in the Arrow stream "
+                f"(they need {array.type}); request ndjson, csv or msgpack instead"
+            ) from e
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _encode_msgpack(columns: List[str], batches: Iterable[Sequence[Sequence]]) -> Iterator[bytes]:
+    """
+    Encode row batches as a sequence of column-oriented msgpack objects.
+
+    The first object is `{"columns": [...]}`; each following object is
+    `{"rows": n, "data": [[column 0 values], [column 1 values], ...]}`.
+    """
+    import msgpack
+
+    packer = msgpack.Packer(default=json_default)
+    yield packer.pack({"columns": columns})
+    for batch in batches:
+        column_values = [list(values) for values in zip(*batch)] if batch else [[] for _ in columns]
+        yield packer.pack({"rows": len(batch), "data": column_values})
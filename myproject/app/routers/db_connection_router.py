@@ -8,6 +8,10 @@ from myproject.app.schemas.user_schema import (
     DatabaseConnectionUpdate
 )
 from myproject.app.auth import get_current_user
+from myproject.app.connection_cache import bump_connections_version, connection_cache
+from myproject.app.database import dispose_connection_engines
+from myproject.app.query_cache import invalidate_connection_results
+from myproject.app.replicas import replica_router
 
 router = APIRouter(prefix="/db-connections", tags=["Database Connections"])
 
@@ -40,14 +44,17 @@ async def create_db_connection(
         database=connection_data.database,
         username=connection_data.username,
         password=connection_data.password,
+        timeout_ms=connection_data.timeout_ms,
+        replicas=[replica.dict() for replica in connection_data.replicas] if connection_data.replicas else None,
         created_by=current_user
     )
     
     db.add(new_connection)
+    bump_connections_version(db)
     db.commit()
     db.refresh(new_connection)
     
-    return new_connection
+    return connection_cache.store(db, new_connection)
 
 
 @router.get("", response_model=List[DatabaseConnectionResponse])
@@ -56,10 +63,7 @@ async def list_db_connections(
     db: Session = Depends(get_db)
 ):
     """List all database connections for the current user."""
-    connections = db.query(DatabaseConnection).filter(
-        DatabaseConnection.created_by == current_user
-    ).all()
-    return connections
+    return connection_cache.list(db, current_user)
 
 
 @router.get("/{connection_id}", response_model=DatabaseConnectionResponse)
@@ -69,10 +73,7 @@ async def get_db_connection(
     db: Session = Depends(get_db)
 ):
     """Get a specific database connection by ID."""
-    connection = db.query(DatabaseConnection).filter(
-        DatabaseConnection.id == connection_id,
-        DatabaseConnection.created_by == current_user
-    ).first()
+    connection = connection_cache.get(db, connection_id, current_user)
     
     if not connection:
         raise HTTPException(
@@ -83,6 +84,24 @@ async def get_db_connection(
     return connection
 
 
+@router.get("/{connection_id}/replicas")
+async def get_db_connection_replicas(
+    connection_id: int,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Health and outstanding requests of a connection's read replicas in this process."""
+    connection = connection_cache.get(db, connection_id, current_user)
+    
+    if not connection:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Database connection not found"
+        )
+    
+    return {"balancing": replica_router.policy, "replicas": replica_router.status(connection)}
+
+
 @router.put("/{connection_id}", response_model=DatabaseConnectionResponse)
 async def update_db_connection(
     connection_id: int,
@@ -107,10 +126,17 @@ async def update_db_connection(
     for field, value in update_data.items():
         setattr(connection, field, value)
     
+    bump_connections_version(db)
     db.commit()
     db.refresh(connection)
+    record = connection_cache.store(db, connection)
     
-    return connection
+    # Pooled connections were opened with the old settings
+    dispose_connection_engines(connection_id)
+    invalidate_connection_results(connection_id)
+    replica_router.forget(connection_id)
+    
+    return record
 
 
 @router.delete("/{connection_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -132,7 +158,12 @@ async def delete_db_connection(
         )
     
     db.delete(connection)
+    bump_connections_version(db)
     db.commit()
+    connection_cache.remove(db, connection_id, current_user)
+    dispose_connection_engines(connection_id)
+    invalidate_connection_results(connection_id)
+    replica_router.forget(connection_id)
     
     return None
 
@@ -1,77 +1,226 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy import text
+import asyncio
+import json
+import time
+import weakref
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from myproject.app.schemas.db_schema import DBRequest
-from myproject.app.database import get_connection
+from typing import Optional
+from myproject.app.core.config import (
+    ALLOW_SQLITE_TARGETS,
+    STREAM_BATCH_SIZE,
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_QUERY_TIMEOUT_MS,
+    DISCONNECT_POLL_SECONDS,
+    FANOUT_MAX_CONCURRENCY,
+    FANOUT_QUEUE_BATCHES,
+)
+from myproject.app.schemas.db_schema import DBRequest, FanOutRequest
+from myproject.app.database import make_engine_key
+from myproject.app.executors import (
+    ExecutorSaturated,
+    get_query_executor,
+    iterate_in_executor,
+    query_executor_stats,
+)
+from myproject.app.admission import AdmissionRejected, query_scheduler
 from myproject.app.auth import get_current_user
-from myproject.app.models import DatabaseConnection, get_db
+from myproject.app.metrics import (
+    DB_EXECUTE_SECONDS,
+    DB_FETCH_SECONDS,
+    DB_ROWS,
+    QUERY_LABELS_STATE,
+    query_labels,
+)
+from myproject.app.connection_cache import connection_cache
+from myproject.app.fanout import ShardCursor, merge_ordered, ordered_query
+from myproject.app.models import get_db
+from myproject.app.query_cache import is_read_only, result_cache
+from myproject.app.replicas import connect, replica_router
+from myproject.app.statements import prepare_statement
+from myproject.app.query_control import QueryControl, QueryTimeout, effective_timeout
+from myproject.app.query_profile import QueryTimings, explain_plan, profile_section
+from myproject.app.slow_queries import slow_query_log, statement_fingerprint
+from myproject.app.pagination import (
+    CursorLimitReached,
+    HeldCursor,
+    cursor_registry,
+    decode_page_token,
+    encode_page_token,
+    keyset_query,
+    query_fingerprint,
+    validate_key_column,
+)
+from myproject.app.result_formats import (
+    MEDIA_TYPES,
+    STREAM_FORMATS,
+    decimal_scales,
+    encode_batches,
+    format_available,
+    json_default,
+    negotiate_format,
+)
 
 router = APIRouter(prefix="/db", tags=["Database"])
 
 
-@router.post("/query")
-async def run_query(
-    data: DBRequest,
-    current_user: str = Depends(get_current_user),  # Protected endpoint - requires authentication
-    db: Session = Depends(get_db)
-):
+def _resolve_target(data: DBRequest, current_user: str, db: Session):
     """
-    Execute a SQL query on the specified database.
-    
-    Requires JWT authentication. Supports Oracle, PostgreSQL, and MySQL.
-    Can use stored connection by ID or provide connection parameters directly.
+    Resolve the connection parameters for a query request.
+
+    Returns `(target, timeout_ms, stored_conn)` where `timeout_ms` is the
+    stored connection's statement timeout, if any, and `stored_conn` is
+    None for ad-hoc targets.
     """
-    conn = None
-    try:
-        # If connection_id is provided, use stored connection
-        if data.connection_id:
-            stored_conn = db.query(DatabaseConnection).filter(
-                DatabaseConnection.id == data.connection_id,
-                DatabaseConnection.created_by == current_user
-            ).first()
-            
-            if not stored_conn:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Database connection not found"
-                )
-            
-            conn = get_connection(
-                db_type=stored_conn.db_type,
-                host=stored_conn.host,
-                port=stored_conn.port,
-                database=stored_conn.database,
-                username=stored_conn.username,
-                password=stored_conn.password
-            )
-            db_type = stored_conn.db_type
-        else:
-            # Use provided connection parameters
-            if not data.db_type:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Either connection_id or db_type must be provided"
-                )
-            
-            conn = get_connection(
-                db_type=data.db_type,
-                host=data.host,
-                port=data.port,
-                database=data.database,
-                username=data.username,
-                password=data.password
+    # If connection_id is provided, use stored connection
+    if data.connection_id:
+        stored_conn = connection_cache.get(db, data.connection_id, current_user)
+
+        if not stored_conn:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Database connection not found"
             )
-            db_type = data.db_type
-        
-        # Execute query using text() for SQLAlchemy 2.0 compatibility
+
+        return stored_conn.to_target(), stored_conn.timeout_ms, stored_conn
+
+    # Use provided connection parameters
+    if not data.db_type:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Either connection_id or db_type must be provided"
+        )
+    if data.db_type == "sqlite" and not ALLOW_SQLITE_TARGETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="SQLite targets are disabled on this server"
+        )
+
+    return {
+        "db_type": data.db_type,
+        "host": data.host,
+        "port": data.port,
+        "database": data.database,
+        "username": data.username,
+        "password": data.password,
+    }, None, None
+
+
+async def _run_controlled(executor, request: Request, control: QueryControl, fn, *args, force: bool = False):
+    """
+    Run blocking query work on `executor`, cancelling the statement when it
+    outlives its timeout or when the HTTP client disconnects.
+    """
+    task = asyncio.ensure_future(executor.run(fn, *args, force=force))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                break
+            if control.expired or await request.is_disconnected():
+                # Give the connection back to the pool instead of waiting out an abandoned query
+                await run_in_threadpool(control.cancel)
+                break
+        return await task
+    except Exception as e:
+        if control.expired:
+            raise QueryTimeout(f"Query exceeded its {control.timeout_ms} ms timeout") from e
+        raise
+
+
+def _timed_partitions(result, labels, timings: QueryTimings):
+    """Yield row batches, recording the time spent fetching them and the row count."""
+    partitions = result.partitions(STREAM_BATCH_SIZE)
+    rows = 0
+    fetching = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            batch = next(partitions, None)
+            fetching += time.perf_counter() - started
+            if batch is None:
+                return
+            rows += len(batch)
+            yield batch
+    finally:
+        DB_FETCH_SECONDS.observe(fetching, *labels)
+        DB_ROWS.inc(rows, *labels)
+        timings.add("fetch", fetching * 1000)
+        timings.rows = rows
+
+
+def _stream_rows(conn, trans, result, fmt: str, control: QueryControl, labels, timings: QueryTimings, on_complete):
+    """Yield encoded row batches, releasing the connection when done."""
+    try:
+        yield from encode_batches(
+            fmt, list(result.keys()), _timed_partitions(result, labels, timings),
+            decimal_scales(result.cursor.description)
+        )
+        trans.commit()
+    finally:
+        result.close()
+        if trans.is_active:
+            trans.rollback()
+        control.detach(conn)
+        conn.close()
+        if on_complete is not None:
+            on_complete()
+
+
+def _log_if_slow(owner: str, target: dict, query: str, timings: QueryTimings) -> None:
+    """Add a finished query to the slow-query log when it crossed the threshold (blocking)."""
+    # Time spent fetching a profiled query's plan is not the query's own
+    duration_ms = timings.total_ms - timings.phases.get("plan", 0.0)
+    if not slow_query_log.is_slow(duration_ms):
+        return
+    try:
+        slow_query_log.record(
+            owner, target["db_type"], target.get("connection_id"), query, duration_ms, timings.phases, timings.rows
+        )
+    except SQLAlchemyError:
+        # The log is best effort; never fail or hold up the query because of it
+        pass
+
+
+def _execute_query(
+    target: dict,
+    statement,
+    params=None,
+    control: QueryControl = None,
+    timings: QueryTimings = None
+) -> dict:
+    """Run a query to completion and build the JSON response (blocking)."""
+    db_type = target["db_type"]
+    labels = query_labels(db_type, target.get("connection_id"))
+    control = control or QueryControl()
+    timings = timings or QueryTimings()
+    timings.start()
+    with timings.phase("connect"):
+        conn = connect(target)
+    try:
         # Use begin() to handle transactions properly
         with conn.begin():
-            result = conn.execute(text(data.query))
-            
+            control.attach(conn)
+            with DB_EXECUTE_SECONDS.time(*labels), timings.phase("execute"):
+                result = conn.execute(statement, params)
+
+            if isinstance(params, list):
+                # executemany: one statement, many parameter sets
+                return {
+                    "status": "success",
+                    "db_type": db_type,
+                    "rows_affected": result.rowcount,
+                    "message": f"Query executed for {len(params)} parameter sets"
+                }
+
             # Fetch results
             if result.returns_rows:
-                rows = [dict(row._mapping) for row in result]
+                with DB_FETCH_SECONDS.time(*labels), timings.phase("fetch"):
+                    rows = [dict(row._mapping) for row in result]
+                DB_ROWS.inc(len(rows), *labels)
+                timings.rows = len(rows)
                 return {
                     "status": "success",
                     "db_type": db_type,
@@ -86,7 +235,447 @@ async def run_query(
                     "db_type": db_type,
                     "message": "Query executed successfully"
                 }
-            
+    finally:
+        control.detach(conn)
+        conn.close()
+
+
+def _open_stream(
+    target: dict,
+    statement,
+    params,
+    fmt: str,
+    control: QueryControl,
+    timings: QueryTimings,
+    on_complete=None
+):
+    """
+    Execute a query with a server-side cursor (blocking).
+
+    Returns a generator of encoded batches that owns the connection, or a
+    JSON response dict when the statement returns no rows. `on_complete`
+    is called once the stream has finished and released its connection.
+    """
+    labels = query_labels(target["db_type"], target.get("connection_id"))
+    timings.start()
+    with timings.phase("connect"):
+        conn = connect(target)
+    try:
+        trans = conn.begin()
+        control.attach(conn)
+        with DB_EXECUTE_SECONDS.time(*labels), timings.phase("execute"):
+            result = conn.execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE).execute(
+                statement, params
+            )
+        if result.returns_rows:
+            # The generator now owns the connection and closes it when done
+            stream = _stream_rows(conn, trans, result, fmt, control, labels, timings, on_complete)
+            conn = None
+            return stream
+        trans.commit()
+        return {
+            "status": "success",
+            "db_type": target["db_type"],
+            "message": "Query executed successfully"
+        }
+    finally:
+        if conn:
+            control.detach(conn)
+            conn.close()
+
+
+def _explain(target: dict, query: str, params, analyze: bool, control: QueryControl):
+    """Fetch the plan for a query on its own connection, rolling back afterwards (blocking)."""
+    conn = connect(target)
+    try:
+        trans = conn.begin()
+        try:
+            control.attach(conn)
+            return explain_plan(conn, query, params, analyze)
+        finally:
+            trans.rollback()
+    finally:
+        control.detach(conn)
+        conn.close()
+
+
+async def _profiled_response(
+    response: dict,
+    data: DBRequest,
+    target: dict,
+    executor,
+    request: Request,
+    control: QueryControl,
+    timings: QueryTimings
+) -> Response:
+    """
+    Add the plan and timing breakdown to a query response.
+
+    The response is serialized here, once, so the time it takes is part of
+    the breakdown.
+    """
+    plan, analyzed, plan_error = None, False, None
+    try:
+        with timings.phase("plan"):
+            plan, analyzed = await _run_controlled(
+                executor, request, control, _explain, target, data.query, data.params, data.explain_analyze, control
+            )
+    except ExecutorSaturated as e:
+        # The result is still worth returning without a plan
+        plan_error = f"Query capacity exhausted: {str(e)}"
+    except (SQLAlchemyError, ValueError, QueryTimeout) as e:
+        plan_error = str(e)
+
+    with timings.phase("serialize"):
+        body = json.dumps(
+            response, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=json_default
+        )
+    profile = json.dumps(
+        profile_section(timings, plan, analyzed, statement_fingerprint(data.query), plan_error),
+        ensure_ascii=False, separators=(",", ":"), default=json_default
+    )
+    return Response(f'{body[:-1]},"profile":{profile}}}', media_type="application/json")
+
+
+def _open_cursor(
+    target: dict, statement, params, owner: str, engine_key, fingerprint: str, control: QueryControl
+) -> HeldCursor:
+    """Open a server-side cursor to be held between page requests (blocking)."""
+    conn = connect(target)
+    try:
+        trans = conn.begin()
+        control.attach(conn)
+        try:
+            with DB_EXECUTE_SECONDS.time(*query_labels(target["db_type"], target.get("connection_id"))):
+                result = conn.execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE).execute(
+                    statement, params
+                )
+        finally:
+            # Each page request attaches its own control while it reads
+            control.detach(conn)
+        if not result.returns_rows:
+            raise ValueError("Pagination requires a statement that returns rows")
+        cursor = HeldCursor(owner, engine_key, fingerprint, conn, trans, result, list(result.keys()), [])
+        conn = None
+        return cursor
+    finally:
+        if conn:
+            conn.close()
+
+
+def _row_value(row: dict, key: str):
+    """Look up the keyset column, tolerating dialects that change name case."""
+    if key in row:
+        return row[key]
+    for column, value in row.items():
+        if column.lower() == key.lower():
+            return value
+    raise ValueError(f"order_key column '{key}' is not in the result set")
+
+
+async def _paginate(
+    data: DBRequest,
+    target: dict,
+    target_key,
+    executor,
+    current_user: str,
+    request: Request,
+    control: QueryControl
+) -> dict:
+    """Return one page of results plus the token for the next page."""
+    page_size = data.page_size or DEFAULT_PAGE_SIZE
+    fingerprint = query_fingerprint(
+        target_key, data.query, [data.params, data.order_key, data.descending]
+    )
+    token = decode_page_token(data.page_token, fingerprint) if data.page_token else None
+
+    if data.order_key:
+        # Keyset mode: constant-time pages via WHERE key > last_seen
+        key = validate_key_column(data.order_key)
+        wrapped = keyset_query(
+            data.query, target["db_type"], key, data.descending, token is not None, page_size + 1
+        )
+        statement, params = prepare_statement(wrapped, data.params)
+        params = dict(params or {})
+        if token is not None:
+            params["page_after"] = token["v"]
+        response = await _run_controlled(
+            executor, request, control, _execute_query, target, statement, params, control
+        )
+        rows = response.get("data", [])
+        has_more = len(rows) > page_size
+        next_token = None
+        if has_more:
+            last = _row_value(rows[page_size - 1], key)
+            # The next page starts after `last`, so rows sharing it would be skipped
+            if last is None or last == _row_value(rows[page_size], key):
+                raise ValueError(
+                    f"order_key column '{key}' has duplicate or NULL values at a page boundary; "
+                    "page by a unique, non-null column or leave order_key out to use a held cursor"
+                )
+            next_token = encode_page_token({"m": "k", "f": fingerprint, "v": last})
+        rows = rows[:page_size]
+    else:
+        # Cursor mode: continue reading a server-side cursor held between requests
+        cursor_id = None
+        if token is not None:
+            cursor_id = token["c"]
+            cursor = cursor_registry.take(cursor_id, current_user)
+            if cursor is None:
+                raise HTTPException(
+                    status_code=status.HTTP_410_GONE,
+                    detail="Page token expired or already in use"
+                )
+        else:
+            try:
+                cursor_registry.reserve(current_user, target_key)
+            except CursorLimitReached as e:
+                # One user's cursors must not use up a connection's pool or the whole registry
+                raise HTTPException(
+                    status_code=(
+                        status.HTTP_429_TOO_MANY_REQUESTS if e.reason == "user"
+                        else status.HTTP_503_SERVICE_UNAVAILABLE
+                    ),
+                    detail=f"{e}; page with order_key instead to avoid holding a cursor",
+                    headers={"Retry-After": "5"}
+                )
+            statement, params = prepare_statement(data.query, data.params)
+            try:
+                cursor = await _run_controlled(
+                    executor, request, control, _open_cursor, target, statement, params, current_user, target_key,
+                    fingerprint, control
+                )
+            except BaseException:
+                cursor_registry.unreserve(current_user, target_key)
+                raise
+        try:
+            rows, has_more = await _run_controlled(
+                executor, request, control, cursor.fetch_page, page_size, control, force=True
+            )
+        except Exception:
+            await executor.run(cursor_registry.close, cursor, force=True)
+            raise
+        DB_ROWS.inc(len(rows), *query_labels(target["db_type"], target.get("connection_id")))
+        next_token = None
+        if has_more:
+            cursor_id = cursor_registry.put(cursor, cursor_id)
+            next_token = encode_page_token({"m": "c", "f": fingerprint, "c": cursor_id})
+        else:
+            await executor.run(cursor_registry.close, cursor, force=True)
+
+    return {
+        "status": "success",
+        "db_type": target["db_type"],
+        "rows_affected": len(rows),
+        "data": rows,
+        "next_page_token": next_token
+    }
+
+
+@router.post("/query")
+async def run_query(
+    data: DBRequest,
+    request: Request,
+    result_format: Optional[str] = Query(
+        None,
+        alias="format",
+        pattern="^(json|ndjson|csv|arrow|msgpack)$",
+        description="Response format. ndjson, csv, arrow and msgpack stream rows in batches."
+    ),
+    current_user: str = Depends(get_current_user),  # Protected endpoint - requires authentication
+    db: Session = Depends(get_db)
+):
+    """
+    Execute a SQL query on the specified database.
+
+    Requires JWT authentication. Supports Oracle, PostgreSQL, and MySQL.
+    Can use stored connection by ID or provide connection parameters directly.
+
+    Pass `?format=ndjson|csv|arrow|msgpack` (or the matching Accept header)
+    to stream rows in batches from a server-side cursor instead of one JSON
+    document. arrow (IPC stream) and msgpack are column-oriented.
+
+    Queries run on a bounded per-database-type executor, so slow upstream
+    databases never block the event loop.
+
+    Bind values through `params` instead of inlining literals; a list of
+    parameter sets runs the statement as an executemany.
+
+    `timeout_ms` (or the stored connection's timeout_ms) applies a native
+    statement timeout, and the statement is cancelled if the client
+    disconnects before it finishes.
+
+    Set `page_size` to page through results; pass the returned
+    `next_page_token` back to get the next page.
+
+    Set `cache_ttl` to serve repeated read-only queries from an in-process
+    result cache; the response's `cached` field says whether it was a hit.
+
+    On a stored connection with replicas, read-only statements go to a
+    healthy replica and everything else to the primary; set `use_primary`
+    to read from the primary.
+
+    Each user and each connection can run a limited number of queries at
+    once; extra queries wait their turn (users are served round-robin)
+    and get 429 with Retry-After when the queue is full or the wait
+    times out.
+
+    Set `profile` to get a `profile` section with the time spent queueing,
+    connecting, executing, fetching and serializing, plus the database's
+    plan for the statement (`explain_analyze` measures it). Queries slower
+    than SLOW_QUERY_THRESHOLD_MS are added to the slow-query log.
+    """
+    timings = QueryTimings()
+    log_query = False
+    wrote_connection = False
+    ticket = None
+    fmt = negotiate_format(result_format, request.headers.get("accept"))
+    if not format_available(fmt):
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail=f"The {fmt} format is not available on this server"
+        )
+    try:
+        target, connection_timeout_ms, stored_conn = _resolve_target(data, current_user, db)
+        # Lets the metrics middleware attribute the response bytes to this target
+        setattr(request.state, QUERY_LABELS_STATE, query_labels(target["db_type"], target.get("connection_id")))
+        executor = get_query_executor(target["db_type"])
+
+        try:
+            statement, params = prepare_statement(data.query, data.params)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        executemany = isinstance(params, list)
+        target_key = make_engine_key(**target)
+        read_only = is_read_only(data.query) and not executemany
+        # Set once the statement has run, so failed or rejected writes don't pin reads to the primary
+        writes_connection = stored_conn is not None and not read_only
+        if stored_conn is not None and read_only and not data.use_primary:
+            # Balanced across the connection's replicas, if it has any
+            target = replica_router.read_target(stored_conn, data.query, current_user)
+
+        if data.profile and (executemany or fmt in STREAM_FORMATS or data.page_size or data.page_token):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="profile works with single-statement JSON queries only"
+            )
+        if data.explain_analyze and not read_only:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="explain_analyze runs the statement again, so it is only allowed for read-only queries"
+            )
+
+        paged = bool(data.page_size or data.page_token)
+        use_cache = bool(data.cache_ttl) and read_only and not data.profile and not paged and fmt not in STREAM_FORMATS
+        if use_cache:
+            # Cache hits never wait for admission
+            cache_key = result_cache.make_key(target_key, data.query, params)
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                return {**cached, "cached": True}
+
+        ticket = await query_scheduler.acquire(current_user, target_key)
+        # The statement timeout starts once the query is admitted
+        control = QueryControl(
+            effective_timeout(data.timeout_ms, connection_timeout_ms, DEFAULT_QUERY_TIMEOUT_MS)
+        )
+
+        if paged:
+            if executemany or fmt in STREAM_FORMATS:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Pagination works with single-statement JSON queries only"
+                )
+            try:
+                page = await _paginate(data, target, target_key, executor, current_user, request, control)
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            wrote_connection = writes_connection
+            return page
+
+        if fmt in STREAM_FORMATS:
+            if executemany:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Streaming formats do not support a list of parameter sets"
+                )
+            if not read_only:
+                result_cache.invalidate_target(target_key)
+            stream_ticket = ticket
+
+            def finish_stream():
+                # The stream keeps its admission slot until it has sent its last row
+                query_scheduler.release(stream_ticket)
+                _log_if_slow(current_user, target, data.query, timings)
+
+            stream = await _run_controlled(
+                executor, request, control, _open_stream, target, statement, params, fmt, control, timings,
+                finish_stream
+            )
+            wrote_connection = writes_connection
+            if isinstance(stream, dict):
+                log_query = True
+                return stream
+            # Also freed if the response is dropped before the stream ever starts
+            weakref.finalize(stream, query_scheduler.release, stream_ticket)
+            ticket = None
+            return StreamingResponse(
+                iterate_in_executor(executor, stream),
+                media_type=MEDIA_TYPES[fmt]
+            )
+
+        log_query = True
+        if use_cache:
+            generation = result_cache.generation(target_key)
+            response = await _run_controlled(
+                executor, request, control, _execute_query, target, statement, params, control, timings
+            )
+            if "data" in response:
+                await executor.run(
+                    result_cache.put, cache_key, response, data.cache_ttl, generation, force=True
+                )
+            return {**response, "cached": False}
+
+        if read_only:
+            response = await _run_controlled(
+                executor, request, control, _execute_query, target, statement, params, control, timings
+            )
+        else:
+            # Writes (and anything we can't prove is a read) drop cached results,
+            # again afterwards so reads that overlapped the write are not kept
+            result_cache.invalidate_target(target_key)
+            try:
+                response = await _run_controlled(
+                    executor, request, control, _execute_query, target, statement, params, control, timings
+                )
+            finally:
+                result_cache.invalidate_target(target_key)
+            wrote_connection = writes_connection
+        if data.cache_ttl:
+            response["cached"] = False
+        if data.profile:
+            return await _profiled_response(response, data, target, executor, request, control, timings)
+        return response
+
+    except HTTPException:
+        raise
+    except QueryTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "5" if e.reason == "timeout" else "1"}
+        )
+    except ExecutorSaturated as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Query capacity exhausted: {str(e)}",
+            headers={"Retry-After": "1"}
+        )
     except ConnectionError as e:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -103,5 +692,206 @@ async def run_query(
             detail=f"Unexpected error: {str(e)}"
         )
     finally:
-        if conn:
-            conn.close()
+        if ticket is not None:
+            query_scheduler.release(ticket)
+        if wrote_connection:
+            # This user's next reads go to the primary so they see the write
+            replica_router.note_write(current_user, data.connection_id)
+        # Streams are logged when they finish; failed and timed-out queries are logged too
+        if log_query and slow_query_log.is_slow(timings.total_ms):
+            await run_in_threadpool(_log_if_slow, current_user, target, data.query, timings)
+
+
+def _shard_error(e: Exception) -> str:
+    """Describe a shard's failure the way /db/query reports it."""
+    if isinstance(e, (QueryTimeout, ValueError, AdmissionRejected)):
+        return str(e)
+    if isinstance(e, ExecutorSaturated):
+        return f"Query capacity exhausted: {str(e)}"
+    if isinstance(e, ConnectionError):
+        return f"Database connection error: {str(e)}"
+    if isinstance(e, SQLAlchemyError):
+        return f"SQL error: {str(e)}"
+    return f"Unexpected error: {str(e)}"
+
+
+async def _fanout_shard(
+    shard: ShardCursor,
+    statement,
+    params,
+    semaphore: asyncio.Semaphore,
+    queue: asyncio.Queue,
+    ordered: bool,
+    owner: str,
+    query: str,
+    request: Request
+) -> None:
+    """
+    Run the query on one shard and feed its batches to `queue`, ending with None.
+
+    Each shard is admitted like a /db/query call on its connection, and
+    holds its admission slot for as long as it holds its concurrency slot.
+    """
+    executor = get_query_executor(shard.target["db_type"])
+    held = True
+    ticket = None
+    await semaphore.acquire()
+    try:
+        ticket = await query_scheduler.acquire(
+            owner, make_engine_key(shard.target["db_type"], connection_id=shard.connection_id)
+        )
+        shard.start()
+        await _run_controlled(executor, request, shard.control, shard.open, statement, params)
+        while True:
+            batch = await executor.run(shard.fetch, force=True)
+            if ordered and held:
+                # The merge needs every shard's cursor open, so only execution is capped
+                semaphore.release()
+                query_scheduler.release(ticket)
+                held = False
+            if batch is None:
+                break
+            await queue.put(batch)
+    except asyncio.CancelledError:
+        if shard.control is not None:
+            await run_in_threadpool(shard.control.cancel)
+        raise
+    except Exception as e:
+        shard.error = _shard_error(e)
+    finally:
+        if held:
+            semaphore.release()
+        if ticket is not None:
+            query_scheduler.release(ticket)
+        await executor.run(shard.close, force=True)
+        shard.elapsed_ms = shard.timings.total_ms
+    if slow_query_log.is_slow(shard.timings.total_ms):
+        await run_in_threadpool(_log_if_slow, owner, shard.target, query, shard.timings)
+    await queue.put(None)
+
+
+async def _fanout_stream(shards, statement, params, data: FanOutRequest, owner: str, request: Request):
+    """Stream the shards' rows as NDJSON, then one `_summary` line with per-shard results."""
+    runnable = [shard for shard in shards if shard.error is None]
+    ordered = data.order_key is not None
+    concurrency = data.max_concurrency or FANOUT_MAX_CONCURRENCY
+    semaphore = asyncio.Semaphore(concurrency)
+    if ordered:
+        queues = [asyncio.Queue(FANOUT_QUEUE_BATCHES) for _ in runnable]
+    else:
+        # Unordered rows go out in arrival order through one shared queue
+        queues = [asyncio.Queue(FANOUT_QUEUE_BATCHES * concurrency)] * len(runnable)
+    tasks = [
+        asyncio.ensure_future(
+            _fanout_shard(shard, statement, params, semaphore, queue, ordered, owner, data.query, request)
+        )
+        for shard, queue in zip(runnable, queues)
+    ]
+    try:
+        if ordered:
+            async for chunk in merge_ordered(queues, data.descending):
+                yield chunk
+        else:
+            remaining = len(runnable)
+            while remaining:
+                batch = await queues[0].get()
+                if batch is None:
+                    remaining -= 1
+                    continue
+                yield b"".join(batch[1])
+
+        summaries = [shard.summary() for shard in shards]
+        summary = {
+            "rows": sum(entry["rows"] for entry in summaries),
+            "failed": sum(1 for entry in summaries if entry["status"] == "error"),
+            "shards": summaries,
+        }
+        yield (json.dumps({"_summary": summary}) + "\n").encode("utf-8")
+    finally:
+        # Stops the remaining shards when the client goes away
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@router.post("/fanout")
+async def run_fanout_query(
+    data: FanOutRequest,
+    request: Request,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Run one read-only query on several stored connections (shards) at once.
+
+    Rows stream back as NDJSON, each with a `_connection_id` field naming
+    its shard. By default rows are sent as they arrive. Set `order_key`
+    to get one stream ordered by that column: each shard sorts its own
+    rows and the streams are merged.
+
+    At most `max_concurrency` shards run their statement at the same time.
+    A shard that fails does not stop the others. The last line is a
+    `_summary` object with the status, row count, time and any error of
+    every shard.
+    """
+    if not is_read_only(data.query):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Fan-out runs read-only statements only"
+        )
+    try:
+        query = data.query
+        if data.order_key:
+            query = ordered_query(query, validate_key_column(data.order_key), data.descending)
+        statement, params = prepare_statement(query, data.params)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if isinstance(params, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Fan-out does not support a list of parameter sets"
+        )
+
+    shards = []
+    for connection_id in dict.fromkeys(data.connection_ids):
+        stored_conn = connection_cache.get(db, connection_id, current_user)
+        if not stored_conn:
+            shards.append(ShardCursor(connection_id, None, error="Database connection not found"))
+            continue
+        shards.append(ShardCursor(
+            connection_id,
+            replica_router.read_target(stored_conn, data.query, current_user),
+            effective_timeout(data.timeout_ms, stored_conn.timeout_ms, DEFAULT_QUERY_TIMEOUT_MS),
+            data.order_key
+        ))
+
+    return StreamingResponse(
+        _fanout_stream(shards, statement, params, data, current_user, request),
+        media_type=MEDIA_TYPES["ndjson"]
+    )
+
+
+@router.get("/slow-queries")
+async def list_slow_queries(
+    limit: int = Query(20, ge=1, le=500),
+    connection_id: Optional[int] = Query(None, description="Only statements run on this stored connection"),
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Your slowest statements, grouped by normalized statement and connection,
+    ordered by total time spent.
+    """
+    return await run_in_threadpool(slow_query_log.top, db, current_user, limit, connection_id)
+
+
+@router.get("/admission")
+async def get_admission_stats(current_user: str = Depends(get_current_user)):
+    """Running and queued queries, the oldest wait, and your own share of them."""
+    return query_scheduler.stats(current_user)
+
+
+@router.get("/executors")
+async def get_executor_stats(current_user: str = Depends(get_current_user)):
+    """Queue depth and throughput counters for the per-database-type query executors."""
+    return query_executor_stats()
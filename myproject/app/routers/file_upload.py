@@ -1,34 +1,216 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+import hashlib
+import secrets
 import shutil
 import os
+import threading
+import time
 from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
 from myproject.app.auth import get_current_user
+from myproject.app.blob_store import (
+    hash_file,
+    is_valid_digest,
+    resolve_upload,
+    store_upload,
+)
+from myproject.app.core.config import (
+    CHUNK_SIZE,
+    MAX_FILE_SIZE,
+    UPLOAD_DIR,
+    UPLOAD_SESSION_TTL_SECONDS,
+    UPLOAD_SESSIONS_MAX_BYTES_PER_USER,
+    UPLOAD_SESSIONS_MAX_PER_USER,
+)
+from myproject.app.downloads import (
+    FileRangeResponse,
+    RangeNotSatisfiable,
+    etag_matches,
+    file_headers,
+    guess_media_type,
+    if_range_matches,
+    make_etag,
+    parse_range,
+)
+from myproject.app.metrics import record_upload
+from myproject.app.models import SessionLocal, UploadChunk, UploadSession, get_db
+from myproject.app.schemas.upload_schema import UploadCheck, UploadSessionCreate, UploadSessionResponse
 
 router = APIRouter(prefix="/upload", tags=["File Upload"])
 
 # Configuration
-UPLOAD_DIR = Path("uploads")
-MAX_FILE_SIZE = 10 * 1024 * 1024 * 1024  # 10GB default limit
-CHUNK_SIZE = 1024 * 1024  # 1MB chunks for efficient streaming
+PARTIAL_DIR = UPLOAD_DIR / ".partial"  # In-progress files, moved into the blob store when complete
+FSYNC_INTERVAL_BYTES = 64 * 1024 * 1024  # fsync cadence for fsync=interval
+
+
+def safe_filename(filename: str) -> str:
+    """Strip path separators and spaces from a client-supplied filename."""
+    return filename.replace(" ", "_").replace("/", "_").replace("\\", "_")
+
+
+def _file_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large. Maximum size is {MAX_FILE_SIZE / (1024**3):.2f} GB"
+    )
+
+
+def _write_all(fd: int, data, hasher=None) -> None:
+    """Write a whole buffer, looping over short writes; optionally feed it to a hash (blocking)."""
+    if hasher is not None:
+        hasher.update(data)
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _pwrite_all(fd: int, data: bytes, offset: int) -> int:
+    """Write a whole buffer at `offset`, looping over short writes; returns its length (blocking)."""
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+    return len(data)
+
+
+async def _stream_to_file(
+    chunks: AsyncIterator[bytes],
+    path: Path,
+    fsync: str = "none",
+    hasher=None
+) -> int:
+    """
+    Write an async stream of chunks to `path` without blocking the event loop.
+    
+    Pieces are coalesced into CHUNK_SIZE writes that run in the threadpool.
+    `fsync` is "none" (leave it to the OS), "end" (fsync once when done) or
+    "interval" (also fsync every FSYNC_INTERVAL_BYTES). If a `hasher` is
+    given it is updated with each buffer in the same threadpool call as the
+    write, so the digest is ready without reading the file back.
+    """
+    fd = await run_in_threadpool(os.open, path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    total_size = 0
+    unsynced = 0
+    buffer = bytearray()
+    try:
+        async for piece in chunks:
+            total_size += len(piece)
+            if total_size > MAX_FILE_SIZE:
+                raise _file_too_large()
+            buffer.extend(piece)
+            if len(buffer) >= CHUNK_SIZE:
+                await run_in_threadpool(_write_all, fd, buffer, hasher)
+                unsynced += len(buffer)
+                buffer.clear()
+                if fsync == "interval" and unsynced >= FSYNC_INTERVAL_BYTES:
+                    await run_in_threadpool(os.fsync, fd)
+                    unsynced = 0
+        if buffer:
+            await run_in_threadpool(_write_all, fd, buffer, hasher)
+        if fsync != "none":
+            await run_in_threadpool(os.fsync, fd)
+    finally:
+        await run_in_threadpool(os.close, fd)
+    return total_size
+
+
+async def _read_upload(file: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _temp_path(prefix: str) -> Path:
+    PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+    return PARTIAL_DIR / f"{prefix}-{secrets.token_hex(8)}"
+
+
+def _discard(path: Path) -> None:
+    if path.exists():
+        path.unlink()
+
+
+async def _store_upload(
+    temp_location: Optional[Path],
+    sha256: str,
+    size: int,
+    stored_name: str,
+    current_user: str,
+    db: Session
+) -> Optional[dict]:
+    """
+    Move a finished upload into the blob store and point the user's filename at it.
+    
+    Without a `temp_location` only the index changes, and None is returned
+    if the blob is not stored.
+    """
+    stored = await run_in_threadpool(store_upload, db, temp_location, current_user, stored_name, sha256, size)
+    if stored is None:
+        return None
+    blob_location, deduplicated = stored
+    return {
+        "message": "File uploaded successfully",
+        "filename": stored_name,
+        "file_path": str(blob_location),
+        "size_mb": round(size / (1024 * 1024), 2),
+        "sha256": sha256,
+        "deduplicated": deduplicated,
+        "uploaded_by": current_user
+    }
+
+
+async def save_upload_file(file: UploadFile, stored_name: str, current_user: str, db: Session) -> dict:
+    """Stream a multipart upload into the blob store under `stored_name`, hashing as it goes."""
+    temp_location = _temp_path("upload")
+    hasher = hashlib.sha256()
+    started = time.perf_counter()
+    
+    try:
+        # Stream file in chunks for memory efficiency; disk writes and hashing run off the event loop
+        # (the size is also checked during upload, in case Content-Length wasn't available)
+        total_size = await _stream_to_file(_read_upload(file), temp_location, hasher=hasher)
+        response = await _store_upload(
+            temp_location, hasher.hexdigest(), total_size, stored_name, current_user, db
+        )
+        record_upload("multipart", total_size, time.perf_counter() - started)
+        return response
+        
+    except HTTPException:
+        # Clean up partial file
+        _discard(temp_location)
+        raise
+    except Exception as e:
+        # Clean up partial file on error
+        _discard(temp_location)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error uploading file: {str(e)}"
+        )
 
 
 @router.post("/bigfile")
 async def upload_big_file(
     file: UploadFile = File(...),
-    current_user: str = Depends(get_current_user)  # Protected endpoint - requires authentication
+    current_user: str = Depends(get_current_user),  # Protected endpoint - requires authentication
+    db: Session = Depends(get_db)
 ):
     """
     Upload large files efficiently using streaming.
     
     Features:
     - Handles large files efficiently using chunked streaming
-    - Creates uploads directory if it doesn't exist
+    - Computes the SHA-256 while streaming and stores the content once per hash
     - Validates file size
     - Requires JWT authentication
     """
-    # Create uploads directory if it doesn't exist
-    UPLOAD_DIR.mkdir(exist_ok=True)
-    
     # Validate file size (if Content-Length is provided)
     if hasattr(file, 'size') and file.size:
         if file.size > MAX_FILE_SIZE:
@@ -37,49 +219,441 @@ async def upload_big_file(
                 detail=f"File too large. Maximum size is {MAX_FILE_SIZE / (1024**3):.2f} GB"
             )
     
-    # Generate safe file path
-    safe_filename = file.filename.replace(" ", "_").replace("/", "_").replace("\\", "_")
-    file_location = UPLOAD_DIR / safe_filename
+    return await save_upload_file(file, safe_filename(file.filename), current_user, db)
+
+
+@router.post("/raw")
+async def upload_raw(
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255, description="Name to store the file under"),
+    fsync: str = Query("end", pattern="^(none|end|interval)$", description="Durability policy for the written file"),
+    x_content_sha256: Optional[str] = Header(None, description="Hex SHA-256 of the body; skips the transfer if one of your files has this content"),
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload a file sent as the raw request body.
+    
+    Unlike /upload/bigfile there is no multipart parsing and no temporary
+    spool file: the body is streamed straight to disk with threadpool-offloaded
+    writes, so every byte hits the disk once and other requests keep running.
+    
+    With an `X-Content-SHA256` header the body is never read when one of
+    the user's files already has that content (send `Expect: 100-continue`
+    to avoid transmitting it at all); otherwise the received bytes must
+    match it.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_FILE_SIZE:
+        raise _file_too_large()
     
+    stored_name = safe_filename(filename)
+    expected = x_content_sha256.lower() if x_content_sha256 else None
+    if expected is not None and not is_valid_digest(expected):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="X-Content-SHA256 must be a hex SHA-256 digest"
+        )
+    if expected is not None and content_length and content_length.isdigit():
+        response = await _store_upload(None, expected, int(content_length), stored_name, current_user, db)
+        if response is not None:
+            return response
+    
+    temp_location = _temp_path("raw")
+    hasher = hashlib.sha256()
+    started = time.perf_counter()
     try:
-        # Stream file in chunks for memory efficiency
-        with open(file_location, "wb") as buffer:
-            total_size = 0
-            while True:
-                chunk = await file.read(CHUNK_SIZE)
-                if not chunk:
-                    break
-                total_size += len(chunk)
-                
-                # Check size during upload (if Content-Length wasn't available)
-                if total_size > MAX_FILE_SIZE:
-                    # Clean up partial file
-                    if file_location.exists():
-                        file_location.unlink()
-                    raise HTTPException(
-                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                        detail=f"File too large. Maximum size is {MAX_FILE_SIZE / (1024**3):.2f} GB"
-                    )
-                
-                buffer.write(chunk)
-        
-        file_size_mb = total_size / (1024 * 1024)
-        
-        return {
-            "message": "File uploaded successfully",
-            "filename": safe_filename,
-            "file_path": str(file_location),
-            "size_mb": round(file_size_mb, 2),
-            "uploaded_by": current_user
-        }
-        
+        total_size = await _stream_to_file(request.stream(), temp_location, fsync, hasher)
+        record_upload("raw", total_size, time.perf_counter() - started)
+        sha256 = hasher.hexdigest()
+        if expected is not None and sha256 != expected:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Content hash mismatch: received {sha256}"
+            )
+        return await _store_upload(temp_location, sha256, total_size, stored_name, current_user, db)
     except HTTPException:
+        _discard(temp_location)
         raise
     except Exception as e:
-        # Clean up partial file on error
-        if file_location.exists():
-            file_location.unlink()
+        _discard(temp_location)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error uploading file: {str(e)}"
         )
+
+
+@router.post("/check")
+async def check_upload(
+    check: UploadCheck,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Store a file by content hash without sending it, if the user already has that content.
+    
+    When one of the user's files has this SHA-256 and size, `filename` is
+    linked to its blob and `exists` is true; otherwise upload the file
+    normally. Content only other users stored is never linked by hash.
+    """
+    sha256 = check.sha256.lower()
+    stored_name = safe_filename(check.filename)
+    result = await _store_upload(None, sha256, check.size, stored_name, current_user, db)
+    if result is None:
+        return {"exists": False, "filename": stored_name, "sha256": sha256}
+    return {"exists": True, **result}
+
+
+@router.api_route("/files/{filename}", methods=["GET", "HEAD"])
+async def download_file(
+    filename: str,
+    request: Request,
+    download: bool = Query(False, description="Send as an attachment instead of inline"),
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Download a file you uploaded.
+    
+    Supports single and multiple byte ranges (so media is seekable),
+    If-None-Match and If-Range. The ETag is the content SHA-256. Bytes are
+    sent with zero-copy sendfile when the server supports it.
+    """
+    resolved = resolve_upload(db, current_user, safe_filename(filename))
+    if resolved is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    path, sha256, record = resolved
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    
+    stored_name = record.filename
+    etag = make_etag(sha256, stat_result)
+    headers = file_headers(stored_name, etag, stat_result, "attachment" if download else "inline")
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    ranges = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range_matches(if_range, etag, stat_result)):
+        try:
+            ranges = parse_range(range_header, stat_result.st_size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "content-range": f"bytes */{stat_result.st_size}"}
+            )
+    
+    return FileRangeResponse(path, stat_result.st_size, headers, guess_media_type(stored_name), ranges)
+
+
+def _partial_path(session_id: str) -> Path:
+    return PARTIAL_DIR / session_id
+
+
+def _preallocate(path: Path, length: int) -> None:
+    """Create a file of `length` bytes up front so chunks can be written in place (blocking)."""
+    PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, length)
+        else:
+            os.ftruncate(fd, length)
+    finally:
+        os.close(fd)
+
+
+def expire_upload_sessions() -> int:
+    """
+    Remove sessions without a new chunk for UPLOAD_SESSION_TTL_SECONDS,
+    with their partial files, and partial files left without a session (blocking).
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS)
+    db = SessionLocal()
+    try:
+        stale = db.query(UploadSession).filter(
+            func.coalesce(UploadSession.updated_at, UploadSession.created_at) < cutoff
+        ).all()
+        for upload in stale:
+            if upload.status == "open":
+                _discard(_partial_path(upload.id))
+            db.query(UploadChunk).filter(UploadChunk.session_id == upload.id).delete()
+            db.delete(upload)
+        db.commit()
+        open_ids = {session_id for (session_id,) in db.query(UploadSession.id).filter(UploadSession.status == "open")}
+    finally:
+        db.close()
+    if PARTIAL_DIR.is_dir():
+        cutoff_ts = time.time() - UPLOAD_SESSION_TTL_SECONDS
+        for path in PARTIAL_DIR.iterdir():
+            if path.name not in open_ids and path.stat().st_mtime < cutoff_ts:
+                _discard(path)
+    return len(stale)
+
+
+_session_reaper: Optional[threading.Thread] = None
+_session_reaper_lock = threading.Lock()
+
+
+def _ensure_session_reaper() -> None:
+    global _session_reaper
+    if _session_reaper is not None:
+        return
+    with _session_reaper_lock:
+        if _session_reaper is not None:
+            return
+        _session_reaper = threading.Thread(target=_reap_sessions_forever, name="upload-session-reaper", daemon=True)
+        _session_reaper.start()
+
+
+def _reap_sessions_forever() -> None:
+    while True:
+        try:
+            expire_upload_sessions()
+        except Exception:
+            pass
+        time.sleep(min(600.0, UPLOAD_SESSION_TTL_SECONDS / 4))
+
+
+def _merge_ranges(chunks: List[UploadChunk]) -> List[Tuple[int, int]]:
+    """Merge received chunks into sorted, non-overlapping [start, end) ranges."""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted((chunk.offset, chunk.offset + chunk.length) for chunk in chunks):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _session_state(upload: UploadSession, db: Session) -> UploadSessionResponse:
+    chunks = db.query(UploadChunk).filter(UploadChunk.session_id == upload.id).all()
+    ranges = _merge_ranges(chunks)
+    missing = []
+    position = 0
+    for start, end in ranges:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < upload.length:
+        missing.append([position, upload.length])
+    return UploadSessionResponse(
+        id=upload.id,
+        filename=upload.filename,
+        length=upload.length,
+        status=upload.status,
+        offset=ranges[0][1] if ranges and ranges[0][0] == 0 else 0,
+        received_bytes=sum(end - start for start, end in ranges),
+        missing_ranges=missing,
+        created_at=upload.created_at,
+        completed_at=upload.completed_at
+    )
+
+
+def _get_session(session_id: str, current_user: str, db: Session) -> UploadSession:
+    upload = db.query(UploadSession).filter(
+        UploadSession.id == session_id,
+        UploadSession.created_by == current_user
+    ).first()
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found"
+        )
+    return upload
+
+
+@router.post("/sessions", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    session_data: UploadSessionCreate,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Start a resumable upload.
+    
+    The file is preallocated on disk; chunks are then sent with
+    PUT /upload/sessions/{id} at any offset, in any order and in parallel.
+    Each user can have UPLOAD_SESSIONS_MAX_PER_USER sessions open, reserving
+    at most UPLOAD_SESSIONS_MAX_BYTES_PER_USER; sessions without a new chunk
+    for UPLOAD_SESSION_TTL_SECONDS are removed.
+    """
+    if session_data.length > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size is {MAX_FILE_SIZE / (1024**3):.2f} GB"
+        )
+    _ensure_session_reaper()
+    open_sessions, reserved = db.query(
+        func.count(UploadSession.id), func.coalesce(func.sum(UploadSession.length), 0)
+    ).filter(
+        UploadSession.created_by == current_user,
+        UploadSession.status == "open"
+    ).one()
+    if open_sessions >= UPLOAD_SESSIONS_MAX_PER_USER:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"At most {UPLOAD_SESSIONS_MAX_PER_USER} upload sessions can be open per user"
+        )
+    if reserved + session_data.length > UPLOAD_SESSIONS_MAX_BYTES_PER_USER:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=(
+                f"Open upload sessions can reserve at most "
+                f"{UPLOAD_SESSIONS_MAX_BYTES_PER_USER / (1024**3):.2f} GB per user"
+            )
+        )
+    
+    upload = UploadSession(
+        id=secrets.token_hex(16),
+        filename=safe_filename(session_data.filename),
+        length=session_data.length,
+        status="open",
+        created_by=current_user
+    )
+    await run_in_threadpool(_preallocate, _partial_path(upload.id), upload.length)
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+    
+    return _session_state(upload, db)
+
+
+@router.put("/sessions/{session_id}", response_model=UploadSessionResponse)
+async def upload_session_chunk(
+    session_id: str,
+    request: Request,
+    response: Response,
+    offset: Optional[int] = Query(None, ge=0, description="Byte offset of this chunk"),
+    upload_offset: Optional[int] = Header(None, ge=0, description="tus-style alternative to ?offset="),
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Write one chunk of a resumable upload at the given byte offset.
+    
+    The raw request body is the chunk. Chunks are written with positional
+    writes into the preallocated file, so they may arrive out of order or
+    concurrently. If the connection drops, the bytes that made it are kept.
+    """
+    upload = _get_session(session_id, current_user, db)
+    if upload.status != "open":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload session is already completed"
+        )
+    start = offset if offset is not None else upload_offset
+    if start is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Chunk offset is required (?offset= or Upload-Offset header)"
+        )
+    if start >= upload.length:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Chunk offset is beyond the end of the upload"
+        )
+    
+    written = 0
+    buffer = bytearray()
+    fd = await run_in_threadpool(os.open, _partial_path(upload.id), os.O_WRONLY)
+    try:
+        async for piece in request.stream():
+            if start + written + len(buffer) + len(piece) > upload.length:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="Chunk extends past the declared upload length"
+                )
+            buffer.extend(piece)
+            if len(buffer) >= CHUNK_SIZE:
+                written += await run_in_threadpool(_pwrite_all, fd, bytes(buffer), start + written)
+                buffer.clear()
+        if buffer:
+            written += await run_in_threadpool(_pwrite_all, fd, bytes(buffer), start + written)
+    finally:
+        await run_in_threadpool(os.close, fd)
+        # Record whatever reached the disk so an interrupted chunk can be resumed
+        if written:
+            db.add(UploadChunk(session_id=upload.id, offset=start, length=written))
+            upload.updated_at = datetime.utcnow()
+            db.commit()
+    
+    state = _session_state(upload, db)
+    response.headers["Upload-Offset"] = str(state.offset)
+    return state
+
+
+@router.api_route("/sessions/{session_id}", methods=["GET", "HEAD"], response_model=UploadSessionResponse)
+async def get_upload_session(
+    session_id: str,
+    response: Response,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Current offset, received bytes and missing ranges of a resumable upload."""
+    upload = _get_session(session_id, current_user, db)
+    state = _session_state(upload, db)
+    response.headers["Upload-Offset"] = str(state.offset)
+    response.headers["Upload-Length"] = str(state.length)
+    return state
+
+
+@router.post("/sessions/{session_id}/complete")
+async def complete_upload_session(
+    session_id: str,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Finalize a resumable upload once every byte has been received."""
+    upload = _get_session(session_id, current_user, db)
+    if upload.status != "open":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload session is already completed"
+        )
+    state = _session_state(upload, db)
+    if state.missing_ranges:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Upload is incomplete", "missing_ranges": state.missing_ranges}
+        )
+    
+    # Chunks may have arrived in any order, so this is the one path that hashes by reading back
+    partial = _partial_path(upload.id)
+    sha256 = await run_in_threadpool(hash_file, partial)
+    result = await _store_upload(partial, sha256, upload.length, upload.filename, current_user, db)
+    upload.status = "completed"
+    upload.completed_at = datetime.utcnow()
+    db.query(UploadChunk).filter(UploadChunk.session_id == upload.id).delete()
+    db.commit()
+    
+    return result
+
+
+@router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload_session(
+    session_id: str,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Abort a resumable upload and discard the bytes received so far."""
+    upload = _get_session(session_id, current_user, db)
+    partial = _partial_path(upload.id)
+    if upload.status == "open" and partial.exists():
+        await run_in_threadpool(partial.unlink)
+    db.query(UploadChunk).filter(UploadChunk.session_id == upload.id).delete()
+    db.delete(upload)
+    db.commit()
+    
+    return None
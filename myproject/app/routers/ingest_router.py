@@ -0,0 +1,106 @@
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from pathlib import Path
+from sqlalchemy.orm import Session
+from typing import Optional
+from myproject.app.auth import get_current_user
+from myproject.app.blob_store import resolve_upload
+from myproject.app.connection_cache import connection_cache
+from myproject.app.core.config import INGEST_BATCH_SIZE
+from myproject.app.executors import ExecutorSaturated
+from myproject.app.ingest import (
+    IngestProgress,
+    ingest_executor,
+    ingest_registry,
+    run_ingest,
+    validate_table_name,
+)
+from myproject.app.models import get_db
+from myproject.app.replicas import replica_router
+from myproject.app.routers.file_upload import safe_filename, save_upload_file
+
+router = APIRouter(prefix="/ingest", tags=["Bulk Ingestion"])
+
+
+@router.post("", status_code=status.HTTP_202_ACCEPTED)
+async def create_ingest(
+    connection_id: int = Form(..., description="ID of the stored database connection to load into"),
+    table: str = Form(..., description="Target table, optionally schema-qualified"),
+    file_format: str = Form("csv", alias="format", pattern="^(csv|ndjson)$"),
+    has_header: bool = Form(True, description="CSV only: first line holds column names"),
+    columns: Optional[str] = Form(None, description="Comma-separated column names (overrides the header)"),
+    batch_size: int = Form(INGEST_BATCH_SIZE, ge=1, le=100000),
+    filename: Optional[str] = Form(None, description="File previously uploaded by this user"),
+    file: Optional[UploadFile] = File(None),
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Bulk-load a CSV or NDJSON file into a table of a stored connection.
+
+    The file is either uploaded with the request or named from the user's
+    previous uploads. Loading runs in the background using the fastest path for the
+    target (COPY on PostgreSQL, multi-row INSERT on MySQL, array-bound
+    executemany elsewhere) while streaming the file, so memory stays flat.
+    Poll GET /ingest/{id} for progress and rows/sec.
+    """
+    try:
+        validate_table_name(table)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    stored_conn = connection_cache.get(db, connection_id, current_user)
+    if not stored_conn:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Database connection not found"
+        )
+
+    if file is not None:
+        # Uploaded files go through the same content-addressed store as /upload
+        source_name = safe_filename(file.filename)
+        stored = await save_upload_file(file, source_name, current_user, db)
+        path = Path(stored["file_path"])
+    elif filename:
+        source_name = safe_filename(filename)
+        resolved = resolve_upload(db, current_user, source_name)
+        if resolved is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="File not found"
+            )
+        path = resolved[0]
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Either file or filename must be provided"
+        )
+
+    target = stored_conn.to_target()
+    column_list = [name.strip() for name in columns.split(",") if name.strip()] if columns else None
+    progress = IngestProgress(current_user, connection_id, table, source_name, path.stat().st_size)
+
+    try:
+        ingest_executor.submit(
+            run_ingest, progress, target, path, file_format, has_header, column_list, batch_size
+        )
+    except ExecutorSaturated as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Ingestion capacity exhausted: {str(e)}",
+            headers={"Retry-After": "5"}
+        )
+    ingest_registry.add(progress)
+    replica_router.note_write(current_user, connection_id)
+    return progress.to_dict()
+
+
+@router.get("/{ingest_id}")
+async def get_ingest(ingest_id: str, current_user: str = Depends(get_current_user)):
+    """Progress of a bulk load: rows loaded, bytes read and rows/sec."""
+    progress = ingest_registry.get(ingest_id, current_user)
+    if progress is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ingestion not found"
+        )
+    return progress.to_dict()
@@ -0,0 +1,29 @@
+import hmac
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from myproject.app.core.config import METRICS_TOKEN
+from myproject.app.metrics import render
+
+router = APIRouter(tags=["Monitoring"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """
+    Prometheus metrics: per-route latency and in-flight requests, query
+    connect/execute/fetch times, rows and bytes per target, pool and
+    executor usage, upload throughput and bcrypt queue wait.
+
+    Scrapers authenticate with `Authorization: Bearer <METRICS_TOKEN>`
+    when METRICS_TOKEN is set; user JWTs are not accepted here.
+    """
+    if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return PlainTextResponse(render(), media_type=PROMETHEUS_CONTENT_TYPE)
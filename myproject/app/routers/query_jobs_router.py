@@ -0,0 +1,209 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from myproject.app.auth import get_current_user
+from myproject.app.connection_cache import connection_cache
+from myproject.app.core.config import DEFAULT_QUERY_TIMEOUT_MS
+from myproject.app.database import make_engine_key
+from myproject.app.downloads import (
+    FileRangeResponse,
+    RangeNotSatisfiable,
+    file_headers,
+    if_range_matches,
+    make_etag,
+    parse_range,
+)
+from myproject.app.executors import ExecutorSaturated
+from myproject.app.models import get_db
+from myproject.app.query_cache import is_read_only
+from myproject.app.query_control import effective_timeout
+from myproject.app.replicas import replica_router
+from myproject.app.query_jobs import (
+    JOB_MEDIA_TYPES,
+    JobLimitReached,
+    QueryJob,
+    query_job_executor,
+    query_job_registry,
+    read_page,
+    run_query_job,
+)
+from myproject.app.result_formats import format_available
+from myproject.app.schemas.db_schema import QueryJobCreate
+from myproject.app.statements import prepare_statement
+
+router = APIRouter(prefix="/db/jobs", tags=["Query Jobs"])
+
+
+async def _get_job(job_id: str, current_user: str) -> QueryJob:
+    job = await run_in_threadpool(query_job_registry.get, job_id, current_user)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Query job not found"
+        )
+    return job
+
+
+async def _completed_job(job_id: str, current_user: str) -> QueryJob:
+    job = await _get_job(job_id, current_user)
+    if job.status != "completed":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Query job is {job.status}"
+        )
+    return job
+
+
+@router.post("", status_code=status.HTTP_202_ACCEPTED)
+async def submit_query_job(
+    data: QueryJobCreate,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Run a long read-only query in the background.
+
+    Returns immediately with the job id. Poll GET /db/jobs/{id} until the
+    status is `completed`, then read rows with GET /db/jobs/{id}/rows or
+    download the spooled file from GET /db/jobs/{id}/result. Rows are
+    written to an NDJSON or Parquet file as they are fetched, so memory
+    stays flat however large the result is.
+    """
+    if not format_available(data.format):
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail=f"The {data.format} format is not available on this server"
+        )
+    if not is_read_only(data.query):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Query jobs run read-only statements only"
+        )
+    try:
+        statement, params = prepare_statement(data.query, data.params)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if isinstance(params, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Query jobs do not support a list of parameter sets"
+        )
+
+    stored_conn = connection_cache.get(db, data.connection_id, current_user)
+    if not stored_conn:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Database connection not found"
+        )
+
+    job = QueryJob(
+        current_user, data.connection_id, data.query, data.format,
+        effective_timeout(data.timeout_ms, stored_conn.timeout_ms, DEFAULT_QUERY_TIMEOUT_MS)
+    )
+    try:
+        await run_in_threadpool(query_job_registry.add, job)
+    except JobLimitReached as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "10"}
+        )
+    try:
+        query_job_executor.submit(
+            run_query_job, job, replica_router.read_target(stored_conn, data.query, current_user), statement, params,
+            make_engine_key(**stored_conn.to_target())
+        )
+    except ExecutorSaturated as e:
+        await run_in_threadpool(query_job_registry.remove, job.id)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Query job capacity exhausted: {str(e)}",
+            headers={"Retry-After": "10"}
+        )
+    return job.to_dict()
+
+
+@router.get("")
+async def list_query_jobs(current_user: str = Depends(get_current_user)):
+    """Your query jobs that have not expired yet."""
+    return [job.to_dict() for job in await run_in_threadpool(query_job_registry.list, current_user)]
+
+
+@router.get("/{job_id}")
+async def get_query_job(job_id: str, current_user: str = Depends(get_current_user)):
+    """Status of a query job: rows and bytes spooled so far, elapsed time and any error."""
+    return (await _get_job(job_id, current_user)).to_dict()
+
+
+@router.get("/{job_id}/rows")
+async def get_query_job_rows(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    current_user: str = Depends(get_current_user)
+):
+    """A page of a completed job's rows; pass `next_offset` back for the next page."""
+    job = await _completed_job(job_id, current_user)
+    try:
+        rows = await run_in_threadpool(read_page, job, offset, limit)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Query job result has expired"
+        )
+    next_offset = offset + len(rows)
+    return {
+        "id": job.id,
+        "columns": job.columns,
+        "offset": offset,
+        "rows": rows,
+        "total_rows": job.rows,
+        "next_offset": next_offset if next_offset < job.rows else None,
+    }
+
+
+@router.api_route("/{job_id}/result", methods=["GET", "HEAD"])
+async def download_query_job_result(
+    job_id: str,
+    request: Request,
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Download a completed job's spooled result file (NDJSON or Parquet).
+
+    Supports byte ranges, so interrupted downloads can be resumed.
+    """
+    job = await _completed_job(job_id, current_user)
+    try:
+        stat_result = await run_in_threadpool(os.stat, job.path)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Query job result has expired"
+        )
+
+    etag = make_etag(None, stat_result)
+    headers = file_headers(job.path.name, etag, stat_result, "attachment")
+    ranges = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range_matches(if_range, etag, stat_result)):
+        try:
+            ranges = parse_range(range_header, stat_result.st_size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "content-range": f"bytes */{stat_result.st_size}"}
+            )
+    return FileRangeResponse(job.path, stat_result.st_size, headers, JOB_MEDIA_TYPES[job.format], ranges)
+
+
+@router.delete("/{job_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_query_job(job_id: str, current_user: str = Depends(get_current_user)):
+    """Cancel a queued or running job, or delete a finished job's result."""
+    job = await _get_job(job_id, current_user)
+    await run_in_threadpool(query_job_registry.cancel, job)
+    if job.finished:
+        await run_in_threadpool(query_job_registry.remove, job.id)
+    return None
@@ -1,10 +1,23 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Any, Dict, List, Optional, Union
+from myproject.app.core.config import (
+    FANOUT_MAX_CONCURRENCY,
+    FANOUT_MAX_CONNECTIONS,
+    MAX_PAGE_SIZE,
+    QUERY_CACHE_MAX_TTL_SECONDS,
+)
 
 
 class DBRequest(BaseModel):
     """Schema for database query request with validation."""
     query: str = Field(..., min_length=1, description="SQL query to execute")
+    params: Optional[Union[Dict[str, Any], List[Any]]] = Field(
+        None,
+        description=(
+            "Bind parameters: a dict for :named placeholders, a list of values for ? placeholders, "
+            "or a list of dicts/lists to run the statement once per row (executemany)"
+        )
+    )
     
     # Option 1: Use stored connection by ID
     connection_id: Optional[int] = Field(None, description="ID of stored database connection")
@@ -12,8 +25,11 @@ class DBRequest(BaseModel):
     # Option 2: Provide connection details directly (if connection_id not provided)
     db_type: Optional[str] = Field(
         None,
-        pattern="^(oracle|postgres|mysql)$",
-        description="Database type: oracle, postgres, or mysql (required if connection_id not provided)"
+        pattern="^(oracle|postgres|mysql|sqlite)$",
+        description=(
+            "Database type: oracle, postgres, or mysql (required if connection_id not provided); "
+            "sqlite when ALLOW_SQLITE_TARGETS is enabled"
+        )
     )
     host: Optional[str] = Field(None, description="Database host")
     port: Optional[int] = Field(None, description="Database port")
@@ -21,6 +37,40 @@ class DBRequest(BaseModel):
     username: Optional[str] = Field(None, description="Database username")
     password: Optional[str] = Field(None, description="Database password")
     
+    timeout_ms: Optional[int] = Field(
+        None,
+        gt=0,
+        description="Statement timeout; capped by the stored connection's timeout_ms"
+    )
+    use_primary: bool = Field(
+        False,
+        description="Run a read-only query on the stored connection's primary even when it has replicas"
+    )
+    
+    # Opt-in result cache for read-only queries
+    cache_ttl: Optional[int] = Field(
+        None,
+        ge=1,
+        le=QUERY_CACHE_MAX_TTL_SECONDS,
+        description="Cache the result of a read-only query for this many seconds"
+    )
+    
+    # Pagination: pass page_size for the first page, then echo next_page_token
+    page_size: Optional[int] = Field(None, ge=1, le=MAX_PAGE_SIZE, description="Rows per page")
+    page_token: Optional[str] = Field(None, description="next_page_token from the previous page")
+    order_key: Optional[str] = Field(
+        None,
+        description="Unique, non-null column for keyset pagination (a held server-side cursor is used otherwise)"
+    )
+    descending: bool = Field(False, description="Page through order_key in descending order")
+    
+    # Diagnostics: timing breakdown and the database's plan in a "profile" section
+    profile: bool = Field(False, description="Return per-phase timings and the query plan with the result")
+    explain_analyze: bool = Field(
+        False,
+        description="With profile, measure the plan with EXPLAIN ANALYZE (PostgreSQL, MySQL); runs a read-only query twice"
+    )
+    
     class Config:
         json_schema_extra = {
             "example": {
@@ -33,3 +83,61 @@ class DBRequest(BaseModel):
                 "password": "pass"
             }
         }
+
+
+class FanOutRequest(BaseModel):
+    """Schema for running one read-only query on several stored connections."""
+    connection_ids: List[int] = Field(
+        ...,
+        min_length=1,
+        max_length=FANOUT_MAX_CONNECTIONS,
+        description="Stored connections (shards) to run the query on"
+    )
+    query: str = Field(..., min_length=1, description="Read-only SQL query to run on every shard")
+    params: Optional[Union[Dict[str, Any], List[Any]]] = Field(
+        None,
+        description="Bind parameters: a dict for :named placeholders or a list of values for ? placeholders"
+    )
+    order_key: Optional[str] = Field(
+        None,
+        description="Merge the shards' rows in order of this column (each shard sorts by it, NULLs last)"
+    )
+    descending: bool = Field(False, description="Merge in descending order of order_key")
+    max_concurrency: Optional[int] = Field(
+        None,
+        ge=1,
+        le=FANOUT_MAX_CONCURRENCY,
+        description="Shards queried at the same time"
+    )
+    timeout_ms: Optional[int] = Field(
+        None,
+        gt=0,
+        description="Statement timeout per shard; capped by each stored connection's timeout_ms"
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "connection_ids": [1, 2, 3],
+                "query": "SELECT id, created_at, total FROM orders WHERE created_at >= :since",
+                "params": {"since": "2024-01-01"},
+                "order_key": "created_at",
+                "descending": True
+            }
+        }
+
+
+class QueryJobCreate(BaseModel):
+    """Schema for submitting a background query job."""
+    connection_id: int = Field(..., description="ID of the stored database connection to query")
+    query: str = Field(..., min_length=1, description="Read-only SQL query to run")
+    params: Optional[Union[Dict[str, Any], List[Any]]] = Field(
+        None,
+        description="Bind parameters: a dict for :named placeholders or a list of values for ? placeholders"
+    )
+    format: str = Field("ndjson", pattern="^(ndjson|parquet)$", description="Format of the spooled result file")
+    timeout_ms: Optional[int] = Field(
+        None,
+        gt=0,
+        description="Statement timeout, counted from when the job starts; capped by the stored connection's timeout_ms"
+    )
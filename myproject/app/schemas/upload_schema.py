@@ -0,0 +1,46 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+
+class UploadSessionCreate(BaseModel):
+    """Schema for starting a resumable upload."""
+    filename: str = Field(..., min_length=1, max_length=255, description="Name to store the file under")
+    length: int = Field(..., gt=0, description="Total file size in bytes")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "filename": "dataset.csv",
+                "length": 10737418240
+            }
+        }
+
+
+class UploadSessionResponse(BaseModel):
+    """Schema for resumable upload session state."""
+    id: str
+    filename: str
+    length: int
+    status: str
+    offset: int = Field(..., description="Bytes received contiguously from the start of the file")
+    received_bytes: int
+    missing_ranges: List[List[int]] = Field(..., description="[start, end) byte ranges still to upload")
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+
+class UploadCheck(BaseModel):
+    """Schema for announcing a file by content hash before sending it."""
+    filename: str = Field(..., min_length=1, max_length=255, description="Name to store the file under")
+    sha256: str = Field(..., pattern="^[0-9a-fA-F]{64}$", description="Hex SHA-256 of the file content")
+    size: int = Field(..., ge=0, description="File size in bytes")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "filename": "dataset.csv",
+                "sha256": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08",
+                "size": 10737418240
+            }
+        }
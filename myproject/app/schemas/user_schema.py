@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -27,6 +27,12 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
+class ReplicaEndpoint(BaseModel):
+    """A read replica of a stored connection; database and credentials are the primary's."""
+    host: str = Field(..., min_length=1, description="Replica host")
+    port: int = Field(..., gt=0, le=65535, description="Replica port")
+
+
 class DatabaseConnectionCreate(BaseModel):
     """Schema for creating a database connection."""
     name: str = Field(..., min_length=1, max_length=100, description="Connection name")
@@ -36,6 +42,10 @@ class DatabaseConnectionCreate(BaseModel):
     database: str = Field(..., description="Database name")
     username: str = Field(..., description="Database username")
     password: str = Field(..., description="Database password")
+    timeout_ms: Optional[int] = Field(None, gt=0, description="Statement timeout for queries on this connection")
+    replicas: Optional[List[ReplicaEndpoint]] = Field(
+        None, description="Read replicas that read-only queries are balanced across"
+    )
     
     class Config:
         json_schema_extra = {
@@ -60,6 +70,8 @@ class DatabaseConnectionResponse(BaseModel):
     port: int
     database: str
     username: str
+    timeout_ms: Optional[int] = None
+    replicas: Optional[List[ReplicaEndpoint]] = None
     created_by: str
     created_at: datetime
     
@@ -75,4 +87,6 @@ class DatabaseConnectionUpdate(BaseModel):
     database: Optional[str] = None
     username: Optional[str] = None
     password: Optional[str] = None
+    timeout_ms: Optional[int] = Field(None, gt=0)
+    replicas: Optional[List[ReplicaEndpoint]] = None
 
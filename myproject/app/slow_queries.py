@@ -0,0 +1,118 @@
+import hashlib
+import re
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from myproject.app.core.config import SLOW_QUERY_LOG_SIZE, SLOW_QUERY_THRESHOLD_MS
+from myproject.app.models import SessionLocal, SlowQuery
+from myproject.app.query_cache import normalize_query
+
+# Quoted identifiers are kept; string/number literals and bind markers become ?
+_LITERAL_RE = re.compile(
+    r"(\"(?:[^\"]|\"\")*\")|'(?:[^']|'')*'|(?<![\w$])\d+(?:\.\d+)?(?![\w$])|(?<!:):\w+|\?|%s"
+)
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+# Phase columns stored with each entry, in QueryTimings names
+_PHASES = ("queue", "connect", "execute", "fetch", "serialize")
+
+
+def normalize_statement(query: str) -> str:
+    """Replace literals and bind markers with ? and collapse IN lists, so similar statements group."""
+    replaced = _LITERAL_RE.sub(lambda m: m.group(1) or "?", normalize_query(query))
+    return _IN_LIST_RE.sub("(?)", replaced)
+
+
+def statement_fingerprint(query: str) -> str:
+    return hashlib.sha256(normalize_statement(query).lower().encode("utf-8")).hexdigest()[:16]
+
+
+class SlowQueryLog:
+    """
+    Threshold-based log of slow queries in the metadata store.
+
+    Only the newest `max_entries` rows are kept (older ones are deleted on
+    insert), and statements are stored normalized so literal values never
+    reach the log. `top` aggregates the kept rows per statement fingerprint
+    and connection.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS, max_entries: int = SLOW_QUERY_LOG_SIZE):
+        self.threshold_ms = threshold_ms
+        self.max_entries = max_entries
+
+    def is_slow(self, duration_ms: float) -> bool:
+        return duration_ms >= self.threshold_ms
+
+    def record(
+        self,
+        owner: str,
+        db_type: str,
+        connection_id: Optional[int],
+        query: str,
+        duration_ms: float,
+        phases: Dict[str, float],
+        rows: Optional[int] = None
+    ) -> None:
+        """Store one slow query and trim the ring (blocking)."""
+        db = SessionLocal()
+        try:
+            db.add(SlowQuery(
+                fingerprint=statement_fingerprint(query),
+                statement=normalize_statement(query),
+                db_type=db_type,
+                connection_id=connection_id,
+                created_by=owner,
+                duration_ms=duration_ms,
+                rows=rows,
+                **{f"{phase}_ms": phases.get(phase) for phase in _PHASES}
+            ))
+            db.flush()
+            newest = db.query(func.max(SlowQuery.id)).scalar()
+            db.query(SlowQuery).filter(SlowQuery.id <= newest - self.max_entries).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def top(self, db: Session, owner: str, limit: int = 20, connection_id: Optional[int] = None) -> List[dict]:
+        """A user's slow statements grouped by fingerprint and connection, by total time."""
+        total = func.sum(SlowQuery.duration_ms)
+        query = db.query(
+            SlowQuery.fingerprint,
+            SlowQuery.connection_id,
+            SlowQuery.db_type,
+            func.max(SlowQuery.statement),
+            func.count(),
+            total,
+            func.max(SlowQuery.duration_ms),
+            func.max(SlowQuery.created_at),
+            func.avg(SlowQuery.rows),
+            *(func.avg(getattr(SlowQuery, f"{phase}_ms")) for phase in _PHASES)
+        ).filter(SlowQuery.created_by == owner)
+        if connection_id is not None:
+            query = query.filter(SlowQuery.connection_id == connection_id)
+        rows = query.group_by(
+            SlowQuery.fingerprint, SlowQuery.connection_id, SlowQuery.db_type
+        ).order_by(total.desc()).limit(limit).all()
+
+        offenders = []
+        for fingerprint, conn_id, db_type, statement, count, total_ms, max_ms, last_seen, avg_rows, *phases in rows:
+            offenders.append({
+                "fingerprint": fingerprint,
+                "connection_id": conn_id,
+                "db_type": db_type,
+                "statement": statement,
+                "count": count,
+                "total_ms": round(total_ms, 3),
+                "avg_ms": round(total_ms / count, 3),
+                "max_ms": round(max_ms, 3),
+                "avg_rows": round(avg_rows, 1) if avg_rows is not None else None,
+                "avg_phases_ms": {
+                    phase: round(value, 3) for phase, value in zip(_PHASES, phases) if value is not None
+                },
+                "last_seen": last_seen,
+            })
+        return offenders
+
+
+slow_query_log = SlowQueryLog()
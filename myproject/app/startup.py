@@ -0,0 +1,69 @@
+import asyncio
+import importlib
+import re
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# Seconds spent in each startup step of this process, in the order they ran
+startup_timings: Dict[str, float] = {}
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+\d+\s+\|\s*(\S+)")
+
+
+@contextmanager
+def startup_step(name: str):
+    """Time one step of the lifespan startup."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - started
+
+
+def measure_imports(module: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Import `module` in a fresh interpreter with `-X importtime`.
+
+    Returns the total import time and the time spent importing each
+    top-level package (its modules' own time, so nothing is counted twice),
+    slowest first.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    per_package: Dict[str, float] = {}
+    total = 0.0
+    for line in completed.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match is None:
+            continue
+        seconds = int(match.group(1)) / 1e6
+        package = match.group(2).split(".")[0]
+        total += seconds
+        per_package[package] = per_package.get(package, 0.0) + seconds
+    return total, sorted(per_package.items(), key=lambda item: item[1], reverse=True)
+
+
+def profile_startup(module: str = "myproject.app.main", top: int = 15) -> None:
+    """Print cold import time per package and the time of each lifespan startup step."""
+    total, packages = measure_imports(module)
+    print(f"Import of {module}: {total * 1000:.1f} ms")
+    for package, seconds in packages[:top]:
+        print(f"  {package:<32} {seconds * 1000:>8.1f} ms")
+
+    app = importlib.import_module(module).app
+
+    async def _run_lifespan():
+        async with app.router.lifespan_context(app):
+            pass
+
+    asyncio.run(_run_lifespan())
+    print(f"Startup: {sum(startup_timings.values()) * 1000:.1f} ms")
+    for name, seconds in startup_timings.items():
+        print(f"  {name:<32} {seconds * 1000:>8.1f} ms")
@@ -0,0 +1,82 @@
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+from myproject.app.core.config import STATEMENT_CACHE_SIZE
+
+# Positional `?` placeholders outside quoted literals/identifiers
+_PLACEHOLDER_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|\?")
+
+Params = Union[Dict[str, Any], List[Any]]
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def compile_statement(query: str, positional: bool = False) -> Tuple[TextClause, Tuple[str, ...]]:
+    """
+    Build (and cache) the TextClause for a query.
+
+    Positional `?` placeholders are rewritten to named binds `:p1, :p2, ...`;
+    the generated names are returned alongside the clause.
+    """
+    if not positional:
+        return text(query), ()
+
+    names: List[str] = []
+
+    def _replace(match):
+        if match.group(1):
+            return match.group(1)
+        names.append(f"p{len(names) + 1}")
+        return f":{names[-1]}"
+
+    return text(_PLACEHOLDER_RE.sub(_replace, query)), tuple(names)
+
+
+def subquery_text(query: str) -> str:
+    """
+    A query's text for embedding as `FROM (<text>\n) alias`.
+
+    The query is kept as written, apart from surrounding whitespace and a
+    trailing semicolon, so a `--` comment still ends at its own newline.
+    Callers put a newline before the closing parenthesis, so a trailing
+    comment can't swallow it.
+    """
+    return query.strip().rstrip(";").rstrip()
+
+
+def _bind_positional(names: Tuple[str, ...], values: List[Any]) -> Dict[str, Any]:
+    if len(values) != len(names):
+        raise ValueError(f"Query has {len(names)} positional parameters but {len(values)} were given")
+    return dict(zip(names, values))
+
+
+def prepare_statement(query: str, params: Optional[Params] = None):
+    """
+    Resolve a query and its parameters into a cached statement.
+
+    Returns `(statement, bind_params)` where `bind_params` is None, a dict
+    for a single execution, or a list of dicts for an executemany.
+    """
+    if params is None or isinstance(params, dict):
+        statement, _ = compile_statement(query)
+        return statement, params
+
+    if params and all(isinstance(item, dict) for item in params):
+        statement, _ = compile_statement(query)
+        return statement, list(params)
+
+    if params and all(isinstance(item, (list, tuple)) for item in params):
+        statement, names = compile_statement(query, True)
+        return statement, [_bind_positional(names, list(item)) for item in params]
+
+    if any(isinstance(item, (dict, list, tuple)) for item in params):
+        raise ValueError("params must be a dict, a list of values, or a list of rows")
+
+    statement, names = compile_statement(query, True)
+    return statement, _bind_positional(names, params)
+
+
+def statement_cache_stats() -> dict:
+    info = compile_statement.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
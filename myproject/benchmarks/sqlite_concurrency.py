@@ -0,0 +1,168 @@
+"""
+Concurrency benchmark for the SQLite metadata store.
+
+Runs the same mixed workload (connection lookups by owner/name and by
+owner/ID, listings, and connection creates/updates) from many threads
+against two fresh databases:
+
+- baseline: SQLite defaults as the app used before (rollback journal,
+  synchronous=FULL, no composite indexes)
+- tuned: the settings from app/core/config.py (WAL, synchronous=NORMAL,
+  busy_timeout, mmap) with the composite indexes
+
+Usage (from the repository root):
+
+    python -m myproject.benchmarks.sqlite_concurrency --threads 16 --seconds 10
+"""
+import argparse
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from sqlalchemy import create_engine, event, text
+from myproject.app.core.config import (
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_SYNCHRONOUS,
+)
+from myproject.app.models import Base
+
+OWNERS = 50
+CONNECTIONS_PER_OWNER = 40
+
+
+def make_engine(path: Path, tuned: bool):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={
+            "check_same_thread": False,
+            # sqlite3's own default; the baseline relied on it implicitly
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000 if tuned else 5.0,
+        }
+    )
+
+    @event.listens_for(engine, "connect")
+    def _pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if tuned:
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+            cursor.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}")
+        else:
+            cursor.execute("PRAGMA journal_mode=DELETE")
+            cursor.execute("PRAGMA synchronous=FULL")
+        cursor.close()
+
+    Base.metadata.create_all(bind=engine)
+    if not tuned:
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX IF EXISTS ix_database_connections_owner_name")
+            conn.exec_driver_sql("DROP INDEX IF EXISTS ix_database_connections_owner_id")
+    return engine
+
+
+def seed(engine) -> None:
+    rows = [
+        {
+            "name": f"conn-{i}", "db_type": "postgres", "host": "localhost", "port": 5432,
+            "database": "db", "username": "u", "password": "p", "created_by": f"user-{owner}",
+        }
+        for owner in range(OWNERS)
+        for i in range(CONNECTIONS_PER_OWNER)
+    ]
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO database_connections (name, db_type, host, port, database, username, password, created_by) "
+            "VALUES (:name, :db_type, :host, :port, :database, :username, :password, :created_by)"
+        ), rows)
+
+
+def worker(engine, deadline: float, write_ratio: float, results: dict, lock: threading.Lock) -> None:
+    rng = random.Random()
+    latencies = []
+    ops = errors = 0
+    while time.monotonic() < deadline:
+        owner = f"user-{rng.randrange(OWNERS)}"
+        started = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                roll = rng.random()
+                if roll < write_ratio / 2:
+                    conn.execute(text(
+                        "INSERT INTO database_connections (name, db_type, host, port, database, username, password, created_by) "
+                        "VALUES (:name, 'postgres', 'localhost', 5432, 'db', 'u', 'p', :owner)"
+                    ), {"name": f"new-{rng.getrandbits(48)}", "owner": owner})
+                elif roll < write_ratio:
+                    conn.execute(text(
+                        "UPDATE database_connections SET host = :host WHERE created_by = :owner AND name = :name"
+                    ), {"host": f"h{rng.randrange(100)}", "owner": owner, "name": f"conn-{rng.randrange(CONNECTIONS_PER_OWNER)}"})
+                elif roll < 0.6:
+                    conn.execute(text(
+                        "SELECT * FROM database_connections WHERE created_by = :owner AND name = :name"
+                    ), {"owner": owner, "name": f"conn-{rng.randrange(CONNECTIONS_PER_OWNER)}"}).fetchall()
+                elif roll < 0.85:
+                    conn.execute(text(
+                        "SELECT * FROM database_connections WHERE id = :id AND created_by = :owner"
+                    ), {"id": rng.randrange(1, OWNERS * CONNECTIONS_PER_OWNER), "owner": owner}).fetchall()
+                else:
+                    conn.execute(text(
+                        "SELECT * FROM database_connections WHERE created_by = :owner ORDER BY id"
+                    ), {"owner": owner}).fetchall()
+            ops += 1
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            if isinstance(getattr(e, "orig", None), sqlite3.OperationalError):
+                errors += 1
+            else:
+                raise
+    with lock:
+        results["ops"] += ops
+        results["errors"] += errors
+        results["latencies"].extend(latencies)
+
+
+def run(label: str, tuned: bool, threads: int, seconds: float, write_ratio: float) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(Path(tmp) / "bench.db", tuned)
+        seed(engine)
+        results = {"ops": 0, "errors": 0, "latencies": []}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+        pool = [
+            threading.Thread(target=worker, args=(engine, deadline, write_ratio, results, lock))
+            for _ in range(threads)
+        ]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        engine.dispose()
+
+    latencies = sorted(results["latencies"]) or [0.0]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{label:<9} {results['ops'] / seconds:>10.0f} ops/s  "
+        f"p50 {statistics.median(latencies) * 1000:>7.2f} ms  "
+        f"p99 {p99 * 1000:>8.2f} ms  "
+        f"locked errors {results['errors']}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="Share of operations that write")
+    args = parser.parse_args()
+    print(f"{args.threads} threads, {args.seconds:g}s, {args.write_ratio:.0%} writes")
+    run("baseline", False, args.threads, args.seconds, args.write_ratio)
+    run("tuned", True, args.threads, args.seconds, args.write_ratio)
+
+
+if __name__ == "__main__":
+    main()